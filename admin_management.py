@@ -2,20 +2,31 @@
 # Funciones administrativas exclusivas para el rol Admin
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     ContextTypes, ConversationHandler, CallbackQueryHandler,
     MessageHandler, filters
 )
-import db_adapter as db
+import db_manager
+import db_metrics
+import pdf_worker
+import report_cache
+import report_jobs
+import photo_store
+import image_pipeline
+import photo_maintenance
+from db_async import AsyncDB
 from bot_navigation import end_and_return_to_menu
 
+db = AsyncDB(db_manager)
+
 # Estados de conversación
 ADMIN_MENU, CONFIRM_RESET, VIEW_STATS = range(3)
 
 async def admin_management_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Menú principal de administración (solo para Admin)"""
     user = update.effective_user
-    user_role = db.get_user_role(user.id)
+    user_role = await db.get_user_role(user.id)
     
     if user_role != 'Admin':
         await update.callback_query.answer("❌ Solo administradores pueden acceder")
@@ -23,6 +34,7 @@ async def admin_management_menu(update: Update, context: ContextTypes.DEFAULT_TY
     
     keyboard = [
         [InlineKeyboardButton("📊 Ver estadísticas de BD", callback_data="admin_stats")],
+        [InlineKeyboardButton("⏱️ Rendimiento de consultas", callback_data="admin_queries")],
         [InlineKeyboardButton("💾 Crear backup completo", callback_data="admin_backup")],
         [InlineKeyboardButton("🗑️ Limpiar base de datos", callback_data="admin_reset_confirm")],
         [InlineKeyboardButton("🔙 Volver al menú", callback_data="end_conversation")]
@@ -36,6 +48,7 @@ async def admin_management_menu(update: Update, context: ContextTypes.DEFAULT_TY
 *Funciones disponibles para administradores:*
 
 📊 **Ver estadísticas** \\- Información general de la BD
+⏱️ **Rendimiento** \\- Consultas más lentas y más frecuentes
 💾 **Crear backup** \\- Respaldo completo en JSON
 🗑️ **Limpiar datos** \\- Vaciar BD \\(preserva admin\\)
 
@@ -62,7 +75,7 @@ async def admin_view_statistics(update: Update, context: ContextTypes.DEFAULT_TY
     """Mostrar estadísticas de la base de datos"""
     await update.callback_query.answer("📊 Obteniendo estadísticas...")
     
-    stats = db.get_database_statistics()
+    stats = await db.get_database_statistics()
     
     if not stats['success']:
         error_text = f"❌ Error obteniendo estadísticas: {stats['error']}"
@@ -96,30 +109,29 @@ async def admin_view_statistics(update: Update, context: ContextTypes.DEFAULT_TY
         if avances_stats.get('por_tipo'):
             stats_text += "\\n🔧 **Por tipo de trabajo:**\\n"
             for tipo in avances_stats['por_tipo'][:5]:  # Top 5
-                if db.USE_SQLITE:
-                    emoji = tipo.get('emoji', '📝')
-                    nombre = tipo.get('nombre', 'Sin tipo')
-                    cantidad = tipo.get('cantidad', 0)
-                else:
-                    emoji = tipo[1] or '📝'
-                    nombre = tipo[0] or 'Sin tipo'
-                    cantidad = tipo[2]
+                emoji = tipo.get('emoji') or '📝'
+                nombre = tipo.get('nombre') or 'Sin tipo'
+                cantidad = tipo.get('cantidad', 0)
                 stats_text += f"   {emoji} {nombre}: {cantidad}\\n"
         
         # Por encargado
         if avances_stats.get('por_encargado'):
             stats_text += "\\n👥 **Por encargado:**\\n"
             for enc in avances_stats['por_encargado'][:5]:  # Top 5
-                if db.USE_SQLITE:
-                    nombre = enc.get('first_name', 'Sin nombre')
-                    cantidad = enc.get('cantidad', 0)
-                else:
-                    nombre = enc[0] or 'Sin nombre'
-                    cantidad = enc[1]
+                nombre = enc.get('first_name') or 'Sin nombre'
+                cantidad = enc.get('cantidad', 0)
                 stats_text += f"   👤 {nombre}: {cantidad}\\n"
     else:
         stats_text += "📊 No hay avances registrados\\n"
-    
+
+    # Métricas del pool de conexiones
+    for pool_stats in db_manager.get_pool_stats().values():
+        stats_text += (
+            f"\\n🔌 **Pool de conexiones:**\\n"
+            f"   En uso: {pool_stats['in_use']} \\| Libres: {pool_stats['idle']}\\n"
+            f"   Checkouts: {pool_stats['checkouts']} \\| Esperas: {pool_stats['waits']} \\| Timeouts: {pool_stats['timeouts']}\\n"
+        )
+
     keyboard = [
         [InlineKeyboardButton("🔄 Actualizar", callback_data="admin_stats")],
         [InlineKeyboardButton("🔙 Volver", callback_data="admin_menu")]
@@ -135,11 +147,112 @@ async def admin_view_statistics(update: Update, context: ContextTypes.DEFAULT_TY
     
     return ADMIN_MENU
 
+async def admin_view_query_metrics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mostrar las consultas más lentas y más frecuentes desde el arranque"""
+    await update.callback_query.answer("⏱️ Obteniendo métricas...")
+
+    def esc(value):
+        return escape_markdown(str(value), version=2)
+
+    def ms(value):
+        return esc(f"{value:.1f}")
+
+    summary = db_metrics.get_summary()
+    text = (
+        "⏱️ *RENDIMIENTO DE LA BASE DE DATOS*\n\n"
+        f"📞 Llamadas: {summary['calls']} \\| Sentencias: {summary['queries']}\n"
+        f"❌ Errores: {summary['errors']} \\| 🐢 Lentas \\(≥ {ms(summary['slow_threshold_ms'])} ms\\): {summary['slow_queries']}\n"
+    )
+
+    user_cache = db_manager.get_user_cache_stats()
+    hit_rate = esc(f"{user_cache['hit_rate']:.0%}")
+    text += (
+        f"👤 Caché de usuarios: {user_cache['hits']} aciertos \\| {user_cache['misses']} fallos "
+        f"\\({hit_rate}\\)\n"
+    )
+
+    pdf = pdf_worker.get_pdf_stats()
+    text += (
+        f"🖨️ PDFs: {pdf['jobs']} generados, {ms(pdf['render_ms_avg'])} ms media, "
+        f"{ms(pdf['render_ms_max'])} ms máx \\| cola {pdf['queue_depth']} \\(máx {pdf['max_queue_depth']}\\), "
+        f"{pdf['timeouts']} timeouts, {pdf['requeued']} reenviados, {pdf['rejected']} rechazados\n"
+    )
+
+    reports = report_cache.get_cache_stats()
+    text += f"📁 Caché de informes: {reports['hits']} aciertos \\| {reports['misses']} fallos \\| {reports['evictions']} expulsados\n"
+    jobs = report_jobs.get_job_stats()
+    text += (
+        f"⏳ Informes en segundo plano: {jobs['running']} en curso, {jobs['queued']} en cola \\| "
+        f"{jobs['completed']} completados, {jobs['cancelled']} cancelados, {jobs['failed']} fallidos, "
+        f"{jobs['rejected']} rechazados\n"
+    )
+    photos = photo_store.get_photo_stats()
+    upload_mb = esc(f"{photos['upload_bytes'] / 1024 / 1024:.1f}")
+    stored_mb = esc(f"{photos['stored_bytes'] / 1024 / 1024:.1f}")
+    text += (
+        f"🗂️ Almacén de fotos: {photos['stored']} nuevas \\({stored_mb} MB\\), {photos['deduplicated']} duplicadas\n"
+        f"🖼️ Fotos: {photos['file_id_sends']} por file\\_id, {photos['uploads']} subidas \\({upload_mb} MB\\), "
+        f"{photos['stale_file_ids']} file\\_id caducados, {photos['media_groups']} álbumes\n"
+    )
+    images = image_pipeline.get_image_stats()
+    saved_mb = esc(f"{images['saved_bytes'] / 1024 / 1024:.1f}")
+    text += (
+        f"🎞️ Variantes de fotos: {images['processed']} procesadas, {saved_mb} MB ahorrados, "
+        f"{ms(images['process_ms_avg'])} ms media \\| cola {images['queue_depth']}, "
+        f"{images['timeouts']} timeouts, {images['requeued']} reenviadas, {images['rejected']} rechazadas\n"
+    )
+    maintenance = photo_maintenance.get_maintenance_stats()
+    orphan_mb, archive_mb, variant_mb = (
+        esc(f"{maintenance[key] / 1024 / 1024:.1f}") for key in ("orphan_bytes", "archive_bytes", "variant_bytes")
+    )
+    text += (
+        f"🧹 Mantenimiento de fotos: {maintenance['orphans']} huérfanas \\({orphan_mb} MB\\), "
+        f"{maintenance['archived']} archivadas \\({archive_mb} MB por compresión\\), "
+        f"{variant_mb} MB de variantes, {photos['restored']} restauradas "
+        f"\\| carpeta {maintenance['cursor']}/{maintenance['units']}, {maintenance['errors']} errores\n"
+    )
+
+    slowest = db_metrics.top_queries(by="max_ms")
+    if slowest:
+        text += "\n🐢 *Sentencias más lentas:*\n"
+        for q in slowest:
+            sql = escape_markdown(q['name'][:80], version=2, entity_type='code')
+            text += (
+                f"• {ms(q['max_ms'])} ms máx, {ms(q['avg_ms'])} ms media, {q['count']}x "
+                f"\\({esc(q['function'] or '?')}\\)\n"
+                f"  `{sql}`\n"
+            )
+
+    frequent = db_metrics.top_functions(by="count")
+    if frequent:
+        text += "\n🔁 *Funciones más llamadas:*\n"
+        for f in frequent:
+            text += (
+                f"• {esc(f['name'])}: {f['count']}x, {ms(f['avg_ms'])} ms media, "
+                f"p95 {ms(f['p95_ms'])} ms, {f['errors']} errores\n"
+            )
+
+    if not slowest and not frequent:
+        text += "\n📊 Aún no hay consultas registradas\n"
+
+    keyboard = [
+        [InlineKeyboardButton("🔄 Actualizar", callback_data="admin_queries")],
+        [InlineKeyboardButton("🔙 Volver", callback_data="admin_menu")]
+    ]
+
+    await update.callback_query.edit_message_text(
+        text,
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode='MarkdownV2'
+    )
+
+    return ADMIN_MENU
+
 async def admin_create_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Crear backup completo de la base de datos"""
     await update.callback_query.answer("💾 Creando backup...")
     
-    backup_result = db.backup_database_to_json()
+    backup_result = await db.backup_database_to_json()
     
     if backup_result['success']:
         backup_text = f"""
@@ -221,14 +334,14 @@ async def admin_execute_reset(update: Update, context: ContextTypes.DEFAULT_TYPE
     await update.callback_query.answer("🗑️ Limpiando base de datos...")
     
     # Crear backup automático antes de limpiar
-    backup_result = db.backup_database_to_json()
+    backup_result = await db.backup_database_to_json()
     
     # Ejecutar limpieza
-    reset_result = db.reset_database_safely(preserve_admin_user_id=user.id)
+    reset_result = await db.reset_database_safely(preserve_admin_user_id=user.id)
     
     if reset_result['success']:
         preserved_admin = reset_result['preserved_admin']
-        admin_name = preserved_admin['first_name'] if db.USE_SQLITE else preserved_admin[2]
+        admin_name = preserved_admin['first_name']
         
         result_text = f"""
 ✅ **BASE DE DATOS LIMPIADA EXITOSAMENTE**
@@ -291,6 +404,8 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
         return await admin_management_menu(update, context)
     elif data == "admin_stats":
         return await admin_view_statistics(update, context)
+    elif data == "admin_queries":
+        return await admin_view_query_metrics(update, context)
     elif data == "admin_backup":
         return await admin_create_backup(update, context)
     elif data == "admin_reset_confirm":
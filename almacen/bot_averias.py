@@ -13,6 +13,7 @@ from telegram.ext import (
 )
 from telegram.helpers import escape_markdown
 import db_manager as db
+import photo_store
 from bot_navigation import end_and_return_to_menu, start
 from reporter import send_report, escape, format_user
 
@@ -77,12 +78,7 @@ async def get_breakdown_photo(update: Update, context: ContextTypes.DEFAULT_TYPE
             await save_breakdown(update, context)
             return ConversationHandler.END
     else:
-        photo_file = await update.message.photo[-1].get_file()
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_name = f"averia_{update.effective_user.id}_{timestamp}.jpg"
-        os.makedirs('averias_fotos', exist_ok=True)
-        file_path = os.path.join('averias_fotos', file_name)
-        await photo_file.download_to_drive(file_path)
+        file_path = await photo_store.save_telegram_photo(update.message.photo[-1])
         context.user_data['new_breakdown']['foto_path'] = file_path
         await update.message.reply_text("Foto recibida. Registrando avería...")
         await save_breakdown(update, context)
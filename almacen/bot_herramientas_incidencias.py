@@ -10,6 +10,7 @@ from telegram.ext import (
     filters,
 )
 import db_manager as db
+import photo_store
 from bot_navigation import end_and_return_to_menu, start
 from reporter import send_report, escape, format_user
 from almacen.keyboards import get_cancel_keyboard, get_nav_keyboard
@@ -99,12 +100,7 @@ async def get_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             await save_and_notify(update, context)
             return ConversationHandler.END
     else: # foto enviada
-        photo_file = await update.message.photo[-1].get_file()
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_name = f"incidencia_tool_{update.effective_user.id}_{timestamp}.jpg"
-        os.makedirs('incidencias_fotos', exist_ok=True)
-        file_path = os.path.join('incidencias_fotos', file_name)
-        await photo_file.download_to_drive(file_path)
+        file_path = await photo_store.save_telegram_photo(update.message.photo[-1])
         context.user_data['new_incidence']['foto_path'] = file_path
         await update.message.reply_text("Foto recibida. Registrando incidencia...")
         await save_and_notify(update, context)
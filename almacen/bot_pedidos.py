@@ -8,11 +8,15 @@ from telegram.ext import (
     MessageHandler,
     filters,
 )
-import db_manager as db
+import db_manager
+from db_async import AsyncDB
 from bot_navigation import end_and_return_to_menu
 from reporter import send_report, escape, format_user
 from almacen.keyboards import get_cancel_keyboard, get_nav_keyboard
 
+# Acceso a BD sin bloquear el event loop (ver db_async)
+db = AsyncDB(db_manager)
+
 (
     # Estados para la conversación de SOLICITUD de material
     SELECTING_ITEM_TYPE, SELECTING_ITEM, AWAITING_QUANTITY, 
@@ -84,6 +88,7 @@ async def select_item_type(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     item_type = query.data.split('_')[1]
     context.user_data['current_item_type'] = item_type
     context.user_data['current_page'] = 0
+    context.user_data['current_page_cursor'] = {}
     
     await show_material_page(update, context)
     return SELECTING_ITEM
@@ -93,8 +98,19 @@ async def show_material_page(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     page = context.user_data.get('current_page', 0)
     item_type = context.user_data.get('current_item_type')
+    cursor = context.user_data.get('current_page_cursor', {})
     
-    materials, total_pages = db.get_almacen_items_paginated(item_type, page, ITEMS_PER_PAGE)
+    # Paginación por keyset: cada página cuesta lo mismo y el total sale de caché
+    materials, has_next, has_prev = await db.get_almacen_items_keyset(item_type, ITEMS_PER_PAGE, **cursor)
+    if not has_prev:
+        page = context.user_data['current_page'] = 0
+    total_items = await db.count_almacen_items(item_type)
+    total_pages = max((total_items + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE, page + (2 if has_next else 1))
+    if materials:
+        context.user_data['current_page_keys'] = (
+            (materials[0]['nombre'], materials[0]['id']),
+            (materials[-1]['nombre'], materials[-1]['id']),
+        )
 
     if not materials and page == 0:
         await query.edit_message_text(f"❌ No hay '{escape(item_type)}' en el inventario\\.", reply_markup=get_cancel_keyboard("Pedido"), parse_mode='MarkdownV2')
@@ -105,9 +121,9 @@ async def show_material_page(update: Update, context: ContextTypes.DEFAULT_TYPE)
         keyboard.append([InlineKeyboardButton(f"{m['nombre']} (Stock: {m['cantidad']})", callback_data=f"item_{m['id']}_{m['nombre']}")])
     
     pagination_row = []
-    if page > 0:
+    if has_prev:
         pagination_row.append(InlineKeyboardButton("⬅️ Ant", callback_data="page_prev"))
-    if page < total_pages - 1:
+    if has_next:
         pagination_row.append(InlineKeyboardButton("Sig ➡️", callback_data="page_next"))
     if pagination_row:
         keyboard.append(pagination_row)
@@ -126,7 +142,13 @@ async def change_material_page(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     direction = query.data.split('_')[1]
     page = context.user_data.get('current_page', 0)
-    context.user_data['current_page'] = page + 1 if direction == 'next' else page - 1
+    first_key, last_key = context.user_data.get('current_page_keys', (None, None))
+    if direction == 'next':
+        context.user_data['current_page'] = page + 1
+        context.user_data['current_page_cursor'] = {'after': last_key}
+    else:
+        context.user_data['current_page'] = page - 1
+        context.user_data['current_page_cursor'] = {'before': first_key}
     await show_material_page(update, context)
     return SELECTING_ITEM
 
@@ -211,9 +233,8 @@ async def save_pedido(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         await message_source.reply_text("❌ No has añadido ningún artículo. Pedido cancelado.", reply_markup=get_nav_keyboard())
         return await end_and_return_to_menu(update, context)
 
-    pedido_id = db.create_pedido(user.id, notas)
-    for item_id, details in pedido_data['items'].items():
-        db.add_item_to_pedido(pedido_id, item_id, details['quantity'])
+    items = [(item_id, details['quantity']) for item_id, details in pedido_data['items'].items()]
+    pedido_id = await db.create_pedido_with_items(user.id, notas, items)
 
     await message_source.reply_text(f"✅ Pedido #{pedido_id} enviado para aprobación.", reply_markup=get_nav_keyboard())
     
@@ -238,7 +259,7 @@ async def save_pedido(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 async def show_pending_requests(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    pedidos = db.get_pedidos_by_estado('Pendiente Aprobacion')
+    pedidos = await db.get_pedidos_by_estado('Pendiente Aprobacion')
     if not pedidos:
         await query.edit_message_text("✅ No hay pedidos pendientes de aprobación.", reply_markup=get_nav_keyboard())
         return ConversationHandler.END
@@ -253,7 +274,7 @@ async def view_pedido_details_for_approval(update: Update, context: ContextTypes
     await query.answer()
     pedido_id = int(query.data.split('_')[2])
     context.user_data['current_pedido_id'] = pedido_id
-    details = db.get_pedido_details(pedido_id)
+    details = await db.get_pedido_details(pedido_id)
     if not details:
         await query.edit_message_text("❌ Error: No se encontró el pedido.", reply_markup=get_nav_keyboard())
         return ConversationHandler.END
@@ -280,16 +301,15 @@ async def approve_pedido(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # MEJOR PRÁCTICA: Obtener el usuario desde la query en un CallbackQueryHandler
     user = query.from_user
     
-    db.update_pedido_status(pedido_id, 'Aprobado', user.id, "Aprobado sin cambios.")
+    details = await db.update_pedido_status(pedido_id, 'Aprobado', user.id, "Aprobado sin cambios.")
     await query.edit_message_text(f"✅ Pedido #{pedido_id} aprobado.", reply_markup=get_nav_keyboard())
     
-    details = db.get_pedido_details(pedido_id)
     if not details:
         context.user_data.clear()
         return ConversationHandler.END
 
     await context.bot.send_message(details['solicitante_id'], f"✅ Tu pedido de material #{pedido_id} ha sido *APROBADO*.")
-    for almacen_user in db.get_users_by_role('Almacen'):
+    for almacen_user in await db.get_users_by_role('Almacen'):
         await context.bot.send_message(almacen_user['id'], f"📦 El pedido #{pedido_id} ha sido APROBADO. Por favor, prepararlo para su recogida.")
 
     report_text = (
@@ -313,10 +333,9 @@ async def reject_pedido(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     pedido_id = context.user_data['current_pedido_id']
     user = update.effective_user
     
-    db.update_pedido_status(pedido_id, 'Rechazado', user.id, rejection_notes)
+    details = await db.update_pedido_status(pedido_id, 'Rechazado', user.id, rejection_notes)
     await update.message.reply_text(f"❌ Pedido #{pedido_id} rechazado.", reply_markup=get_nav_keyboard())
     
-    details = db.get_pedido_details(pedido_id)
     if not details:
         context.user_data.clear()
         return ConversationHandler.END
@@ -341,7 +360,7 @@ async def reject_pedido(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 async def show_approved_requests(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    pedidos = db.get_pedidos_by_estado('Aprobado')
+    pedidos = await db.get_pedidos_by_estado('Aprobado')
     if not pedidos:
         await query.edit_message_text("✅ No hay pedidos pendientes de preparar.", reply_markup=get_nav_keyboard())
         return ConversationHandler.END
@@ -356,7 +375,7 @@ async def view_preparation_details(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
     pedido_id = int(query.data.split('_')[2])
     context.user_data['current_pedido_id'] = pedido_id
-    details = db.get_pedido_details(pedido_id)
+    details = await db.get_pedido_details(pedido_id)
     if not details:
         await query.edit_message_text("❌ Error: No se encontró el pedido.", reply_markup=get_nav_keyboard())
         return ConversationHandler.END
@@ -379,10 +398,9 @@ async def mark_as_ready(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     await query.answer()
     pedido_id = context.user_data['current_pedido_id']
     user = query.from_user
-    db.update_pedido_status(pedido_id, 'Listo para Recoger', user.id)
+    details = await db.update_pedido_status(pedido_id, 'Listo para Recoger', user.id)
     await query.edit_message_text(f"✅ Pedido #{pedido_id} marcado como 'Listo para Recoger'.", reply_markup=get_nav_keyboard())
     
-    details = db.get_pedido_details(pedido_id)
     if not details:
         context.user_data.clear()
         return ConversationHandler.END
@@ -11,7 +11,6 @@ from almacen.keyboards import (
     get_confirm_delete_keyboard,
 )
 from bot_navigation import end_and_return_to_menu
-import psycopg2
 
 SELECT_CATEGORY = 5
 LIST_ITEMS = 6
@@ -41,20 +40,34 @@ async def list_items_by_category(update: Update, context: ContextTypes.DEFAULT_T
         category = query.data.split("_")[2]
         context.user_data["view_category"] = category
         context.user_data["view_page"] = 0
+        context.user_data["view_cursor"] = {}
     elif query.data == "back_to_list":
         category = context.user_data["view_category"]
     else:
         category = context.user_data["view_category"]
         page_action = query.data.split("_")[2]
+        first_key, last_key = context.user_data.get("view_page_keys", (None, None))
         if page_action == "next":
             context.user_data["view_page"] += 1
+            context.user_data["view_cursor"] = {"after": last_key}
         elif page_action == "prev":
             context.user_data["view_page"] -= 1
+            context.user_data["view_cursor"] = {"before": first_key}
 
-    page = context.user_data["view_page"]
-    items, total_pages = db.get_almacen_items_paginated(
-        category, page, ITEMS_PER_PAGE
+    # Paginación por keyset sobre (nombre, id); el total sale de caché
+    items, has_next, has_prev = db.get_almacen_items_keyset(
+        category, ITEMS_PER_PAGE, **context.user_data.get("view_cursor", {})
     )
+    if not has_prev:
+        context.user_data["view_page"] = 0
+    page = context.user_data["view_page"]
+    total_items = db.count_almacen_items(category)
+    total_pages = max((total_items + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE, page + (2 if has_next else 1))
+    if items:
+        context.user_data["view_page_keys"] = (
+            (items[0]["nombre"], items[0]["id"]),
+            (items[-1]["nombre"], items[-1]["id"]),
+        )
 
     if not items and page == 0:
         await query.edit_message_text(
@@ -70,7 +83,7 @@ async def list_items_by_category(update: Update, context: ContextTypes.DEFAULT_T
             [InlineKeyboardButton(label, callback_data=f"view_item_{item['id']}")]
         )
 
-    pagination_markup = get_pagination_keyboard(page, total_pages)
+    pagination_markup = get_pagination_keyboard(has_prev, has_next)
     if pagination_markup:
         keyboard.append(pagination_markup.inline_keyboard[0])
 
@@ -246,7 +259,7 @@ async def delete_item(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         )
         return await list_items_by_category(update, context)
 
-    except psycopg2.IntegrityError:
+    except db.IntegrityError:
         await query.edit_message_text(
             f"❌ *No se puede eliminar el artículo*\n\n"
             f"El artículo *{escape(item['nombre'])}* está siendo utilizado en pedidos o incidencias y no puede ser borrado para mantener la integridad de los datos\\.",
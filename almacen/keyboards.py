@@ -66,11 +66,11 @@ def get_confirm_delete_keyboard(item_id):
         ]
     ])
 
-def get_pagination_keyboard(page, total_pages):
+def get_pagination_keyboard(has_prev, has_next):
     """Teclado de paginación para la lista de artículos."""
     buttons = []
-    if page > 0:
+    if has_prev:
         buttons.append(InlineKeyboardButton("⬅️ Anterior", callback_data="view_page_prev"))
-    if page < total_pages - 1:
+    if has_next:
         buttons.append(InlineKeyboardButton("Siguiente ➡️", callback_data="view_page_next"))
     return InlineKeyboardMarkup([buttons]) if buttons else None
@@ -8,7 +8,8 @@ from telegram.ext import (
 )
 from datetime import datetime, date
 import os
-import db_adapter as db_manager
+import db_manager
+import photo_store
 from bot_navigation import end_and_return_to_menu
 from calendar_helper import create_calendar, process_calendar_selection
 from .avances_keyboards import *
@@ -471,28 +472,38 @@ async def process_opciones_adicionales(update: Update, context: ContextTypes.DEF
     return MOSTRANDO_OPCIONES
 
 async def process_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Procesa la foto subida."""
+    """
+    Procesa la foto subida. Se pueden añadir varias: las de un álbum llegan
+    como mensajes sueltos con el mismo media_group_id y solo se responde al
+    primero (el resto se guarda sin mensajes extra).
+    """
     if update.message and update.message.photo:
+        avance_data = context.user_data['current_avance']
+        media_group_id = update.message.media_group_id
+        repeated_album = media_group_id is not None and media_group_id == avance_data.get('album_id')
         try:
-            # Obtener la foto de mayor calidad
+            # Obtener la foto de mayor calidad y guardarla en el almacén de fotos
             photo = update.message.photo[-1]
+            photo_path = await photo_store.save_telegram_photo(photo)
             
-            # Crear directorio si no existe
-            photo_dir = "data/fotos_avances"
-            os.makedirs(photo_dir, exist_ok=True)
+            avance_data.setdefault('fotos', []).append(photo_path)
+            avance_data['foto_path'] = avance_data['fotos'][0]
+            avance_data['tiene_foto'] = True
             
-            # Generar nombre único para la foto
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            user_id = update.effective_user.id
-            photo_filename = f"avance_{user_id}_{timestamp}.jpg"
-            photo_path = os.path.join(photo_dir, photo_filename)
-            
-            # Descargar foto
-            file = await context.bot.get_file(photo.file_id)
-            await file.download_to_drive(photo_path)
-            
-            context.user_data['current_avance']['foto_path'] = photo_path
-            context.user_data['current_avance']['tiene_foto'] = True
+            if repeated_album:
+                return PROCESANDO_FOTO
+            if media_group_id is not None:
+                # Primera foto del álbum: se espera al resto en este mismo estado
+                avance_data['album_id'] = media_group_id
+                await update.message.reply_text(
+                    "✅ *Fotos recibidas*\n\n"
+                    "Puedes enviar más fotos o continuar\\.",
+                    reply_markup=InlineKeyboardMarkup([
+                        [InlineKeyboardButton("✅ Continuar", callback_data="avance_photos_done")]
+                    ]),
+                    parse_mode='MarkdownV2'
+                )
+                return PROCESANDO_FOTO
             
             await update.message.reply_text(
                 "✅ *Foto guardada exitosamente*",
@@ -503,6 +514,8 @@ async def process_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
             )
             
         except Exception as e:
+            if repeated_album:
+                return PROCESANDO_FOTO
             await update.message.reply_text(
                 f"❌ Error al guardar la foto: {str(e)}",
                 reply_markup=InlineKeyboardMarkup([
@@ -615,7 +628,9 @@ async def save_avance_final(update: Update, context: ContextTypes.DEFAULT_TYPE)
             estado=estado,
             fecha_trabajo=avance_data['fecha_trabajo'],
             tipo_trabajo_id=avance_data.get('tipo_trabajo_id'),
-            observaciones=avance_data.get('observaciones')
+            observaciones=avance_data.get('observaciones'),
+            fotos=avance_data.get('fotos'),
+            ubicacion=avance_data['ubicacion']
         )
         
         if not avance_id:
@@ -738,7 +753,8 @@ def get_avances_registro_handler():
             ],
             PROCESANDO_FOTO: [
                 MessageHandler(filters.PHOTO, process_photo),
-                CallbackQueryHandler(show_opciones_adicionales, pattern="^avance_skip_photo$")
+                CallbackQueryHandler(show_opciones_adicionales, pattern="^avance_skip_photo$"),
+                CallbackQueryHandler(show_opciones_adicionales, pattern="^avance_photos_done$")
             ],
             ESCRIBIENDO_OBSERVACIONES: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, process_observaciones),
@@ -1,7 +1,7 @@
 # avances/avances_utils.py
 # Utilidades compartidas para el módulo de avances
 
-import db_adapter as db_manager
+import db_manager
 from datetime import datetime, date
 import pytz
 from telegram.helpers import escape_markdown
@@ -108,7 +108,9 @@ def format_avance_summary(avance_data):
     if avance_data.get('observaciones'):
         summary += f"💭 *Observaciones:* {escape(avance_data['observaciones'])}\n"
     
-    if avance_data.get('tiene_foto'):
+    if len(avance_data.get('fotos') or []) > 1:
+        summary += f"📸 *Fotos:* ✅ {len(avance_data['fotos'])} incluidas\n"
+    elif avance_data.get('tiene_foto'):
         summary += f"📸 *Foto:* ✅ Incluida\n"
     
     if avance_data.get('tiene_incidencia'):
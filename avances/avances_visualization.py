@@ -7,11 +7,14 @@ from telegram.ext import (
     MessageHandler, filters
 )
 from datetime import datetime, date, timedelta
-import db_adapter as db_manager
+import db_manager
+from db_async import AsyncDB
 from bot_navigation import end_and_return_to_menu
 from .avances_keyboards import *
 from .avances_utils import *
 
+db = AsyncDB(db_manager)
+
 # Estados de conversación para visualización
 (
     VISUALIZATION_MENU, VIEWING_AVANCES, FILTERING_AVANCES,
@@ -24,7 +27,7 @@ async def start_avances_visualization(update: Update, context: ContextTypes.DEFA
     await query.answer()
     
     user = update.effective_user
-    user_role = db_manager.get_user_role(user.id)
+    user_role = await db.get_user_role(user.id)
     
     if not can_user_view_all_avances(user_role):
         await query.edit_message_text(
@@ -57,12 +60,13 @@ async def show_avances_recent(update: Update, context: ContextTypes.DEFAULT_TYPE
     end_date = date.today()
     start_date = end_date - timedelta(days=7)
     
-    avances = db_manager.get_avances_with_filters_extended(
+    resumen = await db.get_avances_summary(
         start_date=start_date,
-        end_date=end_date
+        end_date=end_date,
+        latest_k=5
     )
     
-    if not avances:
+    if not resumen['total']:
         await query.edit_message_text(
             "📋 *Avances Recientes \\(7 días\\)*\n\n"
             "No se encontraron avances en los últimos 7 días\\.",
@@ -75,23 +79,21 @@ async def show_avances_recent(update: Update, context: ContextTypes.DEFAULT_TYPE
         return VIEWING_AVANCES
     
     # Estadísticas rápidas
-    total_avances = len(avances)
-    con_incidencia = len([a for a in avances if a['estado'] == 'Con Incidencia'])
-    finalizados = len([a for a in avances if a['estado'] == 'Finalizado'])
+    total_avances = resumen['total']
     
     text = (
         f"📋 *Avances Recientes \\(últimos 7 días\\)*\n\n"
         f"📊 *Estadísticas:*\n"
         f"• Total: {total_avances} avances\n"
-        f"• ✅ Finalizados: {finalizados}\n"
-        f"• ⚠️ Con incidencias: {con_incidencia}\n\n"
+        f"• ✅ Finalizados: {resumen['finalizados']}\n"
+        f"• ⚠️ Con incidencias: {resumen['con_incidencia']}\n\n"
         f"*Últimos avances:*\n"
     )
     
     # Mostrar últimos 5 avances
-    for i, avance in enumerate(avances[:5], 1):
+    for i, avance in enumerate(resumen['latest'], 1):
         emoji_estado = "✅" if avance['estado'] == 'Finalizado' else "⚠️"
-        emoji_tipo = avance.get('tipo_trabajo_emoji', '🔧')
+        emoji_tipo = avance.get('tipo_trabajo_emoji') or '🔧'
         
         text += (
             f"{i}\\. {emoji_estado} {emoji_tipo} {escape(avance['trabajo'])}\n"
@@ -99,8 +101,8 @@ async def show_avances_recent(update: Update, context: ContextTypes.DEFAULT_TYPE
             f"   👤 {escape(avance['encargado_nombre'])} \\- {format_date(avance['fecha'])}\n\n"
         )
     
-    if len(avances) > 5:
-        text += f"_\\.\\.\\. y {len(avances) - 5} avances más_"
+    if total_avances > 5:
+        text += f"_\\.\\.\\. y {total_avances - 5} avances más_"
     
     keyboard = [
         [
@@ -129,7 +131,7 @@ async def show_avances_by_location(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
     
     # Obtener jerarquía de ubicaciones
-    jerarquia = db_manager.get_jerarquia_ubicaciones()
+    jerarquia = await db.get_jerarquia_ubicaciones()
     
     text = (
         "🏗️ *Avances por Ubicación*\n\n"
@@ -162,7 +164,7 @@ async def show_filter_edificio(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    edificios = db_manager.get_ubicaciones_by_tipo('Edificio')
+    edificios = await db.get_ubicaciones_by_tipo('Edificio')
     
     if not edificios:
         await query.edit_message_text(
@@ -199,7 +201,7 @@ async def apply_filter_edificio(update: Update, context: ContextTypes.DEFAULT_TY
     edificio_id = int(query.data.split('_')[3])
     
     # Obtener nombre del edificio
-    edificios = db_manager.get_ubicaciones_by_tipo('Edificio')
+    edificios = await db.get_ubicaciones_by_tipo('Edificio')
     edificio = next((e for e in edificios if e['id'] == edificio_id), None)
     
     if not edificio:
@@ -212,9 +214,9 @@ async def apply_filter_edificio(update: Update, context: ContextTypes.DEFAULT_TY
     
     # Filtrar avances por edificio
     filtros = {'edificio': edificio['nombre']}
-    avances = db_manager.get_avances_with_filters_extended(filters=filtros)
+    resumen = await db.get_avances_summary(filters=filtros)
     
-    if not avances:
+    if not resumen['total']:
         await query.edit_message_text(
             f"📋 *Avances en {escape(edificio['nombre'])}*\n\n"
             "No se encontraron avances en este edificio\\.",
@@ -226,35 +228,23 @@ async def apply_filter_edificio(update: Update, context: ContextTypes.DEFAULT_TY
         )
         return FILTERING_AVANCES
     
-    # Estadísticas
-    total = len(avances)
-    finalizados = len([a for a in avances if a['estado'] == 'Finalizado'])
-    con_incidencia = len([a for a in avances if a['estado'] == 'Con Incidencia'])
-    
-    # Agrupar por tipo de trabajo
-    tipos_trabajo = {}
-    for avance in avances:
-        tipo = avance.get('tipo_trabajo', 'Sin tipo')
-        if tipo not in tipos_trabajo:
-            tipos_trabajo[tipo] = 0
-        tipos_trabajo[tipo] += 1
-    
     text = (
         f"📋 *Avances en {escape(edificio['nombre'])}*\n\n"
         f"📊 *Estadísticas:*\n"
-        f"• Total: {total} avances\n"
-        f"• ✅ Finalizados: {finalizados}\n"
-        f"• ⚠️ Con incidencias: {con_incidencia}\n\n"
+        f"• Total: {resumen['total']} avances\n"
+        f"• ✅ Finalizados: {resumen['finalizados']}\n"
+        f"• ⚠️ Con incidencias: {resumen['con_incidencia']}\n\n"
     )
     
-    if tipos_trabajo:
+    # Tipos de trabajo (ya agrupados y ordenados por la consulta)
+    if resumen['por_tipo']:
         text += "*Tipos de trabajo:*\n"
-        for tipo, count in list(tipos_trabajo.items())[:5]:
-            text += f"• {escape(tipo)}: {count}\n"
+        for tipo in resumen['por_tipo'][:5]:
+            text += f"• {escape(tipo['nombre'] or 'Sin tipo')}: {tipo['cantidad']}\n"
     
     # Últimos avances
     text += f"\n*Últimos avances:*\n"
-    for i, avance in enumerate(avances[:3], 1):
+    for i, avance in enumerate(resumen['latest'], 1):
         emoji_estado = "✅" if avance['estado'] == 'Finalizado' else "⚠️"
         text += (
             f"{i}\\. {emoji_estado} {escape(avance['trabajo'])}\n"
@@ -350,22 +340,22 @@ async def apply_date_filter(update: Update, context: ContextTypes.DEFAULT_TYPE)
     else:
         return SELECTING_DATE_RANGE
     
-    # Obtener avances del periodo
-    avances = db_manager.get_avances_with_filters_extended(
+    # Resumen del periodo (los avances no se cargan: solo totales y los últimos)
+    resumen = await db.get_avances_summary(
         start_date=start_date,
         end_date=end_date
     )
     
-    context.user_data['filtered_avances'] = avances
+    context.user_data['filter_dates'] = (start_date, end_date)
     context.user_data['filter_periodo'] = periodo
     
-    return await show_filtered_avances_summary(update, context, avances, periodo)
+    return await show_filtered_avances_summary(update, context, resumen, periodo)
 
-async def show_filtered_avances_summary(update: Update, context: ContextTypes.DEFAULT_TYPE, avances: list, periodo: str) -> int:
-    """Muestra resumen de avances filtrados."""
+async def show_filtered_avances_summary(update: Update, context: ContextTypes.DEFAULT_TYPE, resumen: dict, periodo: str) -> int:
+    """Muestra resumen de avances filtrados (resultado de db_manager.get_avances_summary)."""
     query = update.callback_query
     
-    if not avances:
+    if not resumen['total']:
         await query.edit_message_text(
             f"📋 *Avances de {periodo}*\n\n"
             f"No se encontraron avances en {periodo}\\.",
@@ -377,40 +367,27 @@ async def show_filtered_avances_summary(update: Update, context: ContextTypes.DE
         )
         return VIEWING_AVANCES
     
-    # Estadísticas
-    total = len(avances)
-    finalizados = len([a for a in avances if a['estado'] == 'Finalizado'])
-    con_incidencia = len([a for a in avances if a['estado'] == 'Con Incidencia'])
-    
-    # Top encargados
-    encargados = {}
-    for avance in avances:
-        nombre = avance['encargado_nombre']
-        if nombre not in encargados:
-            encargados[nombre] = 0
-        encargados[nombre] += 1
-    
-    top_encargados = sorted(encargados.items(), key=lambda x: x[1], reverse=True)[:3]
+    total = resumen['total']
     
     text = (
         f"📋 *Avances de {periodo}*\n\n"
         f"📊 *Estadísticas:*\n"
         f"• Total: {total} avances\n"
-        f"• ✅ Finalizados: {finalizados}\n"
-        f"• ⚠️ Con incidencias: {con_incidencia}\n\n"
+        f"• ✅ Finalizados: {resumen['finalizados']}\n"
+        f"• ⚠️ Con incidencias: {resumen['con_incidencia']}\n\n"
     )
     
-    if top_encargados:
+    if resumen['top_encargados']:
         text += "*Top encargados:*\n"
-        for i, (nombre, count) in enumerate(top_encargados, 1):
-            text += f"{i}\\. {escape(nombre)}: {count} avances\n"
+        for i, encargado in enumerate(resumen['top_encargados'], 1):
+            text += f"{i}\\. {escape(encargado['nombre'] or 'Sin nombre')}: {encargado['cantidad']} avances\n"
         text += "\n"
     
     # Mostrar algunos avances
     text += "*Últimos avances:*\n"
-    for i, avance in enumerate(avances[:3], 1):
+    for i, avance in enumerate(resumen['latest'], 1):
         emoji_estado = "✅" if avance['estado'] == 'Finalizado' else "⚠️"
-        emoji_tipo = avance.get('tipo_trabajo_emoji', '🔧')
+        emoji_tipo = avance.get('tipo_trabajo_emoji') or '🔧'
         
         text += (
             f"{i}\\. {emoji_estado} {emoji_tipo} {escape(avance['trabajo'])}\n"
@@ -418,8 +395,8 @@ async def show_filtered_avances_summary(update: Update, context: ContextTypes.DE
             f"   👤 {escape(avance['encargado_nombre'])}\n\n"
         )
     
-    if len(avances) > 3:
-        text += f"_\\.\\.\\. y {len(avances) - 3} avances más_"
+    if total > 3:
+        text += f"_\\.\\.\\. y {total - 3} avances más_"
     
     keyboard = [
         [
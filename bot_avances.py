@@ -11,11 +11,14 @@ from telegram.ext import (
     filters,
 )
 from telegram.helpers import escape_markdown
-import db_manager as db
+import db_manager
+from db_async import AsyncDB
+import photo_store
 from bot_navigation import end_and_return_to_menu, start
 from reporter import send_report, escape, format_user
 from calendar_helper import create_calendar, process_calendar_selection
 
+db = AsyncDB(db_manager)
 
 # Estados de Conversación
 (
@@ -71,14 +74,13 @@ async def ver_foto_avance(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     except (IndexError, ValueError):
         await query.message.reply_text("Error: ID de avance no válido.")
         return
-    foto_path = db.get_foto_path_by_avance_id(avance_id)
-    if foto_path and os.path.exists(foto_path):
-        try:
-            with open(foto_path, 'rb') as photo_file:
-                await context.bot.send_photo(chat_id=query.from_user.id, photo=InputFile(photo_file))
-        except Exception as e:
-            await query.message.reply_text(f"No se pudo enviar la foto: {e}")
-    else:
+    fotos = await db.get_entity_photos('avance', avance_id)
+    try:
+        sent = await photo_store.send_photos(context.bot, query.from_user.id, fotos)
+    except Exception as e:
+        await query.message.reply_text(f"No se pudo enviar la foto: {e}")
+        return
+    if not sent:
         await query.message.reply_text("No se encontró la foto para este avance o el archivo fue eliminado.")
 
 # =============================================================================
@@ -88,7 +90,7 @@ async def start_registro(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     query = update.callback_query
     await query.answer()
     context.user_data['current_avance'] = {}
-    edificios = db.get_ubicaciones_by_tipo('Edificio')
+    edificios = await db.get_ubicaciones_by_tipo('Edificio')
     if not edificios:
         await query.edit_message_text("❌ No hay 'Edificios' configurados.", reply_markup=get_nav_keyboard())
         return ConversationHandler.END
@@ -100,7 +102,7 @@ async def select_zona(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     query = update.callback_query
     await query.answer()
     context.user_data['current_avance']['edificio'] = query.data.split('_', 1)[1]
-    zonas = db.get_ubicaciones_by_tipo('Zona')
+    zonas = await db.get_ubicaciones_by_tipo('Zona')
     if not zonas:
         await query.edit_message_text("❌ No hay 'Zonas' configuradas.", reply_markup=get_nav_keyboard())
         return ConversationHandler.END
@@ -112,7 +114,7 @@ async def select_planta(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     query = update.callback_query
     await query.answer()
     context.user_data['current_avance']['zona'] = query.data.split('_', 1)[1]
-    plantas = db.get_ubicaciones_by_tipo('Planta')
+    plantas = await db.get_ubicaciones_by_tipo('Planta')
     if not plantas:
         await query.edit_message_text("❌ No hay 'Plantas' configuradas.", reply_markup=get_nav_keyboard())
         return ConversationHandler.END
@@ -124,7 +126,7 @@ async def select_nucleo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     query = update.callback_query
     await query.answer()
     context.user_data['current_avance']['planta'] = query.data.split('_', 1)[1]
-    nucleos = db.get_ubicaciones_by_tipo('Nucleo')
+    nucleos = await db.get_ubicaciones_by_tipo('Nucleo')
     if not nucleos:
         await query.edit_message_text("❌ No hay 'Núcleos' configurados.", reply_markup=get_nav_keyboard())
         return ConversationHandler.END
@@ -248,12 +250,7 @@ async def get_foto(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             context.user_data['current_avance']['foto_path'] = None
             return await ask_incidencia(update, context)
     else:
-        photo_file = await update.message.photo[-1].get_file()
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_name = f"avance_{update.effective_user.id}_{timestamp}.jpg"
-        os.makedirs('avances_fotos', exist_ok=True)
-        file_path = os.path.join('avances_fotos', file_name)
-        await photo_file.download_to_drive(file_path)
+        file_path = await photo_store.save_telegram_photo(update.message.photo[-1])
         context.user_data['current_avance']['foto_path'] = file_path
         return await ask_incidencia(update, context)
 
@@ -294,7 +291,7 @@ async def save_avance(update: Update, context: ContextTypes.DEFAULT_TYPE, has_in
     
     # Se llama a `create_avance` pasando la cadena de texto, no un diccionario.
     # Esto soluciona el error `TypeError`.
-    avance_id = db.create_avance(
+    avance_id = await db.create_avance(
         user.id,
         ubicacion_str,
         avance_data['trabajo'],
@@ -308,7 +305,7 @@ async def save_avance(update: Update, context: ContextTypes.DEFAULT_TYPE, has_in
     fecha_formateada = avance_data['fecha_trabajo'].strftime('%d/%m/%Y')
     
     if has_incidencia:
-        incidencia_id = db.create_incidencia(avance_id, avance_data['incidencia_desc'], user.id)
+        incidencia_id = await db.create_incidencia(avance_id, avance_data['incidencia_desc'], user.id)
         report_text = (
             f"🚨 *Reporte: Nuevo Avance con Incidencia* 🚨\n\n"
             f"*ID Incidencia:* `{incidencia_id}`\n"
@@ -350,7 +347,7 @@ async def save_resolution_notes(update: Update, context: ContextTypes.DEFAULT_TY
     resolution_desc = update.message.text
     incidencia_id = context.user_data['resolving_incidencia_id']
     user = update.effective_user
-    db.resolve_incidencia(incidencia_id, user.id, resolution_desc)
+    await db.resolve_incidencia(incidencia_id, user.id, resolution_desc)
     await update.message.reply_text(f"✅ Incidencia #{incidencia_id} marcada como resuelta.", reply_markup=get_nav_keyboard())
     report_text = (
         f"🛠️ *Reporte: Incidencia Resuelta* 🛠️\n\n"
@@ -370,6 +367,7 @@ async def start_ver_finalizados(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     context.user_data['avances_page'] = 0
+    context.user_data['avances_cursor'] = {}
     await show_avances_page(update, context)
     return VIEWING_AVANCES_LIST
 
@@ -379,7 +377,13 @@ async def change_avances_page(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     direction = query.data.split('_')[1]
     page = context.user_data.get('avances_page', 0)
-    context.user_data['avances_page'] = page + 1 if direction == 'next' else page - 1
+    first_key, last_key = context.user_data.get('avances_page_keys', (None, None))
+    if direction == 'next':
+        context.user_data['avances_page'] = page + 1
+        context.user_data['avances_cursor'] = {'after': last_key}
+    else:
+        context.user_data['avances_page'] = page - 1
+        context.user_data['avances_cursor'] = {'before': first_key}
     await show_avances_page(update, context)
     return VIEWING_AVANCES_LIST
 
@@ -387,8 +391,18 @@ async def show_avances_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Muestra una página de la lista de avances finalizados, editando el mensaje actual."""
     query = update.callback_query
     page = context.user_data.get('avances_page', 0)
+    cursor = context.user_data.get('avances_cursor', {})
     
-    avances, total_pages = db.get_finalizados_paginated(page, ITEMS_PER_PAGE)
+    # Paginación por keyset sobre (fecha_trabajo, id); el total sale de caché
+    avances, has_next, has_prev = await db.get_finalizados_keyset(ITEMS_PER_PAGE, **cursor)
+    if not has_prev:
+        page = context.user_data['avances_page'] = 0
+    total_pages = max((await db.count_finalizados() + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE, page + (2 if has_next else 1))
+    if avances:
+        context.user_data['avances_page_keys'] = (
+            (avances[0]['fecha_trabajo'], avances[0]['id']),
+            (avances[-1]['fecha_trabajo'], avances[-1]['id']),
+        )
 
     if not avances and page == 0:
         await query.edit_message_text("✅ No hay avances finalizados para mostrar.", reply_markup=get_nav_keyboard())
@@ -400,9 +414,9 @@ async def show_avances_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
         keyboard.append([InlineKeyboardButton(button_text, callback_data=f"view_avance_{avance['id']}")])
         
     pagination_row = []
-    if page > 0:
+    if has_prev:
         pagination_row.append(InlineKeyboardButton("⬅️ Anterior", callback_data="avpag_prev"))
-    if page < total_pages - 1:
+    if has_next:
         pagination_row.append(InlineKeyboardButton("Siguiente ➡️", callback_data="avpag_next"))
     if pagination_row:
         keyboard.append(pagination_row)
@@ -426,7 +440,7 @@ async def show_avance_details(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     avance_id = int(query.data.split('_')[2])
     
-    details = db.get_avance_details(avance_id)
+    details = await db.get_avance_details(avance_id)
     
     if not details:
         await query.edit_message_text("❌ Error: No se encontraron los detalles de este avance.", reply_markup=get_nav_keyboard())
@@ -440,10 +454,10 @@ async def show_avance_details(update: Update, context: ContextTypes.DEFAULT_TYPE
         f"🗓️ *Fecha:* {details['fecha_trabajo'].strftime('%d/%m/%Y')}"
     )
     
-    if details['foto_path'] and os.path.exists(details['foto_path']):
+    if details['foto_path']:
         try:
-            with open(details['foto_path'], 'rb') as photo_file:
-                await context.bot.send_photo(chat_id=query.from_user.id, photo=photo_file)
+            fotos = await db.get_entity_photos('avance', details['id'])
+            await photo_store.send_photos(context.bot, query.from_user.id, fotos)
         except Exception as e:
             await query.message.reply_text(f"No se pudo cargar la foto: {e}")
 
@@ -2,7 +2,10 @@
 import os
 import io
 import csv
-from datetime import datetime, date
+import json
+import asyncio
+import tempfile
+from datetime import datetime, date, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
 import telegram.error
 from telegram.ext import (
@@ -10,11 +13,18 @@ from telegram.ext import (
     ConversationHandler,
     CallbackQueryHandler,
 )
-import db_manager as db
+import db_manager
+from db_async import AsyncDB
 from bot_navigation import start
 from reporter import escape
 from calendar_helper import create_calendar, process_calendar_selection
-from pdf_reporter import PDFReport
+import pdf_worker
+import report_cache
+import report_jobs
+import photo_store
+
+# Acceso a BD sin bloquear el event loop (ver db_async)
+db = AsyncDB(db_manager)
 
 (
     SELECTING_REPORT, SELECTING_AVANCE_FILTER_TYPE, SELECTING_UBICACION, 
@@ -22,10 +32,15 @@ from pdf_reporter import PDFReport
     SELECTING_FORMAT, GENERATING_CSV, LISTING_AVANCES, VIEWING_AVANCE_DETAIL,
     ASKING_PERSONAL_START_DATE, ASKING_PERSONAL_END_DATE,
     SELECTING_INCIDENCIA_TYPE,
-    SELECTING_PERSONAL_FORMAT, LISTING_PERSONAL
-) = range(15)
+    SELECTING_PERSONAL_FORMAT, LISTING_PERSONAL,
+    SELECTING_SUBSCRIPTION
+) = range(16)
 
 ITEMS_PER_PAGE = 5
+# Tamaño a partir del cual el CSV en preparación pasa de memoria a un fichero temporal
+REPORT_SPOOL_MAX_BYTES = int(os.getenv("REPORT_SPOOL_MAX_BYTES", str(5 * 1024 * 1024)))
+# Cada cuántos avances escritos se actualiza el progreso del informe en segundo plano
+REPORT_PROGRESS_ROWS = 500
 
 
 # --- Funciones de Ayuda ---
@@ -58,6 +73,8 @@ async def start_informes(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         [InlineKeyboardButton("📊 Informes de Avances de Obra", callback_data="report_avances")],
         [InlineKeyboardButton("🚨 Informes de Incidencias", callback_data="report_incidencias")],
         [InlineKeyboardButton("📈 Informes de Personal", callback_data="report_personal")],
+        [InlineKeyboardButton("⏳ Mis informes en curso", callback_data="report_jobs_list")],
+        [InlineKeyboardButton("🔔 Mis informes programados", callback_data="report_subs_list")],
         [InlineKeyboardButton("⬅️ Volver al Menú Principal", callback_data="back_to_main_menu")]
     ]
     
@@ -97,7 +114,7 @@ async def show_incidencias_list(update: Update, context: ContextTypes.DEFAULT_TY
     parts = query.data.split('_')
     incidencia_origen, estado = parts[2], parts[3]
 
-    all_incidencias = db.get_incidencias_by_estado([estado])
+    all_incidencias = await db.get_incidencias_by_estado([estado])
 
     # Definimos el título y filtramos las incidencias en un solo paso
     if incidencia_origen == 'tool':
@@ -197,7 +214,7 @@ async def start_dynamic_ubicacion_filter(update: Update, context: ContextTypes.D
     query = update.callback_query
     await query.answer()
 
-    hierarchy = db.get_distinct_ubicacion_tipos()
+    hierarchy = await db.get_distinct_ubicacion_tipos()
     if not hierarchy:
         await query.edit_message_text(
             "❌ Error: No hay tipos de ubicación definidos en la base de datos\\. No se puede filtrar\\.",
@@ -257,7 +274,7 @@ async def start_ubicacion_filter(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
     context.user_data['current_filter_level'] = level
-    ubicaciones = db.get_ubicaciones_by_tipo(level)
+    ubicaciones = await db.get_ubicaciones_by_tipo(level)
     
     keyboard = [[InlineKeyboardButton(ubic['nombre'], callback_data=f"select_ubic_{level}_{ubic['nombre']}")] for ubic in ubicaciones]
     
@@ -305,44 +322,70 @@ async def generate_csv_report(update: Update, context: ContextTypes.DEFAULT_TYPE
     filters = context.user_data.get('report_filters', {})
     start_date = context.user_data.get('report_start_date')
     end_date = context.user_data.get('report_end_date')
+    caption = "✅ Aquí tienes tu informe de avances en formato CSV."
     
-    avances = db.get_avances_for_report(filters, start_date, end_date)
-
-    if not avances:
-        summary_text = _build_filter_summary_text(context)
-        mensaje_error = f"✅ No se encontraron avances que coincidan con los filtros seleccionados\\.\n\n{summary_text}"
-        await query.edit_message_text(mensaje_error, reply_markup=get_main_menu_keyboard(), parse_mode='MarkdownV2')
-        return await back_to_main_menu(update, context)
+    # Mismo informe con los mismos datos: se reenvía el ya generado
+    cache_key = report_cache.report_key(
+        'avances', filters, start_date, end_date, 'csv', db_manager.get_data_version('avances', 'incidencias')
+    )
+    try:
+        if await _send_cached_report(context, query.from_user.id, cache_key, caption):
+            return await back_to_main_menu(update, context)
+    except Exception as e:
+        print(f"[ERROR] Fallo al reenviar el CSV cacheado: {e}")
 
-    await query.edit_message_text(f"✅ Se encontraron {len(avances)} registros. Generando el archivo CSV...")
+    async def work(job, job_context):
+        job.update("consultando avances")
+        csv_file, total = await report_jobs.run_blocking(
+            _write_avances_csv, filters, start_date, end_date,
+            lambda n: job.update(f"{n} avances procesados")
+        )
+        with csv_file:
+            if not total:
+                return "✅ No se encontraron avances que coincidan con los filtros seleccionados."
+            job.update(f"enviando {total} avances")
+            filename = f"informe_avances_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
+            await _send_report(job_context, job.chat_id, cache_key, csv_file, filename, caption)
+        return f"✅ Informe de avances CSV enviado ({total} registros)."
 
-    avance_ids = [a['id'] for a in avances]
-    incidencias_map = db.get_incidencias_for_avances(avance_ids)
+    return await _submit_report_job(update, context, "Avances (CSV)", work)
 
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_ALL)
+def _write_avances_csv(filters, start_date, end_date, on_progress=None):
+    """
+    Escribe el informe CSV de avances en un fichero temporal (en memoria hasta
+    REPORT_SPOOL_MAX_BYTES, luego en disco) leyendo en streaming la consulta que
+    ya une las incidencias. Devuelve (fichero, nº de avances).
+    on_progress(n) se llama cada REPORT_PROGRESS_ROWS avances; si lanza una
+    excepción (p. ej. informe cancelado) se aborta la escritura.
+    Se ejecuta en los hilos de report_jobs: todo el trabajo es síncrono.
+    """
+    csv_file = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_BYTES, mode='w+b')
+    text = io.TextIOWrapper(csv_file, encoding='utf-8', newline='')
+    writer = csv.writer(text, delimiter=';', quotechar='"', quoting=csv.QUOTE_ALL)
     
     headers = ["ID Avance", "Fecha Trabajo", "Ubicacion", "Trabajo", "Estado Avance", "Encargado", "ID Incidencia", "Fecha Incidencia", "Estado Incidencia", "Descripcion Incidencia"]
     writer.writerow(headers)
-    
-    for avance in avances:
-        incidencias = incidencias_map.get(avance['id'])
-        if incidencias:
-            for incidencia in incidencias:
-                writer.writerow([avance['id'], avance['fecha'].strftime('%Y-%m-%d'), avance['ubicacion'], avance['trabajo'], avance['estado'], avance['encargado_nombre'], incidencia['id'], incidencia['fecha'].strftime('%Y-%m-%d %H:%M'), incidencia['estado'], incidencia['descripcion']])
-        else:
-            writer.writerow([avance['id'], avance['fecha'].strftime('%Y-%m-%d'), avance['ubicacion'], avance['trabajo'], avance['estado'], avance['encargado_nombre'], "N/A", "N/A", "N/A", "N/A"])
-            
-    csv_content = output.getvalue()
-    output.seek(0)
-    csv_file = InputFile(csv_content.encode('utf-8'), filename=f"informe_avances_{datetime.now().strftime('%Y%m%d_%H%M')}.csv")
 
+    total = 0
+    last_avance_id = None
     try:
-        await context.bot.send_document(chat_id=query.from_user.id, document=csv_file, caption="✅ Aquí tienes tu informe de avances en formato CSV.")
-    except Exception as e:
-        await query.message.reply_text("❌ Ocurrió un error al intentar enviar el archivo.")
-    
-    return await back_to_main_menu(update, context)
+        for avance, incidencia in db_manager.iter_avance_incidencias_for_report(filters, start_date, end_date):
+            if avance['id'] != last_avance_id:
+                total += 1
+                last_avance_id = avance['id']
+                if on_progress and total % REPORT_PROGRESS_ROWS == 0:
+                    on_progress(total)
+            if incidencia:
+                writer.writerow([avance['id'], avance['fecha'].strftime('%Y-%m-%d'), avance['ubicacion'], avance['trabajo'], avance['estado'], avance['encargado_nombre'], incidencia['id'], incidencia['fecha'].strftime('%Y-%m-%d %H:%M'), incidencia['estado'], incidencia['descripcion']])
+            else:
+                writer.writerow([avance['id'], avance['fecha'].strftime('%Y-%m-%d'), avance['ubicacion'], avance['trabajo'], avance['estado'], avance['encargado_nombre'], "N/A", "N/A", "N/A", "N/A"])
+        text.flush()
+    except BaseException:
+        text.close()
+        raise
+    text.detach()  # El fichero binario sigue abierto para enviarlo
+    csv_file.seek(0)
+    return csv_file, total
 
 async def show_avances_list_paginated(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
@@ -395,7 +438,7 @@ async def prepare_avances_list(update: Update, context: ContextTypes.DEFAULT_TYP
     start_date = context.user_data.get('report_start_date')
     end_date = context.user_data.get('report_end_date')
 
-    avances = db.get_avances_for_report(filters, start_date, end_date)
+    avances = await db.get_avances_for_report(filters, start_date, end_date)
     
     context.user_data['informe_avances_results'] = avances
     context.user_data['avances_page'] = 0
@@ -418,7 +461,7 @@ async def show_avance_detail_from_informe(update: Update, context: ContextTypes.
     await query.answer()
     avance_id = int(query.data.split('_')[3])
     
-    details = db.get_avance_details(avance_id)
+    details = await db.get_avance_details(avance_id)
     if not details:
         await query.edit_message_text("❌ Error: No se encontraron los detalles.", reply_markup=get_main_menu_keyboard())
         return LISTING_AVANCES
@@ -431,11 +474,11 @@ async def show_avance_detail_from_informe(update: Update, context: ContextTypes.
         f"🗓️ *Fecha:* {details['fecha_trabajo'].strftime('%d/%m/%Y')}"
     )
     
-    # Enviar foto si existe
-    if details.get('foto_path') and os.path.exists(details['foto_path']):
+    # Enviar las fotos si existen (un solo álbum si son varias)
+    if details.get('foto_path'):
         try:
-            with open(details['foto_path'], 'rb') as photo_file:
-                await context.bot.send_photo(chat_id=query.from_user.id, photo=InputFile(photo_file))
+            fotos = await db.get_entity_photos('avance', details['id'])
+            await photo_store.send_photos(context.bot, query.from_user.id, fotos)
         except Exception as e:
             await query.message.reply_text(f"No se pudo cargar la foto: {e}")
 
@@ -494,7 +537,7 @@ async def process_personal_end_date(update: Update, context: ContextTypes.DEFAUL
         
         await update.callback_query.edit_message_text("Buscando registros...")
         
-        registros = db.get_personal_registros_for_report(start_date, end_date)
+        registros = await db.get_personal_registros_for_report(start_date, end_date)
         
         if not registros:
             await update.callback_query.edit_message_text("No se encontraron registros de personal en el rango de fechas seleccionado.")
@@ -528,6 +571,7 @@ async def ask_personal_report_format(update: Update, context: ContextTypes.DEFAU
         [InlineKeyboardButton("📋 Listar en el chat", callback_data="personal_show_list")],
         [InlineKeyboardButton("📄 Descargar .csv", callback_data="personal_generate_csv")],
         [InlineKeyboardButton("📄 Descargar .pdf", callback_data="personal_generate_pdf")], # BOTÓN AÑADIDO
+        [InlineKeyboardButton("🔔 Recibir periódicamente", callback_data="subscribe_personal")],
         [InlineKeyboardButton("⬅️ Menú Principal", callback_data="back_to_main_menu")]
     ]
     await query.edit_message_text(
@@ -592,35 +636,36 @@ async def generate_personal_csv_report(update: Update, context: ContextTypes.DEF
     start_date = context.user_data['report_start_date']
     end_date = registros[-1]['fecha']
     
+    csv_file = InputFile(_personal_csv_bytes(registros), filename=f"informe_personal_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.csv")
+    await context.bot.send_document(chat_id=update.effective_chat.id, document=csv_file, caption="Aquí tienes tu informe de personal.")
+    
+    return await back_to_main_menu(update, context)
+
+def _personal_csv_bytes(registros):
     output = io.StringIO()
     writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_ALL)
     writer.writerow(["Fecha", "En Obra", "Faltas", "Bajas", "Registrado Por"])
     for reg in registros:
         writer.writerow([reg['fecha'].strftime('%Y-%m-%d'), reg['en_obra'], reg['faltas'], reg['bajas'], reg['registrado_por']])
-    
-    output.seek(0)
-    csv_file = InputFile(output.getvalue().encode('utf-8'), filename=f"informe_personal_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.csv")
-    await context.bot.send_document(chat_id=update.effective_chat.id, document=csv_file, caption="Aquí tienes tu informe de personal.")
-    
-    return await back_to_main_menu(update, context)
+    return output.getvalue().encode('utf-8')
 
-async def generate_pdf_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    query = update.callback_query
-    await query.answer()
-    await query.edit_message_text("⏳ Procesando tu solicitud de PDF...")
-
-    filters = context.user_data.get('report_filters', {})
-    avances = db.get_avances_for_report(filters)
-
-    if not avances:
-        texto_filtros = ", ".join([f"'{escape(str(v))}'" for v in filters.values()])
-        mensaje_error = f"✅ No se encontraron avances que coincidan con los filtros seleccionados \\({texto_filtros}\\)\\."
-        await query.edit_message_text(mensaje_error, reply_markup=get_main_menu_keyboard(), parse_mode='MarkdownV2')
-        return await back_to_main_menu(update, context)
-
-    await query.edit_message_text(f"✅ Se encontraron {len(avances)} registros. Generando el archivo PDF...")
+def _personal_pdf_table(registros):
+    """Cabeceras, anchos de columna y filas de la tabla PDF del informe de personal."""
+    headers = ["Fecha", "En Obra", "Faltas", "Bajas", "Registrado Por"]
+    column_widths = [40, 40, 40, 40, 80]
+    table_data = []
+    for reg in registros:
+        table_data.append([
+            reg['fecha'].strftime('%d/%m/%Y'),
+            reg['en_obra'],
+            reg['faltas'],
+            reg['bajas'],
+            reg['registrado_por']
+        ])
+    return headers, column_widths, table_data
 
-    # Preparar datos para la tabla del PDF
+def _avances_pdf_table(avances):
+    """Cabeceras, anchos de columna y filas de la tabla PDF del informe de avances."""
     headers = ["Fecha", "Ubicación", "Trabajo", "Estado", "Encargado"]
     column_widths = [25, 80, 60, 30, 45]
     table_data = []
@@ -632,25 +677,47 @@ async def generate_pdf_report(update: Update, context: ContextTypes.DEFAULT_TYPE
             avance['estado'],
             avance['encargado_nombre']
         ])
+    return headers, column_widths, table_data
 
-    # Generar el PDF
-    pdf = PDFReport()
-    pdf_content = pdf.create_table_report(
-        table_data,
-        headers,
-        column_widths,
-        report_title="Informe de Avances de Obra"
-    )
-    
-    pdf_file = InputFile(pdf_content, filename=f"informe_avances_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf")
+async def generate_pdf_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text("⏳ Procesando tu solicitud de PDF...")
 
+    filters = context.user_data.get('report_filters', {})
+    caption = "✅ Aquí tienes tu informe de avances en formato PDF."
+
+    cache_key = report_cache.report_key(
+        'avances', filters, None, None, 'pdf', db_manager.get_data_version('avances')
+    )
     try:
-        await context.bot.send_document(chat_id=query.from_user.id, document=pdf_file, caption="✅ Aquí tienes tu informe de avances en formato PDF.")
+        if await _send_cached_report(context, query.from_user.id, cache_key, caption):
+            return await back_to_main_menu(update, context)
     except Exception as e:
-        print(f"[ERROR] Fallo al enviar el PDF: {e}")
-        await query.message.reply_text("❌ Ocurrió un error al intentar enviar el archivo PDF.")
-    
-    return await back_to_main_menu(update, context)
+        print(f"[ERROR] Fallo al reenviar el PDF cacheado: {e}")
+
+    async def work(job, job_context):
+        job.update("consultando avances")
+        avances = await db.get_avances_for_report(filters)
+        if not avances:
+            texto_filtros = ", ".join([f"'{v}'" for v in filters.values()])
+            return f"✅ No se encontraron avances que coincidan con los filtros seleccionados ({texto_filtros})."
+
+        headers, column_widths, table_data = _avances_pdf_table(avances)
+
+        # Generar el PDF (en el pool de procesos, sin bloquear al resto de usuarios)
+        pdf_content, error_text = await _render_pdf_for_job(
+            job, table_data, headers, column_widths, report_title="Informe de Avances de Obra"
+        )
+        if pdf_content is None:
+            return error_text
+
+        job.update(f"enviando {len(avances)} avances")
+        filename = f"informe_avances_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
+        await _send_report(job_context, job.chat_id, cache_key, pdf_content, filename, caption)
+        return f"✅ Informe de avances PDF enviado ({len(avances)} registros)."
+
+    return await _submit_report_job(update, context, "Avances (PDF)", work)
 
 async def generate_personal_pdf_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
@@ -661,33 +728,128 @@ async def generate_personal_pdf_report(update: Update, context: ContextTypes.DEF
     start_date = context.user_data['report_start_date']
     end_date = registros[-1]['fecha']
     
-    # Preparar datos para la tabla
-    headers = ["Fecha", "En Obra", "Faltas", "Bajas", "Registrado Por"]
-    column_widths = [40, 40, 40, 40, 80]
-    table_data = []
-    for reg in registros:
-        table_data.append([
-            reg['fecha'].strftime('%d/%m/%Y'),
-            reg['en_obra'],
-            reg['faltas'],
-            reg['bajas'],
-            reg['registrado_por']
-        ])
+    headers, column_widths, table_data = _personal_pdf_table(registros)
 
-    # Generar PDF
-    pdf = PDFReport()
-    pdf_content = pdf.create_table_report(
-        table_data,
-        headers,
-        column_widths,
-        report_title=f"Informe de Personal ({start_date.strftime('%d/%m/%y')} - {end_date.strftime('%d/%m/%y')})"
-    )
+    async def work(job, job_context):
+        pdf_content, error_text = await _render_pdf_for_job(
+            job, table_data, headers, column_widths,
+            report_title=f"Informe de Personal ({start_date.strftime('%d/%m/%y')} - {end_date.strftime('%d/%m/%y')})"
+        )
+        if pdf_content is None:
+            return error_text
 
-    pdf_file = InputFile(pdf_content, filename=f"informe_personal_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.pdf")
-    await context.bot.send_document(chat_id=update.effective_chat.id, document=pdf_file, caption="Aquí tienes tu informe de personal en formato PDF.")
-    
+        job.update("enviando")
+        pdf_file = InputFile(pdf_content, filename=f"informe_personal_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.pdf")
+        await job_context.bot.send_document(chat_id=job.chat_id, document=pdf_file, caption="Aquí tienes tu informe de personal en formato PDF.")
+
+    return await _submit_report_job(update, context, "Personal (PDF)", work)
+
+async def _send_cached_report(context, chat_id, cache_key, caption):
+    """
+    Reenvía un informe de report_cache: por file_id si ya se subió a Telegram, si no
+    desde el fichero en disco. Devuelve False si no está en caché.
+    """
+    entry = await asyncio.to_thread(report_cache.get, cache_key)
+    if not entry:
+        return False
+    if entry['file_id']:
+        try:
+            await context.bot.send_document(chat_id=chat_id, document=entry['file_id'], caption=caption)
+            return True
+        except telegram.error.BadRequest:
+            report_cache.forget_file_id(cache_key)
+    try:
+        with open(entry['path'], 'rb') as cached_file:
+            message = await context.bot.send_document(
+                chat_id=chat_id, document=InputFile(cached_file, filename=entry['filename']), caption=caption
+            )
+    except FileNotFoundError:
+        return False  # Expulsado de la caché entre get() y el envío
+    report_cache.remember_file_id(cache_key, message.document.file_id)
+    return True
+
+async def _send_report(context, chat_id, cache_key, content, filename, caption):
+    """Guarda un informe recién generado (bytes o fichero binario) en report_cache y lo envía."""
+    cached_path = await asyncio.to_thread(report_cache.put, cache_key, content, filename)
+    if cached_path is None:
+        if not isinstance(content, (bytes, bytearray)):
+            content.seek(0)
+        await context.bot.send_document(chat_id=chat_id, document=InputFile(content, filename=filename), caption=caption)
+        return
+    with open(cached_path, 'rb') as cached_file:
+        message = await context.bot.send_document(
+            chat_id=chat_id, document=InputFile(cached_file, filename=filename), caption=caption
+        )
+    report_cache.remember_file_id(cache_key, message.document.file_id)
+
+async def _render_pdf_for_job(job, table_data, headers, column_widths, report_title):
+    """
+    Renderiza el PDF en pdf_worker. Devuelve (bytes, None), o (None, texto para el
+    mensaje de estado) si la cola está llena o tarda demasiado.
+    """
+    job.update(f"generando PDF de {len(table_data)} filas")
+    try:
+        return await pdf_worker.render_table_report(table_data, headers, column_widths, report_title=report_title), None
+    except pdf_worker.PDFQueueFull:
+        return None, "⏳ Hay muchos informes generándose ahora mismo. Inténtalo de nuevo en unos minutos."
+    except pdf_worker.PDFRenderTimeout:
+        return None, "❌ El informe es demasiado grande y no se pudo generar a tiempo. Prueba con filtros más concretos."
+
+# =============================================================================
+# INFORMES EN SEGUNDO PLANO (ver report_jobs)
+# =============================================================================
+
+async def _submit_report_job(update: Update, context: ContextTypes.DEFAULT_TYPE, title, work) -> int:
+    """Encola el informe y vuelve al menú; el documento llega al chat cuando está listo."""
+    query = update.callback_query
+    try:
+        await report_jobs.submit(context, query.from_user.id, query.from_user.id, title, work)
+    except report_jobs.TooManyJobs:
+        await query.message.reply_text(
+            f"⏳ Ya tienes {report_jobs.REPORT_JOBS_PER_USER} informes en preparación. "
+            "Espera a que terminen o cancela alguno desde «Mis informes en curso»."
+        )
     return await back_to_main_menu(update, context)
 
+async def show_report_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Lista los informes en cola o en curso del usuario con un botón para cancelar cada uno."""
+    query = update.callback_query
+    await query.answer()
+
+    jobs = report_jobs.list_jobs(query.from_user.id)
+    keyboard = [
+        [InlineKeyboardButton(f"✖️ Cancelar #{job.id} · {job.title}", callback_data=f"report_jobs_list_cancel_{job.id}")]
+        for job in jobs if not job.cancelled
+    ]
+    keyboard.append([InlineKeyboardButton("⬅️ Menú Principal", callback_data="back_to_main_menu")])
+
+    if jobs:
+        text = "⏳ Tus informes en preparación:\n\n" + "\n\n".join(job.status_text() for job in jobs)
+    else:
+        text = "✅ No tienes informes en preparación."
+    try:
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    except telegram.error.BadRequest as e:
+        if "Message is not modified" not in str(e): raise
+
+async def cancel_report_job(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Cancela un informe desde su mensaje de estado o desde la lista de informes en curso."""
+    query = update.callback_query
+    job_id = int(query.data.rsplit('_', 1)[1])
+    if not report_jobs.cancel(job_id, query.from_user.id):
+        await query.answer("Ese informe ya ha terminado.")
+    elif query.data.startswith("report_jobs_list_"):
+        await show_report_jobs(update, context)
+    else:
+        await query.answer("Cancelando el informe...")
+
+def get_report_jobs_handlers():
+    """Handlers globales: los mensajes de estado siguen activos cuando la conversación ya terminó."""
+    return [
+        CallbackQueryHandler(show_report_jobs, pattern='^report_jobs_list$'),
+        CallbackQueryHandler(cancel_report_job, pattern=r'^report_job(s_list)?_cancel_\d+$'),
+    ]
+
 def _build_filter_summary_text(context: ContextTypes.DEFAULT_TYPE) -> str:
     """Crea un texto que resume los filtros activos."""
     filters = context.user_data.get('report_filters', {})
@@ -772,6 +934,7 @@ async def ask_report_format(update: Update, context: ContextTypes.DEFAULT_TYPE)
         [InlineKeyboardButton("📋 Ver como Lista", callback_data="show_list")],
         [InlineKeyboardButton("📄 Generar CSV", callback_data="generate_csv")],
         [InlineKeyboardButton("📄 Generar PDF", callback_data="generate_pdf")],
+        [InlineKeyboardButton("🔔 Recibir periódicamente", callback_data="subscribe_avances")],
         [InlineKeyboardButton("⏪ Volver a Filtros", callback_data="back_to_filter_type")]
     ]
     
@@ -782,6 +945,184 @@ async def ask_report_format(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
     return SELECTING_FORMAT
 
+# =============================================================================
+# INFORMES PROGRAMADOS (SUSCRIPCIONES)
+# =============================================================================
+
+_TIPOS_INFORME = {'avances': "Avances de obra", 'personal': "Personal"}
+
+def _describe_subscription(sub):
+    text = f"{_TIPOS_INFORME.get(sub['tipo_informe'], sub['tipo_informe'])} · {sub['periodicidad']} · {sub['formato'].upper()}"
+    if sub['filtros']:
+        text += " · " + ", ".join(str(v) for v in sub['filtros'].values())
+    return text
+
+async def ask_subscription_options(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Ofrece recibir el informe actual (mismos filtros, sin fechas) cada semana o cada mes."""
+    query = update.callback_query
+    await query.answer()
+    tipo = query.data.split('_')[1]
+
+    keyboard = [
+        [InlineKeyboardButton("🗓️ Semanal · CSV", callback_data=f"sub_new_{tipo}_semanal_csv"),
+         InlineKeyboardButton("🗓️ Semanal · PDF", callback_data=f"sub_new_{tipo}_semanal_pdf")],
+        [InlineKeyboardButton("📅 Mensual · CSV", callback_data=f"sub_new_{tipo}_mensual_csv"),
+         InlineKeyboardButton("📅 Mensual · PDF", callback_data=f"sub_new_{tipo}_mensual_pdf")],
+        [InlineKeyboardButton("⬅️ Menú Principal", callback_data="back_to_main_menu")]
+    ]
+    text = (
+        "🔔 *Informe programado*\n\n"
+        "Los informes semanales se envían los lunes con la semana anterior y los mensuales "
+        "el día 1 con el mes anterior\\. Elige periodicidad y formato:"
+    )
+    if tipo == 'avances':
+        text = f"{_build_filter_summary_text(context)}\n\n{text}"
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='MarkdownV2')
+    return SELECTING_SUBSCRIPTION
+
+async def save_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    _, _, tipo, periodicidad, formato = query.data.split('_')
+    filtros = context.user_data.get('report_filters', {}) if tipo == 'avances' else {}
+
+    created = await db.add_report_subscription(query.from_user.id, tipo, periodicidad, formato, filtros)
+    if created:
+        text = f"✅ Recibirás este informe {periodicidad} en formato {formato.upper()}."
+    else:
+        text = "ℹ️ Ya estabas suscrito a este informe."
+    await query.edit_message_text(text, reply_markup=get_main_menu_keyboard())
+    return ConversationHandler.END
+
+async def show_report_subscriptions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Lista los informes programados del usuario con un botón para darse de baja."""
+    query = update.callback_query
+    await query.answer()
+
+    subs = await db.get_report_subscriptions(user_id=query.from_user.id)
+    keyboard = [
+        [InlineKeyboardButton(f"🗑️ {_describe_subscription(sub)}", callback_data=f"report_sub_delete_{sub['id']}")]
+        for sub in subs
+    ]
+    keyboard.append([InlineKeyboardButton("⬅️ Menú Principal", callback_data="back_to_main_menu")])
+
+    if subs:
+        text = "🔔 Tus informes programados (pulsa uno para darte de baja):"
+    else:
+        text = "No tienes informes programados. Puedes suscribirte al elegir el formato de un informe."
+    try:
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    except telegram.error.BadRequest as e:
+        if "Message is not modified" not in str(e): raise
+
+async def delete_report_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    subscription_id = int(query.data.rsplit('_', 1)[1])
+    await db.delete_report_subscription(subscription_id, query.from_user.id)
+    await show_report_subscriptions(update, context)
+
+def get_report_subscription_handlers():
+    """Handlers globales para gestionar las suscripciones desde el menú de informes."""
+    return [
+        CallbackQueryHandler(show_report_subscriptions, pattern='^report_subs_list$'),
+        CallbackQueryHandler(delete_report_subscription, pattern=r'^report_sub_delete_\d+$'),
+    ]
+
+def _scheduled_period(periodicidad, today):
+    """Periodo cerrado que toca enviar hoy: (inicio, fin), o None si hoy no corresponde."""
+    if periodicidad == 'semanal' and today.weekday() == 0:
+        return today - timedelta(days=7), today - timedelta(days=1)
+    if periodicidad == 'mensual' and today.day == 1:
+        end = today - timedelta(days=1)
+        return end.replace(day=1), end
+    return None
+
+async def _build_scheduled_report(tipo, formato, filtros, start_date, end_date):
+    """Genera el informe del periodo. Devuelve (bytes o fichero, nombre) o None si no hay datos."""
+    suffix = f"{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.{formato}"
+    if tipo == 'avances' and formato == 'csv':
+        csv_file, total = await report_jobs.run_blocking(_write_avances_csv, filtros, start_date, end_date)
+        if not total:
+            csv_file.close()
+            return None
+        return csv_file, f"informe_avances_{suffix}"
+
+    if tipo == 'avances':
+        rows = await db.get_avances_for_report(filtros, start_date, end_date)
+        headers, column_widths, table_data = _avances_pdf_table(rows)
+        title = "Informe de Avances de Obra"
+    else:
+        rows = await db.get_personal_registros_for_report(start_date, end_date)
+        if rows and formato == 'csv':
+            return _personal_csv_bytes(rows), f"informe_personal_{suffix}"
+        headers, column_widths, table_data = _personal_pdf_table(rows)
+        title = "Informe de Personal"
+    if not rows:
+        return None
+    title += f" ({start_date.strftime('%d/%m/%y')} - {end_date.strftime('%d/%m/%y')})"
+    content = await pdf_worker.render_table_report(table_data, headers, column_widths, report_title=title)
+    return content, f"informe_{tipo}_{suffix}"
+
+async def _deliver_scheduled_report(context, tipo, formato, filtros, periodicidad, start_date, end_date, user_ids):
+    """Genera una sola vez el informe de un grupo de suscriptores y se lo envía a todos."""
+    caption = (
+        f"🔔 Informe {periodicidad} de {_TIPOS_INFORME[tipo].lower()} "
+        f"({start_date.strftime('%d/%m/%Y')} - {end_date.strftime('%d/%m/%Y')})"
+    )
+    # El periodo ya está cerrado: la clave no depende de la versión de los datos
+    cache_key = report_cache.report_key(f"programado_{tipo}", filtros, start_date, end_date, formato, periodicidad)
+
+    content = filename = None
+    if not await asyncio.to_thread(report_cache.get, cache_key):
+        report = await _build_scheduled_report(tipo, formato, filtros, start_date, end_date)
+        if report is None:
+            for user_id in user_ids:
+                await context.bot.send_message(chat_id=user_id, text=f"{caption}\n\nNo hay registros en este periodo.")
+            return
+        content, filename = report
+        cached = await asyncio.to_thread(report_cache.put, cache_key, content, filename)
+        if not isinstance(content, (bytes, bytearray)):
+            # Sin caché hay que reenviar el contenido a cada suscriptor: se lee a memoria
+            with content:
+                content.seek(0)
+                content = None if cached else content.read()
+
+    # El primer envío sube el fichero; el resto reutiliza su file_id
+    for user_id in user_ids:
+        try:
+            if await _send_cached_report(context, user_id, cache_key, caption):
+                continue
+            if content is not None:
+                await context.bot.send_document(chat_id=user_id, document=InputFile(content, filename=filename), caption=caption)
+        except telegram.error.TelegramError as e:
+            print(f"[ERROR] No se pudo enviar el informe programado a {user_id}: {e}")
+
+async def send_scheduled_reports(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Tarea diaria del JobQueue (fuera de hora punta). Los lunes envía los informes
+    semanales y el día 1 los mensuales. Las suscripciones con el mismo informe
+    (tipo, formato y filtros) se agrupan: cada informe se genera una sola vez.
+    """
+    today = date.today()
+    for periodicidad in ('semanal', 'mensual'):
+        period = _scheduled_period(periodicidad, today)
+        if period is None:
+            continue
+        groups = {}
+        for sub in await db.get_report_subscriptions(periodicidad=periodicidad):
+            key = (sub['tipo_informe'], sub['formato'], json.dumps(sub['filtros'], sort_keys=True))
+            groups.setdefault(key, []).append(sub)
+
+        for (tipo, formato, _), subs in groups.items():
+            try:
+                await _deliver_scheduled_report(
+                    context, tipo, formato, subs[0]['filtros'], periodicidad, *period,
+                    [sub['user_id'] for sub in subs]
+                )
+            except Exception as e:
+                print(f"[ERROR] Fallo al generar el informe programado {tipo}/{formato} ({periodicidad}): {e}")
+        print(f"INFO: Informes {periodicidad}es enviados: {len(groups)} informes distintos.")
+
 # =============================================================================
 # CONVERSATION HANDLER
 # =============================================================================
@@ -823,6 +1164,7 @@ def get_informes_conversation_handler():
                 CallbackQueryHandler(prepare_avances_list, pattern='^show_list$'),
                 CallbackQueryHandler(generate_csv_report, pattern='^generate_csv$'),
                 CallbackQueryHandler(generate_pdf_report, pattern='^generate_pdf$'),
+                CallbackQueryHandler(ask_subscription_options, pattern='^subscribe_avances$'),
                 CallbackQueryHandler(select_avance_filter_type, pattern='^back_to_filter_type$')
             ],
             LISTING_AVANCES: [
@@ -844,7 +1186,11 @@ def get_informes_conversation_handler():
             SELECTING_PERSONAL_FORMAT: [
                 CallbackQueryHandler(show_personal_list_paginated, pattern='^personal_show_list$'),
                 CallbackQueryHandler(generate_personal_csv_report, pattern='^personal_generate_csv$'),
-                CallbackQueryHandler(generate_personal_pdf_report, pattern='^personal_generate_pdf$')
+                CallbackQueryHandler(generate_personal_pdf_report, pattern='^personal_generate_pdf$'),
+                CallbackQueryHandler(ask_subscription_options, pattern='^subscribe_personal$')
+            ],
+            SELECTING_SUBSCRIPTION: [
+                CallbackQueryHandler(save_subscription, pattern='^sub_new_')
             ],
             LISTING_PERSONAL: [
                 CallbackQueryHandler(change_personal_list_page, pattern='^personal_pag_'),
@@ -0,0 +1,95 @@
+"""
+Acceso asíncrono a la base de datos para los handlers de Telegram.
+
+Las funciones de db_manager / db_adapter son síncronas (psycopg2 / sqlite3).
+Llamarlas directamente desde un `async def` bloquea el event loop de PTB para
+todos los usuarios mientras dura la consulta. Este módulo las ejecuta en un
+pool de hilos acotado para que los handlers puedan hacer `await`.
+
+Ruta de migración de un módulo de handlers:
+
+    import db_manager
+    from db_async import AsyncDB
+
+    db = AsyncDB(db_manager)
+    ...
+    details = await db.get_pedido_details(pedido_id)
+
+Cada `db.funcion(...)` pasa a ser `await db.funcion(...)`; la firma y el
+valor devuelto no cambian. Para llamadas sueltas también existe `run_db`.
+"""
+import os
+import asyncio
+import logging
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Hilos dedicados a la BD. Conviene que no supere POOL_SIZE + MAX_OVERFLOW
+# del pool de conexiones, o los hilos sobrantes esperarán conexión libre.
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", os.getenv("MAX_WORKERS", "4")))
+# Máximo de llamadas en vuelo (ejecutándose + en cola) antes de que los
+# handlers esperen turno en el propio event loop.
+DB_MAX_PENDING = int(os.getenv("DB_MAX_PENDING", "64"))
+
+_executor = None
+_pending = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
+        logger.info(f"🔄 Executor de BD iniciado con {DB_MAX_WORKERS} hilos")
+    return _executor
+
+
+def _get_semaphore():
+    global _pending
+    if _pending is None:
+        _pending = asyncio.Semaphore(DB_MAX_PENDING)
+    return _pending
+
+
+async def run_db(func, *args, **kwargs):
+    """Ejecuta una función síncrona de BD en el executor y espera su resultado."""
+    loop = asyncio.get_running_loop()
+    # Se propaga el contexto (contextvars) del handler al hilo de la BD
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    async with _get_semaphore():
+        return await loop.run_in_executor(_get_executor(), call)
+
+
+class AsyncDB:
+    """
+    Envuelve un módulo de acceso a datos y expone sus funciones como corrutinas.
+    Los atributos que no son funciones (p. ej. USE_SQLITE) se devuelven tal cual.
+    """
+
+    def __init__(self, module):
+        self._module = module
+
+    def __getattr__(self, name):
+        attr = getattr(self._module, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await run_db(attr, *args, **kwargs)
+
+        # Se guarda para no recrear el envoltorio en cada llamada
+        setattr(self, name, wrapper)
+        return wrapper
+
+
+def shutdown():
+    """Detiene el executor de BD esperando a que terminen las consultas en curso."""
+    global _executor, _pending
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    _pending = None
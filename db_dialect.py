@@ -0,0 +1,114 @@
+"""
+Compilador de dialectos SQL para la capa de datos.
+
+Las consultas de db_manager se escriben una sola vez en sintaxis PostgreSQL
+(placeholders `%s`, `= ANY(%s)`, `NOW()`, `STRING_AGG`...). Este módulo las
+traduce al dialecto del backend activo y prepara la adaptación de parámetros.
+Cada sentencia se compila una única vez y queda en caché; las siguientes
+ejecuciones solo aplican los adaptadores de parámetros ya calculados.
+"""
+import os
+import re
+import json
+from functools import lru_cache
+
+POSTGRES = "postgres"
+SQLITE = "sqlite"
+
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "512"))
+
+# Literales entre comillas simples: nunca se tocan al traducir
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+
+# Marcadores internos durante la compilación
+_PARAM = "\x00P\x00"
+_JSON_PARAM = "\x00J\x00"
+_MARKER_RE = re.compile("\x00([PJ])\x00")
+
+# Reescrituras PostgreSQL -> SQLite (sobre el texto fuera de literales)
+_SQLITE_REWRITES = [
+    # columna = ANY(%s) con una lista -> IN sobre json_each
+    (re.compile(r"=\s*ANY\s*\(\s*%s\s*\)", re.IGNORECASE), f"IN (SELECT value FROM json_each({_JSON_PARAM}))"),
+    # columna [NOT] IN %s con una tupla -> IN sobre json_each
+    (re.compile(r"\bIN\s+%s", re.IGNORECASE), f"IN (SELECT value FROM json_each({_JSON_PARAM}))"),
+    (re.compile(r"\bNOW\(\)", re.IGNORECASE), "CURRENT_TIMESTAMP"),
+    (re.compile(r"\bCURRENT_DATE\b", re.IGNORECASE), "date('now', 'localtime')"),
+    (re.compile(r"\bSTRING_AGG\(", re.IGNORECASE), "GROUP_CONCAT("),
+    # Agregación JSON (las funciones JSON1 de SQLite devuelven el texto JSON)
+    (re.compile(r"\bJSON_AGG\(", re.IGNORECASE), "json_group_array("),
+    (re.compile(r"\bJSON_BUILD_OBJECT\(", re.IGNORECASE), "json_object("),
+    (re.compile(r"\bILIKE\b", re.IGNORECASE), "LIKE"),
+    (re.compile(r"::\w+"), ""),
+    (re.compile(r"%s"), _PARAM),
+    (re.compile(r"%%"), "%"),
+]
+
+
+def _to_json_array(value):
+    """Adapta una lista/tupla de Python a un array JSON para json_each()."""
+    return json.dumps(list(value), default=str)
+
+
+class CompiledStatement:
+    """Sentencia ya traducida al dialecto, con sus adaptadores de parámetros."""
+
+    __slots__ = ("source", "sql", "dialect", "adapters")
+
+    def __init__(self, source, sql, dialect, adapters):
+        self.source = source
+        self.sql = sql
+        self.dialect = dialect
+        # Tupla con un adaptador (o None) por parámetro; vacía si no hace falta adaptar
+        self.adapters = adapters
+
+    def adapt(self, params):
+        """Devuelve los parámetros listos para el driver."""
+        if params is None or not self.adapters or isinstance(params, dict):
+            return params
+        return tuple(
+            adapter(value) if adapter is not None else value
+            for adapter, value in zip(self.adapters, params)
+        )
+
+
+def _compile_sqlite(sql):
+    parts = []
+    last = 0
+    for match in _LITERAL_RE.finditer(sql):
+        parts.append((sql[last:match.start()], False))
+        parts.append((match.group(0), True))
+        last = match.end()
+    parts.append((sql[last:], False))
+
+    translated = []
+    for text, is_literal in parts:
+        if not is_literal:
+            for pattern, replacement in _SQLITE_REWRITES:
+                text = pattern.sub(replacement, text)
+        translated.append(text)
+    sql = "".join(translated)
+
+    adapters = []
+    for match in _MARKER_RE.finditer(sql):
+        adapters.append(_to_json_array if match.group(1) == "J" else None)
+    sql = _MARKER_RE.sub("?", sql)
+
+    if not any(adapters):
+        adapters = []
+    return sql, tuple(adapters)
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def compile_statement(sql, dialect):
+    """Compila (y cachea) una sentencia escrita en sintaxis PostgreSQL."""
+    if dialect == SQLITE:
+        compiled_sql, adapters = _compile_sqlite(sql)
+    else:
+        compiled_sql, adapters = sql, ()
+    return CompiledStatement(sql, compiled_sql, dialect, adapters)
+
+
+def statement_cache_info():
+    """Aciertos/fallos de la caché de sentencias compiladas."""
+    info = compile_statement.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
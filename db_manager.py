@@ -1,37 +1,430 @@
-import psycopg2
-import os
-from datetime import datetime
 """
-DB_NAME = "telegrambot"
-DB_USER = "postgres"
-DB_PASS = "--"
-DB_HOST = "localhost"
-DB_PORT = "5432" 
-""" # Añadido puerto 5433 Nico
+Capa de acceso a datos única del bot.
+
+Todas las funciones escriben su SQL en sintaxis PostgreSQL y se ejecutan
+igual sobre PostgreSQL o SQLite (USE_SQLITE=true): db_dialect compila cada
+sentencia para el backend activo una sola vez y la guarda en caché.
+Las filas se pueden leer por posición (row[0]) o por nombre (row['id']).
+"""
+import os
+import json
+import sqlite3
+import logging
+import time
+import threading
+from datetime import datetime, date
+from pathlib import Path
+
+import db_pool
+import db_dialect
+import db_metrics
+
+logger = logging.getLogger(__name__)
+
+USE_SQLITE = os.getenv("USE_SQLITE", "false").lower() == "true"
+SQLITE_PATH = Path(__file__).parent / 'data' / 'bot_telegram.db'
+# Ajustes del modo SQLite (WAL + una conexión persistente por hilo)
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # ms esperando un bloqueo
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+DIALECT = db_dialect.SQLITE if USE_SQLITE else db_dialect.POSTGRES
+# Filas que trae cada viaje al servidor en las consultas en streaming (informes)
+REPORT_STREAM_BATCH = int(os.getenv("REPORT_STREAM_BATCH", "2000"))
+
+if not USE_SQLITE:
+    import psycopg2
+    import psycopg2.extras
+
 DB_NAME = os.getenv("POSTGRES_DB", "telegrambot")
 DB_USER = os.getenv("POSTGRES_USER", "postgres")
 DB_PASS = os.getenv("POSTGRES_PASSWORD", "contraseña CAMBIAR") #TODO
 DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
 DB_PORT = os.getenv("POSTGRES_PORT", "5432") # Añadido puerto 5433 Nico
+CONNECTION_TIMEOUT = int(os.getenv("CONNECTION_TIMEOUT", "30"))
+
+# Excepciones del backend activo, para capturarlas sin depender del driver
+if USE_SQLITE:
+    IntegrityError = sqlite3.IntegrityError
+    DatabaseError = sqlite3.Error
+else:
+    IntegrityError = psycopg2.IntegrityError
+    DatabaseError = psycopg2.Error
+
+# =============================================================================
+# CONEXIONES Y EJECUCIÓN DE SENTENCIAS
+# =============================================================================
+
+class Cursor:
+    """Cursor que compila cada sentencia al dialecto activo antes de ejecutarla."""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def execute(self, sql, params=None):
+        stmt = db_dialect.compile_statement(sql, DIALECT)
+        start = time.perf_counter()
+        try:
+            if params is None:
+                self._raw.execute(stmt.sql)
+            else:
+                self._raw.execute(stmt.sql, stmt.adapt(params))
+        except Exception:
+            db_metrics.record_query(sql, params, (time.perf_counter() - start) * 1000, error=True)
+            raise
+        db_metrics.record_query(sql, params, (time.perf_counter() - start) * 1000, max(self._raw.rowcount, 0))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        stmt = db_dialect.compile_statement(sql, DIALECT)
+        seq_of_params = [stmt.adapt(params) for params in seq_of_params]
+        start = time.perf_counter()
+        try:
+            self._raw.executemany(stmt.sql, seq_of_params)
+        except Exception:
+            db_metrics.record_query(sql, None, (time.perf_counter() - start) * 1000, error=True)
+            raise
+        db_metrics.record_query(sql, None, (time.perf_counter() - start) * 1000, max(self._raw.rowcount, 0))
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._raw.close()
+        return False
+
+
+class Connection:
+    """Conexión independiente del backend: cursor() devuelve un Cursor compilador."""
+
+    def __init__(self, raw, shared=False):
+        self._raw = raw
+        # Las conexiones SQLite son persistentes por hilo: close() no las cierra
+        self._shared = shared
+
+    def cursor(self, name=None, itersize=None):
+        """
+        Con `name` (solo PostgreSQL) abre un cursor de servidor: al iterarlo trae
+        las filas de `itersize` en `itersize` en lugar de todo el resultado.
+        En SQLite iterar el cursor ya avanza la sentencia fila a fila.
+        """
+        if USE_SQLITE:
+            return Cursor(self._raw.cursor())
+        if name:
+            raw = self._raw.cursor(name, cursor_factory=psycopg2.extras.DictCursor)
+            raw.itersize = itersize or REPORT_STREAM_BATCH
+            return Cursor(raw)
+        return Cursor(self._raw.cursor(cursor_factory=psycopg2.extras.DictCursor))
+
+    def close(self):
+        if self._raw is None:
+            return
+        raw, self._raw = self._raw, None
+        if self._shared:
+            # Igual que al devolver al pool: no dejar transacciones abiertas
+            if raw.in_transaction:
+                raw.rollback()
+        else:
+            raw.close()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._raw.commit()
+        else:
+            self._raw.rollback()
+        return False
+
+
+def _connect():
+    """Abre una conexión física nueva a PostgreSQL (la usa el pool)."""
+    return psycopg2.connect(
+        dbname=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT,
+        connect_timeout=CONNECTION_TIMEOUT
+    )
+
+# Conexiones SQLite: una por hilo, abiertas la primera vez y reutilizadas
+_sqlite_local = threading.local()
+_sqlite_connections = set()
+_sqlite_lock = threading.Lock()
+_sqlite_ready_paths = set()
+
+def _connect_sqlite(path):
+    """Abre una conexión SQLite ajustada (WAL) que devuelve fechas como date/datetime."""
+    path = Path(path)
+    if path not in _sqlite_ready_paths:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _sqlite_ready_paths.add(path)
+    conn = sqlite3.connect(
+        str(path),
+        timeout=SQLITE_BUSY_TIMEOUT / 1000,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False,  # Solo la usa su hilo; se permite cerrarla al apagar
+    )
+    conn.row_factory = sqlite3.Row  # Acceso por posición y por nombre de columna
+    # WAL: los lectores no bloquean al escritor ni al revés
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def _get_sqlite_connection():
+    """Devuelve la conexión SQLite persistente del hilo actual."""
+    path = Path(SQLITE_PATH)
+    conn = getattr(_sqlite_local, 'conn', None)
+    if conn is not None and _sqlite_local.path == path and conn in _sqlite_connections:
+        if conn.in_transaction:
+            # Un llamador anterior del hilo no cerró su conexión: sus cambios sin
+            # confirmar se descartan (como al abrir una conexión nueva), nunca se
+            # confirman con la siguiente escritura
+            logger.warning("⚠️ Transacción SQLite sin cerrar descartada")
+            conn.rollback()
+        return conn
+    if conn is not None:
+        _close_sqlite(conn)
+    conn = _connect_sqlite(path)
+    _sqlite_local.conn, _sqlite_local.path = conn, path
+    with _sqlite_lock:
+        _sqlite_connections.add(conn)
+    return conn
+
+def _close_sqlite(conn):
+    with _sqlite_lock:
+        _sqlite_connections.discard(conn)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
 
 def get_connection():
-    """Establece y devuelve una conexión con la base de datos."""
-    return psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT)
+    """
+    Devuelve una conexión con la base de datos activa.
+    En PostgreSQL sale del pool compartido y conn.close() la devuelve al pool.
+    En SQLite es la conexión persistente del hilo y conn.close() solo cierra
+    la transacción pendiente.
+    """
+    if USE_SQLITE:
+        return Connection(_get_sqlite_connection(), shared=True)
+    pool = db_pool.get_pool((DB_NAME, DB_USER, DB_HOST, DB_PORT), _connect)
+    return Connection(pool.getconn())
+
+def close_all_connections():
+    """Cierra las conexiones persistentes (pools PostgreSQL y conexiones SQLite)."""
+    db_pool.close_all_pools()
+    with _sqlite_lock:
+        connections = list(_sqlite_connections)
+    for conn in connections:
+        _close_sqlite(conn)
+    _sqlite_local.__dict__.clear()
+
+def get_pool_stats():
+    """Devuelve las métricas del pool de conexiones (checkouts, esperas, timeouts...)."""
+    if USE_SQLITE:
+        return {}
+    return db_pool.get_pool_stats()
+
+def execute_query(query, params=None, fetch_one=False, fetch_all=False):
+    """
+    Ejecuta una sentencia en cualquiera de los dos backends.
+    Devuelve un dict (fetch_one), una lista de dicts (fetch_all) o el rowcount.
+    Las escrituras se confirman también cuando devuelven filas (INSERT ... RETURNING).
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query, params or None)
+            if fetch_one:
+                result = cur.fetchone()
+                result = dict(result) if result else None
+            elif fetch_all:
+                result = [dict(row) for row in cur.fetchall()]
+            else:
+                result = cur.rowcount
+            if not (fetch_one or fetch_all) or not query.lstrip().upper().startswith(("SELECT", "WITH")):
+                conn.commit()
+            return result
+    finally:
+        conn.close()
+
+# Totales de los listados paginados: se cachean unos segundos y se invalidan
+# al escribir en la tabla, para no lanzar un COUNT(*) en cada cambio de página.
+COUNT_CACHE_TTL = int(os.getenv("COUNT_CACHE_TTL", "60"))
+_count_cache = {}  # (tabla, clave) -> (instante de caducidad, total)
+_count_cache_lock = threading.Lock()
+
+def _cached_count(table, key, sql, params=None):
+    """Devuelve el COUNT(*) de `sql`, reutilizando el valor cacheado si no ha caducado."""
+    now = time.monotonic()
+    with _count_cache_lock:
+        entry = _count_cache.get((table, key))
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    result = execute_query(sql, params, fetch_one=True)
+    total = list(result.values())[0] if result else 0
+    with _count_cache_lock:
+        _count_cache[(table, key)] = (now + COUNT_CACHE_TTL, total)
+    return total
+
+def _invalidate_counts(table):
+    """Descarta los totales cacheados de una tabla tras una escritura."""
+    with _count_cache_lock:
+        for cache_key in [k for k in _count_cache if k[0] == table]:
+            del _count_cache[cache_key]
+
+# Versión de los datos por tabla: sube con cada escritura hecha desde el bot.
+# La usa report_cache para no servir un informe generado con datos anteriores.
+# El prefijo de arranque evita reutilizar informes de una ejecución previa.
+_DATA_VERSION_BOOT = format(int(time.time()), "x")
+_data_versions = {}
+_data_versions_lock = threading.Lock()
+
+def _bump_data_version(table):
+    with _data_versions_lock:
+        _data_versions[table] = _data_versions.get(table, 0) + 1
+
+def get_data_version(*tables):
+    """Sello de versión de los datos de las tablas indicadas (cambia tras cualquier escritura en ellas)."""
+    with _data_versions_lock:
+        parts = [str(_data_versions.get(table, 0)) for table in tables]
+    return _DATA_VERSION_BOOT + ":" + ".".join(parts)
+
+def _keyset_page(rows, items_per_page, after, before):
+    """
+    Recorta una página leída con LIMIT items_per_page + 1 y calcula si hay
+    páginas antes y después. Con `before` las filas llegan en orden inverso.
+    """
+    has_more = len(rows) > items_per_page
+    rows = rows[:items_per_page]
+    if before is not None:
+        rows.reverse()
+        return rows, True, has_more
+    return rows, has_more, after is not None
+
+def _json_list(value):
+    """Lista desde una columna JSON agregada (psycopg2 ya la decodifica; SQLite da texto)."""
+    if value is None:
+        return []
+    if isinstance(value, (bytes, str)):
+        return json.loads(value)
+    return value
+
+def _json_timestamp(value):
+    """Fecha/hora de un valor dentro de un JSON agregado (llega como texto ISO)."""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
 
 # =============================================================================
 # FUNCIONES DE USUARIOS
 # =============================================================================
 
+# Caché de usuarios en memoria para las comprobaciones de rol de cada update.
+# Guarda también los IDs desconocidos (None) para no consultar en cada mensaje
+# de alguien no registrado. Se invalida en cada escritura sobre usuarios.
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "1000"))
+_user_cache = {}  # user_id -> (instante de caducidad, detalles o None)
+_user_cache_lock = threading.Lock()
+_user_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+_user_cache_generation = 0  # cambia en cada invalidación: evita guardar lecturas ya obsoletas
+
+def _user_row_to_dict(row):
+    return {"id": row[0], "name": row[1], "username": row[2], "role": row[3]}
+
+def _cache_users(details_by_id, generation):
+    expires = time.monotonic() + USER_CACHE_TTL
+    with _user_cache_lock:
+        if generation != _user_cache_generation:
+            return
+        for user_id, details in details_by_id.items():
+            _user_cache.pop(user_id, None)
+            _user_cache[user_id] = (expires, details)
+        while len(_user_cache) > USER_CACHE_MAX_SIZE:
+            # Los dict conservan el orden de inserción: se descarta el más antiguo
+            _user_cache.pop(next(iter(_user_cache)))
+            _user_cache_stats['evictions'] += 1
+
+def invalidate_user_cache(user_id=None):
+    """Descarta un usuario de la caché (o todos si no se indica ID)."""
+    global _user_cache_generation
+    with _user_cache_lock:
+        _user_cache_generation += 1
+        if user_id is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(user_id, None)
+        _user_cache_stats['invalidations'] += 1
+
+def get_user_cache_stats():
+    """Aciertos, fallos y tamaño de la caché de usuarios."""
+    with _user_cache_lock:
+        stats = dict(_user_cache_stats)
+        stats['size'] = len(_user_cache)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    return stats
+
+def get_users_details(user_ids):
+    """
+    Obtiene los detalles de varios usuarios a la vez: {user_id: detalles o None}.
+    Los que no están en caché se leen con una única consulta.
+    """
+    now = time.monotonic()
+    found, missing = {}, []
+    with _user_cache_lock:
+        generation = _user_cache_generation
+        for user_id in dict.fromkeys(user_ids):
+            entry = _user_cache.get(user_id)
+            if entry is not None and entry[0] > now:
+                found[user_id] = entry[1]
+                _user_cache_stats['hits'] += 1
+            else:
+                missing.append(user_id)
+                _user_cache_stats['misses'] += 1
+
+    if missing:
+        conn = get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT user_id, first_name, username, role FROM usuarios WHERE user_id = ANY(%s)",
+                    (list(missing),)
+                )
+                loaded = {user_id: None for user_id in missing}
+                for row in cur.fetchall():
+                    loaded[row[0]] = _user_row_to_dict(row)
+        finally:
+            conn.close()
+        _cache_users(loaded, generation)
+        found.update(loaded)
+
+    # Copias: quien llama puede modificar el dict sin tocar la caché
+    return {user_id: dict(details) if details else None for user_id, details in found.items()}
+
+def get_user_roles(user_ids):
+    """Obtiene el rol de varios usuarios a la vez: {user_id: rol o None}."""
+    return {
+        user_id: details["role"] if details else None
+        for user_id, details in get_users_details(user_ids).items()
+    }
+
 def get_user_role(user_id):
     """Obtiene el rol de un usuario a partir de su ID."""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT role FROM usuarios WHERE user_id = %s", (user_id,))
-            result = cur.fetchone()
-            return result[0] if result else None
-    finally:
-        conn.close()
+    return get_user_roles([user_id])[user_id]
 
 def get_users_by_role(role):
     """Obtiene todos los usuarios con un rol específico."""
@@ -61,6 +454,7 @@ def add_user_with_role(user_id, first_name, username, role):
             conn.commit()
     finally:
         conn.close()
+        invalidate_user_cache(user_id)
 
 def get_all_users():
     """Obtiene todos los usuarios registrados en la base de datos, ordenados por nombre."""
@@ -75,16 +469,7 @@ def get_all_users():
 
 def get_user_details(user_id):
     """Obtiene los detalles (nombre, username, rol) de un usuario específico."""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT user_id, first_name, username, role FROM usuarios WHERE user_id = %s", (user_id,))
-            res = cur.fetchone()
-            if not res:
-                return None
-            return {"id": res[0], "name": res[1], "username": res[2], "role": res[3]}
-    finally:
-        conn.close()
+    return get_users_details([user_id])[user_id]
 
 def update_user_role(user_id, new_role):
     """Actualiza únicamente el rol de un usuario existente."""
@@ -93,22 +478,63 @@ def update_user_role(user_id, new_role):
         with conn.cursor() as cur:
             cur.execute("UPDATE usuarios SET role = %s WHERE user_id = %s", (new_role, user_id))
             conn.commit()
+            return cur.rowcount
     finally:
         conn.close()
+        invalidate_user_cache(user_id)
+
+def delete_user(user_id):
+    """Elimina un usuario de la base de datos."""
+    try:
+        return execute_query("DELETE FROM usuarios WHERE user_id = %s", (user_id,))
+    finally:
+        invalidate_user_cache(user_id)
 
 # =============================================================================
 # FUNCIONES DE GESTIÓN DE UBICACIONES
 # =============================================================================
 
+# Árbol de ubicaciones en memoria: se carga con una sola consulta y se
+# invalida al modificar ubicaciones_config (o al caducar, por si otra
+# instancia del bot la cambia).
+UBICACIONES_CACHE_TTL = int(os.getenv("UBICACIONES_CACHE_TTL", "300"))
+_ubicaciones_cache = None  # (instante de carga, {tipo: [ubicaciones]}, [tipos])
+_ubicaciones_lock = threading.Lock()
+
+def _get_ubicaciones_tree():
+    """Devuelve ({tipo: [{"id", "nombre"}]}, [tipos por orden de alta]) desde la caché."""
+    global _ubicaciones_cache
+    cache = _ubicaciones_cache
+    if cache is not None and time.monotonic() - cache[0] < UBICACIONES_CACHE_TTL:
+        return cache[1], cache[2]
+    with _ubicaciones_lock:
+        cache = _ubicaciones_cache
+        if cache is not None and time.monotonic() - cache[0] < UBICACIONES_CACHE_TTL:
+            return cache[1], cache[2]
+        conn = get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id, tipo, nombre FROM ubicaciones_config ORDER BY nombre")
+                rows = cur.fetchall()
+        finally:
+            conn.close()
+        tree, first_id = {}, {}
+        for row in rows:
+            tree.setdefault(row[1], []).append({"id": row[0], "nombre": row[2]})
+            first_id[row[1]] = min(first_id.get(row[1], row[0]), row[0])
+        tipos = sorted(tree, key=first_id.get)
+        _ubicaciones_cache = (time.monotonic(), tree, tipos)
+        return tree, tipos
+
+def invalidate_ubicaciones_cache():
+    """Descarta el árbol de ubicaciones en memoria (se recarga en la siguiente lectura)."""
+    global _ubicaciones_cache
+    _ubicaciones_cache = None
+
 def get_ubicaciones_by_tipo(tipo):
     """Obtiene todas las ubicaciones de un tipo específico (ej: 'Edificio')."""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, nombre FROM ubicaciones_config WHERE tipo = %s ORDER BY nombre", (tipo,))
-            return [{"id": row[0], "nombre": row[1]} for row in cur.fetchall()]
-    finally:
-        conn.close()
+    tree, _ = _get_ubicaciones_tree()
+    return [dict(u) for u in tree.get(tipo, [])]
 
 def add_ubicacion(tipo, nombre):
     """Añade una nueva ubicación. Devuelve True si tiene éxito, False si ya existe."""
@@ -117,7 +543,8 @@ def add_ubicacion(tipo, nombre):
         with conn.cursor() as cur:
             cur.execute("INSERT INTO ubicaciones_config (tipo, nombre) VALUES (%s, %s)", (tipo, nombre))
             conn.commit()
-    except psycopg2.IntegrityError:
+        invalidate_ubicaciones_cache()
+    except IntegrityError:
         conn.rollback()
         return False
     finally:
@@ -131,6 +558,7 @@ def delete_ubicacion(ubicacion_id):
         with conn.cursor() as cur:
             cur.execute("DELETE FROM ubicaciones_config WHERE id = %s", (ubicacion_id,))
             conn.commit()
+        invalidate_ubicaciones_cache()
     finally:
         conn.close()
 
@@ -141,7 +569,8 @@ def rename_ubicacion(ubicacion_id, nuevo_nombre):
         with conn.cursor() as cur:
             cur.execute("UPDATE ubicaciones_config SET nombre = %s WHERE id = %s", (nuevo_nombre, ubicacion_id))
             conn.commit()
-    except psycopg2.IntegrityError:
+        invalidate_ubicaciones_cache()
+    except IntegrityError:
         conn.rollback()
         return False
     finally:
@@ -165,9 +594,19 @@ def add_or_update_almacen_item(nombre, cantidad, descripcion, tipo):
             """
             cur.execute(sql, (nombre, cantidad, descripcion, tipo))
             conn.commit()
+        _invalidate_counts('almacen_items')
     finally:
         conn.close()
 
+def count_almacen_items(item_type):
+    """Número de artículos de uno o varios tipos (cacheado, ver COUNT_CACHE_TTL)."""
+    if isinstance(item_type, str):
+        item_type = [item_type]
+    return _cached_count(
+        'almacen_items', tuple(sorted(item_type)),
+        "SELECT COUNT(*) AS total FROM almacen_items WHERE tipo = ANY(%s);", (list(item_type),)
+    )
+
 def get_almacen_items_paginated(item_type, page=0, items_per_page=5):
     conn = get_connection()
     try:
@@ -175,16 +614,53 @@ def get_almacen_items_paginated(item_type, page=0, items_per_page=5):
             offset = page * items_per_page
             if isinstance(item_type, str):
                 item_type = [item_type]
-            sql_items = "SELECT id, nombre, cantidad FROM almacen_items WHERE tipo = ANY(%s) ORDER BY nombre ASC LIMIT %s OFFSET %s;"
-            sql_count = "SELECT COUNT(*) FROM almacen_items WHERE tipo = ANY(%s);"
+            sql_items = "SELECT id, nombre, cantidad FROM almacen_items WHERE tipo = ANY(%s) ORDER BY nombre ASC, id ASC LIMIT %s OFFSET %s;"
             cur.execute(sql_items, (item_type, items_per_page, offset))
             items = [{"id": row[0], "nombre": row[1], "cantidad": row[2]} for row in cur.fetchall()]
-            cur.execute(sql_count, (item_type,))
-            total_items = cur.fetchone()[0]
-            total_pages = (total_items + items_per_page - 1) // items_per_page if items_per_page > 0 else 0
-            return items, total_pages
     finally:
         conn.close()
+    total_items = count_almacen_items(item_type)
+    total_pages = (total_items + items_per_page - 1) // items_per_page if items_per_page > 0 else 0
+    return items, total_pages
+
+def get_almacen_items_keyset(item_type, items_per_page=5, after=None, before=None):
+    """
+    Página de artículos por keyset sobre (nombre, id): cuesta lo mismo en
+    cualquier página. `after` es la clave del último artículo mostrado (página
+    siguiente) y `before` la del primero (página anterior).
+    Devuelve (items, hay_siguiente, hay_anterior).
+    """
+    if isinstance(item_type, str):
+        item_type = [item_type]
+    if after is not None:
+        sql = """
+            SELECT id, nombre, cantidad FROM almacen_items
+            WHERE tipo = ANY(%s) AND (nombre, id) > (%s, %s)
+            ORDER BY nombre ASC, id ASC LIMIT %s;
+        """
+        params = (item_type, after[0], after[1], items_per_page + 1)
+    elif before is not None:
+        sql = """
+            SELECT id, nombre, cantidad FROM almacen_items
+            WHERE tipo = ANY(%s) AND (nombre, id) < (%s, %s)
+            ORDER BY nombre DESC, id DESC LIMIT %s;
+        """
+        params = (item_type, before[0], before[1], items_per_page + 1)
+    else:
+        sql = """
+            SELECT id, nombre, cantidad FROM almacen_items
+            WHERE tipo = ANY(%s)
+            ORDER BY nombre ASC, id ASC LIMIT %s;
+        """
+        params = (item_type, items_per_page + 1)
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            items = [{"id": row[0], "nombre": row[1], "cantidad": row[2]} for row in cur.fetchall()]
+    finally:
+        conn.close()
+    return _keyset_page(items, items_per_page, after, before)
 
 def get_almacen_item_details(item_id):
     conn = get_connection()
@@ -210,18 +686,65 @@ def update_almacen_item_quantity(item_id, nueva_cantidad):
 # =============================================================================
 # FUNCIONES DE AVANCES E INCIDENCIAS
 # =============================================================================
-def create_avance(encargado_id, ubicacion_completa, trabajo, foto_path, estado, fecha_trabajo, tipo_trabajo_id=None, observaciones=None):
+
+# Nivel de ubicación (clave de los filtros) -> columna desglosada de avances.
+# ubicacion_completa guarda 'Edificio / Zona / Planta / Trabajo' en ese orden.
+_UBICACION_COLUMNS = {
+    'edificio': 'ubicacion_edificio',
+    'zona': 'ubicacion_zona',
+    'planta': 'ubicacion_planta',
+    'trabajo': 'ubicacion_nucleo',
+    'nucleo': 'ubicacion_nucleo',
+}
+_UBICACION_ORDEN = ('ubicacion_edificio', 'ubicacion_zona', 'ubicacion_planta', 'ubicacion_nucleo')
+
+def _split_ubicacion(ubicacion_completa, ubicacion=None):
+    """
+    Devuelve (edificio, zona, planta, nucleo) para las columnas desglosadas.
+    Con el diccionario de niveles (nivel -> nombre) cada valor va a su columna aunque
+    se haya saltado un nivel intermedio. Sin él solo se acepta la cadena completa
+    'Edificio / Zona / Planta / Núcleo': en una cadena más corta no se sabe qué nivel falta.
+    """
+    if ubicacion:
+        columnas = {}
+        for nivel, valor in ubicacion.items():
+            column = _UBICACION_COLUMNS.get(nivel.lower())
+            if column and valor:
+                columnas[column] = valor
+        return tuple(columnas.get(column) for column in _UBICACION_ORDEN)
+
+    partes = [x.strip() for x in (ubicacion_completa or "").split("/")]
+    if len(partes) != 4 or not all(partes):
+        raise ValueError("La ubicación no está bien formada. Se esperaba el formato: 'Edificio / Zona / Planta / Núcleo'")
+    return tuple(partes)
+
+def _add_ubicacion_filters(filters, where_clauses, params, alias="a"):
+    """Añade una igualdad por cada nivel de ubicación filtrado (usa idx_avances_ubicacion)."""
+    for key, value in (filters or {}).items():
+        if not value:
+            continue
+        column = _UBICACION_COLUMNS.get(key.lower())
+        if not column:
+            # Sin columna desglosada el filtro no se puede aplicar: el resultado incluirá más avances
+            logger.warning(f"⚠️ Filtro de ubicación desconocido ignorado: {key}={value}")
+            continue
+        where_clauses.append(f"{alias}.{column} = %s")
+        params.append(value)
+
+def create_avance(encargado_id, ubicacion_completa, trabajo, foto_path, estado, fecha_trabajo, tipo_trabajo_id=None, observaciones=None, fotos=None, ubicacion=None):
     """
     Inserta un nuevo avance en la base de datos, desglosando la ubicación en sus componentes
-    y manteniendo la cadena completa.
+    y manteniendo la cadena completa. ubicacion: niveles seleccionados (nivel -> nombre);
+    sin él, ubicacion_completa debe tener los 4 niveles. fotos: rutas de todas las fotos
+    (la primera queda además en foto_path).
     """
+    fotos, foto_path = _normalize_fotos(fotos, foto_path)
+    edificio, zona, planta, nucleo = _split_ubicacion(ubicacion_completa, ubicacion)
+    if not edificio:
+        raise ValueError("La ubicación no está bien formada: falta el edificio")
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            try:
-                edificio, zona, planta, nucleo = [x.strip() for x in ubicacion_completa.split("/")]
-            except ValueError:
-                raise ValueError("La ubicación no está bien formada. Se esperaba el formato: 'Edificio / Zona / Planta / Núcleo'")
 
             sql = """
                 INSERT INTO avances (
@@ -257,7 +780,11 @@ def create_avance(encargado_id, ubicacion_completa, trabajo, foto_path, estado,
                 fecha_trabajo
             ))
             avance_id = cur.fetchone()[0]
+            _insert_fotos(cur, 'avance', avance_id, fotos)
+            _rollup_add(cur, fecha_trabajo, edificio, tipo_trabajo_id, encargado_id, estado)
             conn.commit()
+            _invalidate_counts('avances')
+            _bump_data_version('avances')
             return avance_id
     finally:
         conn.close()
@@ -270,18 +797,22 @@ def create_incidencia(avance_id, descripcion, reporta_id):
             cur.execute(sql, (avance_id, descripcion, reporta_id))
             incidencia_id = cur.fetchone()[0]
             conn.commit()
+            _bump_data_version('incidencias')
             return incidencia_id
     finally:
         conn.close()
 
-def create_tool_incidencia(reporta_id, item_id, descripcion, foto_path):
+def create_tool_incidencia(reporta_id, item_id, descripcion, foto_path, fotos=None):
+    fotos, foto_path = _normalize_fotos(fotos, foto_path)
     conn = get_connection()
     try:
         with conn.cursor() as cur:
             sql = "INSERT INTO incidencias (reporta_id, item_id, descripcion, foto_path, estado, fecha_reporte) VALUES (%s, %s, %s, %s, 'Pendiente', NOW()) RETURNING id;"
             cur.execute(sql, (reporta_id, item_id, descripcion, foto_path))
             incidencia_id = cur.fetchone()[0]
+            _insert_fotos(cur, 'incidencia', incidencia_id, fotos)
             conn.commit()
+            _bump_data_version('incidencias')
             return incidencia_id
     finally:
         conn.close()
@@ -337,6 +868,7 @@ def resolve_incidencia(incidencia_id, resolutor_id, resolucion_desc):
             sql = "UPDATE incidencias SET estado = 'Resuelta', tecnico_resolutor_id = %s, resolucion_desc = %s, fecha_resolucion = NOW() WHERE id = %s;"
             cur.execute(sql, (resolutor_id, resolucion_desc, incidencia_id))
             conn.commit()
+            _bump_data_version('incidencias')
     finally:
         conn.close()
         
@@ -378,18 +910,48 @@ def create_pedido(solicitante_id, notas, group_chat_id=None):
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            try:
-                cur.execute("ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS group_chat_id BIGINT;")
-                conn.commit()
-            except psycopg2.Error as e:
-                print(f"Advertencia: No se pudo añadir la columna group_chat_id a la tabla pedidos: {e}")
-                conn.rollback()
+            sql = "INSERT INTO pedidos (solicitante_id, notas_solicitud, estado, group_chat_id) VALUES (%s, %s, %s, %s) RETURNING id;"
+            cur.execute(sql, (solicitante_id, notas, 'Pendiente Aprobacion', group_chat_id))
+            pedido_id = cur.fetchone()[0]
+            conn.commit()
+            return pedido_id
+    finally:
+        conn.close()
 
+def create_pedido_with_items(solicitante_id, notas, items, group_chat_id=None):
+    """
+    Crea un pedido con todos sus artículos en una sola transacción y devuelve su ID.
+    :param items: Pares (item_id, cantidad), ej: [(3, 10), (7, 2)]
+    Los artículos se insertan con un único INSERT ... SELECT que toma el nombre
+    de almacen_items; los IDs que ya no existen se descartan (y se avisa).
+    """
+    items = [(int(item_id), cantidad) for item_id, cantidad in items]
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
             sql = "INSERT INTO pedidos (solicitante_id, notas_solicitud, estado, group_chat_id) VALUES (%s, %s, %s, %s) RETURNING id;"
             cur.execute(sql, (solicitante_id, notas, 'Pendiente Aprobacion', group_chat_id))
             pedido_id = cur.fetchone()[0]
+
+            if items:
+                values = ", ".join(["(%s, %s, %s)"] * len(items))
+                sql_items = f"""
+                    INSERT INTO pedido_items (pedido_id, item_id, cantidad_solicitada, nombre_item)
+                    WITH v (pos, item_id, cantidad) AS (VALUES {values})
+                    SELECT %s, a.id, v.cantidad, a.nombre
+                    FROM v JOIN almacen_items a ON a.id = v.item_id
+                    ORDER BY v.pos;
+                """
+                params = [value for pos, (item_id, cantidad) in enumerate(items) for value in (pos, item_id, cantidad)]
+                cur.execute(sql_items, params + [pedido_id])
+                if cur.rowcount != len(items):
+                    print(f"Advertencia: {len(items) - cur.rowcount} artículo(s) no encontrados al crear el pedido {pedido_id}")
+
             conn.commit()
             return pedido_id
+    except DatabaseError:
+        conn.rollback()
+        raise
     finally:
         conn.close()
 
@@ -430,24 +992,31 @@ def get_pedidos_by_estado(estado):
     finally:
         conn.close()
 
+# Pedido completo (cabecera + artículos) en una sola sentencia
+_PEDIDO_DETAILS_SQL = """
+    SELECT p.id, u.first_name, p.estado, p.notas_solicitud, p.notas_decision, p.fecha_solicitud, p.solicitante_id,
+        (SELECT COALESCE(json_agg(json_build_object('nombre', i.nombre_item, 'cantidad_solicitada', i.cantidad_solicitada)), '[]'::json)
+         FROM (SELECT nombre_item, cantidad_solicitada FROM pedido_items WHERE pedido_id = p.id ORDER BY id) i) AS items
+    FROM pedidos p JOIN usuarios u ON p.solicitante_id = u.user_id
+    WHERE p.id = %s;
+"""
+
+def _fetch_pedido_details(cur, pedido_id):
+    cur.execute(_PEDIDO_DETAILS_SQL, (pedido_id,))
+    pedido_res = cur.fetchone()
+    if not pedido_res: return None
+    return {"id": pedido_res[0], "solicitante": pedido_res[1], "estado": pedido_res[2], "notas_solicitud": pedido_res[3], "notas_decision": pedido_res[4], "fecha": pedido_res[5].strftime('%d/%m/%Y'), "solicitante_id": pedido_res[6], "items": _json_list(pedido_res[7])}
+
 def get_pedido_details(pedido_id):
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            sql_pedido = "SELECT p.id, u.first_name, p.estado, p.notas_solicitud, p.notas_decision, p.fecha_solicitud, p.solicitante_id FROM pedidos p JOIN usuarios u ON p.solicitante_id = u.user_id WHERE p.id = %s;"
-            cur.execute(sql_pedido, (pedido_id,))
-            pedido_res = cur.fetchone()
-            if not pedido_res: return None
-            details = {"id": pedido_res[0], "solicitante": pedido_res[1], "estado": pedido_res[2], "notas_solicitud": pedido_res[3], "notas_decision": pedido_res[4], "fecha": pedido_res[5].strftime('%d/%m/%Y'), "solicitante_id": pedido_res[6], "items": []}
-            sql_items = "SELECT nombre_item, cantidad_solicitada FROM pedido_items WHERE pedido_id = %s;"
-            cur.execute(sql_items, (pedido_id,))
-            for item_row in cur.fetchall():
-                details["items"].append({"nombre": item_row[0], "cantidad_solicitada": item_row[1]})
-            return details
+            return _fetch_pedido_details(cur, pedido_id)
     finally:
         conn.close()
 
 def update_pedido_status(pedido_id, nuevo_estado, user_id, notas=""):
+    """Cambia el estado de un pedido y devuelve sus detalles ya actualizados (None si no existe)."""
     conn = get_connection()
     try:
         with conn.cursor() as cur:
@@ -460,7 +1029,9 @@ def update_pedido_status(pedido_id, nuevo_estado, user_id, notas=""):
             else:
                 sql = "UPDATE pedidos SET estado = %s WHERE id = %s;"
                 cur.execute(sql, (nuevo_estado, pedido_id))
+            details = _fetch_pedido_details(cur, pedido_id)
             conn.commit()
+            return details
     finally:
         conn.close()
 
@@ -555,44 +1126,50 @@ def get_solicitudes_by_estado(estados):
     finally:
         conn.close()
 
+# Solicitud completa (cabecera + puestos + notas de RRHH) en una sola sentencia
+_SOLICITUD_DETAILS_SQL = """
+    SELECT s.id, s.fecha_incorporacion, s.estado, s.notas_solicitud, s.notas_decision,
+        u_solicitante.first_name, u_tecnico.first_name, u_gerente.first_name, s.solicitante_id, s.tecnico_id,
+        (SELECT COALESCE(json_agg(json_build_object('puesto', i.puesto, 'cantidad', i.cantidad)), '[]'::json)
+         FROM (SELECT puesto, cantidad FROM solicitud_personal_items WHERE solicitud_id = s.id ORDER BY id) i) AS puestos,
+        (SELECT COALESCE(json_agg(json_build_object('nota', n.nota, 'fecha', n.fecha_nota, 'autor', n.first_name)), '[]'::json)
+         FROM (SELECT sn.nota, sn.fecha_nota, u.first_name FROM solicitud_personal_notas sn
+               JOIN usuarios u ON sn.rrhh_id = u.user_id
+               WHERE sn.solicitud_id = s.id ORDER BY sn.fecha_nota ASC) n) AS notas
+    FROM solicitudes_personal s
+    JOIN usuarios u_solicitante ON s.solicitante_id = u_solicitante.user_id
+    LEFT JOIN usuarios u_tecnico ON s.tecnico_id = u_tecnico.user_id
+    LEFT JOIN usuarios u_gerente ON s.gerente_id = u_gerente.user_id
+    WHERE s.id = %s;
+"""
+
+def _fetch_solicitud_details(cur, solicitud_id):
+    cur.execute(_SOLICITUD_DETAILS_SQL, (solicitud_id,))
+    res = cur.fetchone()
+    if not res: return None
+    return {
+        "id": res[0], "fecha": res[1].strftime('%d/%m/%Y'), "estado": res[2], 
+        "notas_solicitud": res[3], "notas_decision": res[4], 
+        "solicitante_name": res[5], "tecnico_name": res[6], "gerente_name": res[7], 
+        "solicitante_id": res[8], "tecnico_id": res[9], 
+        "puestos": _json_list(res[10]),
+        "historial_notas_rrhh": [
+            {"nota": nota["nota"], "fecha": _json_timestamp(nota["fecha"]).strftime('%d/%m/%y %H:%M'), "autor": nota["autor"]}
+            for nota in _json_list(res[11])
+        ]
+    }
+
 def get_solicitud_details(solicitud_id):
     """Obtiene los detalles de una solicitud, incluyendo la lista de todos los puestos."""
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            # Consulta principal sin cambios
-            sql_main = "SELECT s.id, s.fecha_incorporacion, s.estado, s.notas_solicitud, s.notas_decision, u_solicitante.first_name, u_tecnico.first_name, u_gerente.first_name, s.solicitante_id, s.tecnico_id FROM solicitudes_personal s JOIN usuarios u_solicitante ON s.solicitante_id = u_solicitante.user_id LEFT JOIN usuarios u_tecnico ON s.tecnico_id = u_tecnico.user_id LEFT JOIN usuarios u_gerente ON s.gerente_id = u_gerente.user_id WHERE s.id = %s;"
-            cur.execute(sql_main, (solicitud_id,))
-            res = cur.fetchone()
-            if not res: return None
-            
-            # Inicializamos el diccionario de detalles
-            details = {
-                "id": res[0], "fecha": res[1].strftime('%d/%m/%Y'), "estado": res[2], 
-                "notas_solicitud": res[3], "notas_decision": res[4], 
-                "solicitante_name": res[5], "tecnico_name": res[6], "gerente_name": res[7], 
-                "solicitante_id": res[8], "tecnico_id": res[9], 
-                "puestos": [], # NUEVO: Lista para almacenar los puestos
-                "historial_notas_rrhh": []
-            }
-
-            # NUEVO: Consulta para obtener todos los puestos de la solicitud
-            sql_items = "SELECT puesto, cantidad FROM solicitud_personal_items WHERE solicitud_id = %s ORDER BY id;"
-            cur.execute(sql_items, (solicitud_id,))
-            for item_row in cur.fetchall():
-                details["puestos"].append({"puesto": item_row[0], "cantidad": item_row[1]})
-
-            # Consulta de notas sin cambios
-            sql_notes = "SELECT n.nota, n.fecha_nota, u.first_name FROM solicitud_personal_notas n JOIN usuarios u ON n.rrhh_id = u.user_id WHERE n.solicitud_id = %s ORDER BY n.fecha_nota ASC;"
-            cur.execute(sql_notes, (solicitud_id,))
-            for nota_row in cur.fetchall():
-                details["historial_notas_rrhh"].append({"nota": nota_row[0], "fecha": nota_row[1].strftime('%d/%m/%y %H:%M'), "autor": nota_row[2]})
-            
-            return details
+            return _fetch_solicitud_details(cur, solicitud_id)
     finally:
         conn.close()
 
 def update_solicitud_status(solicitud_id, user_id, nuevo_estado, notas, rol_usuario):
+    """Cambia el estado de una solicitud y devuelve sus detalles ya actualizados (None si no existe)."""
     conn = get_connection()
     try:
         with conn.cursor() as cur:
@@ -607,12 +1184,15 @@ def update_solicitud_status(solicitud_id, user_id, nuevo_estado, notas, rol_usua
             else:
                 sql = "UPDATE solicitudes_personal SET estado = %s, notas_decision = %s, fecha_decision = NOW() WHERE id = %s;"
                 cur.execute(sql, (nuevo_estado, notas, solicitud_id))
+            details = _fetch_solicitud_details(cur, solicitud_id)
             conn.commit()
+            return details
     finally:
         conn.close()
 
-def create_prevencion_incidencia(reporta_id, ubicacion, descripcion, foto_path):
-    """Crea una nueva incidencia de prevención y devuelve su ID."""
+def create_prevencion_incidencia(reporta_id, ubicacion, descripcion, foto_path, fotos=None):
+    """Crea una nueva incidencia de prevención (con una o varias fotos) y devuelve su ID."""
+    fotos, foto_path = _normalize_fotos(fotos, foto_path)
     conn = get_connection()
     try:
         with conn.cursor() as cur:
@@ -622,6 +1202,7 @@ def create_prevencion_incidencia(reporta_id, ubicacion, descripcion, foto_path):
             """
             cur.execute(sql, (reporta_id, ubicacion, descripcion, foto_path))
             incidencia_id = cur.fetchone()[0]
+            _insert_fotos(cur, 'prevencion', incidencia_id, fotos)
             conn.commit()
             return incidencia_id
     finally:
@@ -693,6 +1274,10 @@ def close_prevencion_incidencia(incidencia_id, user_id):
     finally:
         conn.close()
 
+def count_finalizados():
+    """Número de avances con estado 'Finalizado' (cacheado, ver COUNT_CACHE_TTL)."""
+    return _cached_count('avances', 'Finalizado', "SELECT COUNT(*) AS total FROM avances WHERE estado = 'Finalizado';")
+
 def get_finalizados_paginated(page=0, items_per_page=5):
     """Obtiene una lista paginada de avances con estado 'Finalizado'."""
     conn = get_connection()
@@ -710,16 +1295,47 @@ def get_finalizados_paginated(page=0, items_per_page=5):
             """
             cur.execute(sql_items, (items_per_page, offset))
             avances = [{"id": row[0], "trabajo": row[1], "ubicacion": row[2], "fecha_trabajo": row[3]} for row in cur.fetchall()]
-            
-            # Consulta para contar el total de avances finalizados
-            sql_count = "SELECT COUNT(*) FROM avances WHERE estado = 'Finalizado';"
-            cur.execute(sql_count)
-            total_items = cur.fetchone()[0]
-            total_pages = (total_items + items_per_page - 1) // items_per_page if items_per_page > 0 else 0
-            
-            return avances, total_pages
     finally:
         conn.close()
+    total_items = count_finalizados()
+    total_pages = (total_items + items_per_page - 1) // items_per_page if items_per_page > 0 else 0
+    return avances, total_pages
+
+def get_finalizados_keyset(items_per_page=5, after=None, before=None):
+    """
+    Página de avances finalizados por keyset sobre (fecha_trabajo, id), del más
+    reciente al más antiguo. `after` es la clave del último avance mostrado y
+    `before` la del primero. Devuelve (avances, hay_siguiente, hay_anterior).
+    """
+    if after is not None:
+        sql = """
+            SELECT id, trabajo, ubicacion_completa, fecha_trabajo FROM avances
+            WHERE estado = 'Finalizado' AND (fecha_trabajo, id) < (%s, %s)
+            ORDER BY fecha_trabajo DESC, id DESC LIMIT %s;
+        """
+        params = (after[0], after[1], items_per_page + 1)
+    elif before is not None:
+        sql = """
+            SELECT id, trabajo, ubicacion_completa, fecha_trabajo FROM avances
+            WHERE estado = 'Finalizado' AND (fecha_trabajo, id) > (%s, %s)
+            ORDER BY fecha_trabajo ASC, id ASC LIMIT %s;
+        """
+        params = (before[0], before[1], items_per_page + 1)
+    else:
+        sql = """
+            SELECT id, trabajo, ubicacion_completa, fecha_trabajo FROM avances
+            WHERE estado = 'Finalizado'
+            ORDER BY fecha_trabajo DESC, id DESC LIMIT %s;
+        """
+        params = (items_per_page + 1,)
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            avances = [{"id": row[0], "trabajo": row[1], "ubicacion": row[2], "fecha_trabajo": row[3]} for row in cur.fetchall()]
+    finally:
+        conn.close()
+    return _keyset_page(avances, items_per_page, after, before)
 
 def get_avance_details(avance_id):
     """Obtiene los detalles completos de un avance específico."""
@@ -856,57 +1472,94 @@ def get_tool_incidencia_details(incidencia_id):
     finally:
         conn.close()
 
+def _avances_report_query(filters, start_date=None, end_date=None, with_incidencias=False):
+    """
+    Sentencia y parámetros de los informes de avances (ver get_avances_for_report).
+    Con with_incidencias añade sus incidencias por LEFT JOIN (columnas 7-10), una fila
+    por incidencia y ordenadas por (avance, fecha de la incidencia).
+    """
+    base_sql = """
+        SELECT a.id, a.ubicacion_completa, a.trabajo, a.estado, a.fecha_trabajo, u.first_name, u.username
+        {incidencia_columns}
+        FROM avances a
+        JOIN usuarios u ON a.encargado_id = u.user_id
+        {incidencia_join}
+    """.format(
+        incidencia_columns=", i.id, i.descripcion, i.estado, i.fecha_reporte" if with_incidencias else "",
+        incidencia_join="LEFT JOIN incidencias i ON i.avance_id = a.id" if with_incidencias else "",
+    )
+    where_clauses = []
+    params = []
+
+    # --- Filtro de Ubicación (columnas desglosadas) ---
+    _add_ubicacion_filters(filters, where_clauses, params)
+
+    # --- NUEVO: Filtro de Fechas ---
+    if start_date and end_date:
+        where_clauses.append("a.fecha_trabajo BETWEEN %s AND %s")
+        params.append(start_date)
+        params.append(end_date)
+    
+    if where_clauses:
+        base_sql += " WHERE " + " AND ".join(where_clauses)
+    
+    base_sql += " ORDER BY a.fecha_trabajo DESC, a.id DESC"
+    if with_incidencias:
+        base_sql += ", i.fecha_reporte ASC, i.id ASC"
+    return base_sql + ";", tuple(params)
+
+def _avance_report_row(row):
+    return {
+        "id": row[0], "ubicacion": row[1], "trabajo": row[2],
+        "estado": row[3], "fecha": row[4], "encargado_nombre": row[5],
+        "encargado_username": row[6]
+    }
+
 def get_avances_for_report(filters, start_date=None, end_date=None):
     """
     Obtiene avances para un informe, usando filtros de ubicación y un rango de fechas opcional.
     MODIFICADO: Acepta start_date y end_date.
+    Para exportaciones grandes usar iter_avances_for_report, que no carga la lista entera.
     """
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            base_sql = """
-                SELECT a.id, a.ubicacion_completa, a.trabajo, a.estado, a.fecha_trabajo, u.first_name, u.username
-                FROM avances a
-                JOIN usuarios u ON a.encargado_id = u.user_id
-            """
-            where_clauses = []
-            params = []
+            cur.execute(*_avances_report_query(filters, start_date, end_date))
+            return [_avance_report_row(row) for row in cur.fetchall()]
+    finally:
+        conn.close()
 
-            # --- Filtro de Ubicación (sin cambios) ---
-            pattern_parts = []
-            filter_keys_ordered = ['edificio', 'planta', 'zona', 'trabajo']
-            for key in filter_keys_ordered:
-                if filters.get(key):
-                    pattern_parts.append(filters.get(key))
-                else:
-                    break
-            
-            if pattern_parts:
-                like_pattern = " / ".join(pattern_parts) + "%"
-                where_clauses.append("a.ubicacion_completa LIKE %s")
-                params.append(like_pattern)
-
-            # --- NUEVO: Filtro de Fechas ---
-            if start_date and end_date:
-                where_clauses.append("a.fecha_trabajo BETWEEN %s AND %s")
-                params.append(start_date)
-                params.append(end_date)
-            
-            if where_clauses:
-                base_sql += " WHERE " + " AND ".join(where_clauses)
-            
-            base_sql += " ORDER BY a.fecha_trabajo DESC, a.id DESC;"
-            
-            cur.execute(base_sql, tuple(params))
-            
-            avances = []
-            for row in cur.fetchall():
-                avances.append({
-                    "id": row[0], "ubicacion": row[1], "trabajo": row[2],
-                    "estado": row[3], "fecha": row[4], "encargado_nombre": row[5],
-                    "encargado_username": row[6]
-                })
-            return avances
+def iter_avances_for_report(filters, start_date=None, end_date=None, batch_size=None):
+    """
+    Igual que get_avances_for_report pero devuelve un generador: en PostgreSQL usa
+    un cursor de servidor y trae las filas por lotes de batch_size (REPORT_STREAM_BATCH),
+    así que la memoria no depende del número de avances.
+    La conexión queda ocupada hasta que el generador se agota o se cierra.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor(name="avances_report", itersize=batch_size) as cur:
+            cur.execute(*_avances_report_query(filters, start_date, end_date))
+            for row in cur:
+                yield _avance_report_row(row)
+    finally:
+        conn.close()
+
+def iter_avance_incidencias_for_report(filters, start_date=None, end_date=None, batch_size=None):
+    """
+    Como iter_avances_for_report, pero con las incidencias ya unidas en la consulta:
+    genera (avance, incidencia) con una fila por incidencia, o (avance, None) si el
+    avance no tiene ninguna. Sustituye a get_incidencias_for_avances en los informes.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor(name="avances_incidencias_report", itersize=batch_size) as cur:
+            cur.execute(*_avances_report_query(filters, start_date, end_date, with_incidencias=True))
+            for row in cur:
+                incidencia = None
+                if row[7] is not None:
+                    incidencia = {"id": row[7], "descripcion": row[8], "estado": row[9], "fecha": row[10]}
+                yield _avance_report_row(row), incidencia
     finally:
         conn.close()
 
@@ -940,18 +1593,8 @@ def get_incidencias_for_avances(avance_ids):
 
 def get_distinct_ubicacion_tipos():
     """Obtiene una lista de todos los tipos de ubicación distintos en la base de datos."""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            # Consulta para obtener los valores únicos de la columna 'tipo'
-            #cur.execute("SELECT DISTINCT tipo FROM ubicaciones_config ORDER BY tipo ASC;")
-            cur.execute("SELECT DISTINCT tipo FROM ubicaciones_config;")
-
-            # La consulta devuelve una lista de tuplas, la convertimos a una lista simple
-            tipos = [row[0] for row in cur.fetchall()]
-            return tipos
-    finally:
-        conn.close()
+    _, tipos = _get_ubicaciones_tree()
+    return list(tipos)
 
 # =============================================================================
 # FUNCIONES DE TIPOS DE TRABAJO
@@ -962,8 +1605,8 @@ def get_tipos_trabajo_activos():
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT id, nombre, emoji FROM tipos_trabajo WHERE activo = TRUE ORDER BY orden ASC;")
-            return [{"id": row[0], "nombre": row[1], "emoji": row[2]} for row in cur.fetchall()]
+            cur.execute("SELECT id, nombre, emoji, activo, orden FROM tipos_trabajo WHERE activo = TRUE ORDER BY orden ASC, nombre ASC;")
+            return [{"id": row[0], "nombre": row[1], "emoji": row[2], "activo": row[3], "orden": row[4]} for row in cur.fetchall()]
     finally:
         conn.close()
 
@@ -993,13 +1636,13 @@ def add_tipo_trabajo(nombre, emoji="🔧", creado_por=None):
             tipo_id = cur.fetchone()[0]
             conn.commit()
             return tipo_id
-    except psycopg2.IntegrityError:
+    except IntegrityError:
         conn.rollback()
         return None
     finally:
         conn.close()
 
-def update_tipo_trabajo(tipo_id, nombre=None, emoji=None, activo=None):
+def update_tipo_trabajo(tipo_id, nombre=None, emoji=None, activo=None, orden=None):
     """Actualiza un tipo de trabajo existente."""
     conn = get_connection()
     try:
@@ -1016,6 +1659,9 @@ def update_tipo_trabajo(tipo_id, nombre=None, emoji=None, activo=None):
             if activo is not None:
                 updates.append("activo = %s")
                 params.append(activo)
+            if orden is not None:
+                updates.append("orden = %s")
+                params.append(orden)
             
             if updates:
                 params.append(tipo_id)
@@ -1024,7 +1670,7 @@ def update_tipo_trabajo(tipo_id, nombre=None, emoji=None, activo=None):
                 conn.commit()
                 return True
             return False
-    except psycopg2.IntegrityError:
+    except IntegrityError:
         conn.rollback()
         return False
     finally:
@@ -1086,29 +1732,53 @@ def get_avance_details_extended(avance_id):
 
 def get_jerarquia_ubicaciones():
     """Obtiene la estructura jerárquica de ubicaciones organizadas por tipo."""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            # Obtener tipos en orden preferido
-            tipos_ordenados = ['Edificio', 'Zona', 'Planta', 'Trabajo']
-            jerarquia = {}
-            
-            for tipo in tipos_ordenados:
-                cur.execute("SELECT id, nombre FROM ubicaciones_config WHERE tipo = %s ORDER BY nombre;", (tipo,))
-                jerarquia[tipo] = [{"id": row[0], "nombre": row[1]} for row in cur.fetchall()]
-            
-            # Agregar tipos adicionales que no están en el orden predefinido
-            cur.execute("SELECT DISTINCT tipo FROM ubicaciones_config WHERE tipo NOT IN %s;", (tuple(tipos_ordenados),))
-            for row in cur.fetchall():
-                tipo = row[0]
-                cur.execute("SELECT id, nombre FROM ubicaciones_config WHERE tipo = %s ORDER BY nombre;", (tipo,))
-                jerarquia[tipo] = [{"id": row[0], "nombre": row[1]} for row in cur.fetchall()]
-            
-            return jerarquia
-    finally:
-        conn.close()
-
-def get_avances_with_filters_extended(filters=None, start_date=None, end_date=None, user_id=None, estados=None):
+    tree, tipos = _get_ubicaciones_tree()
+    # Tipos en orden preferido y, detrás, los adicionales
+    tipos_ordenados = ['Edificio', 'Zona', 'Planta', 'Trabajo']
+    jerarquia = {}
+    for tipo in tipos_ordenados + [t for t in tipos if t not in tipos_ordenados]:
+        jerarquia[tipo] = [dict(u) for u in tree.get(tipo, [])]
+    return jerarquia
+
+def _avances_where(filters=None, start_date=None, end_date=None, user_id=None, estados=None, tipo_trabajo_id=None):
+    """WHERE común de los listados y resúmenes de avances (alias 'a'). Devuelve (sql, params)."""
+    where_clauses = []
+    params = []
+
+    # Filtros de ubicación
+    _add_ubicacion_filters(filters, where_clauses, params)
+
+    # Filtro de fechas (cualquiera de los extremos puede quedar abierto)
+    if start_date and end_date:
+        where_clauses.append("a.fecha_trabajo BETWEEN %s AND %s")
+        params.extend([start_date, end_date])
+    elif start_date:
+        where_clauses.append("a.fecha_trabajo >= %s")
+        params.append(start_date)
+    elif end_date:
+        where_clauses.append("a.fecha_trabajo <= %s")
+        params.append(end_date)
+
+    # Filtro de usuario
+    if user_id:
+        where_clauses.append("a.encargado_id = %s")
+        params.append(user_id)
+
+    # Filtro de estados
+    if estados:
+        where_clauses.append("a.estado = ANY(%s)")
+        params.append(estados)
+
+    # Filtro de tipo de trabajo
+    if tipo_trabajo_id:
+        where_clauses.append("a.tipo_trabajo_id = %s")
+        params.append(tipo_trabajo_id)
+
+    where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+    return where_sql, params
+
+def get_avances_with_filters_extended(filters=None, start_date=None, end_date=None, user_id=None, estados=None,
+                                      tipo_trabajo_id=None, limit=None):
     """Obtiene avances con filtros extendidos incluyendo tipos de trabajo."""
     conn = get_connection()
     try:
@@ -1121,43 +1791,13 @@ def get_avances_with_filters_extended(filters=None, start_date=None, end_date=No
                 JOIN usuarios u ON a.encargado_id = u.user_id
                 LEFT JOIN tipos_trabajo tt ON a.tipo_trabajo_id = tt.id
             """
-            where_clauses = []
-            params = []
+            where_sql, params = _avances_where(filters, start_date, end_date, user_id, estados, tipo_trabajo_id)
+            base_sql += where_sql
+            base_sql += " ORDER BY a.fecha_trabajo DESC, a.id DESC"
 
-            # Filtros de ubicación
-            if filters:
-                pattern_parts = []
-                filter_keys_ordered = ['edificio', 'zona', 'planta', 'trabajo']
-                for key in filter_keys_ordered:
-                    if filters.get(key):
-                        pattern_parts.append(filters.get(key))
-                    else:
-                        break
-                
-                if pattern_parts:
-                    like_pattern = " / ".join(pattern_parts) + "%"
-                    where_clauses.append("a.ubicacion_completa LIKE %s")
-                    params.append(like_pattern)
-
-            # Filtro de fechas
-            if start_date and end_date:
-                where_clauses.append("a.fecha_trabajo BETWEEN %s AND %s")
-                params.extend([start_date, end_date])
-
-            # Filtro de usuario
-            if user_id:
-                where_clauses.append("a.encargado_id = %s")
-                params.append(user_id)
-
-            # Filtro de estados
-            if estados:
-                where_clauses.append("a.estado = ANY(%s)")
-                params.append(estados)
-
-            if where_clauses:
-                base_sql += " WHERE " + " AND ".join(where_clauses)
-            
-            base_sql += " ORDER BY a.fecha_trabajo DESC, a.id DESC;"
+            if limit:
+                base_sql += " LIMIT %s"
+                params.append(limit)
             
             cur.execute(base_sql, tuple(params))
             
@@ -1254,6 +1894,160 @@ def add_rrhh_note_to_solicitud(solicitud_id, rrhh_user_id, nota):
     finally:
         conn.close()
 
+# =============================================================================
+# SUSCRIPCIONES A INFORMES PROGRAMADOS
+# =============================================================================
+
+def _filtros_key(filtros):
+    """JSON canónico de los filtros: el mismo preset siempre da la misma cadena (UNIQUE)."""
+    return json.dumps(filtros or {}, sort_keys=True, ensure_ascii=False)
+
+def add_report_subscription(user_id, tipo_informe, periodicidad, formato, filtros=None):
+    """
+    Suscribe al usuario a un informe periódico ('semanal' o 'mensual') con un
+    preset de filtros. Devuelve False si ya estaba suscrito al mismo informe.
+    """
+    return execute_query(
+        """
+        INSERT INTO report_subscriptions (user_id, tipo_informe, periodicidad, formato, filtros)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (user_id, tipo_informe, periodicidad, formato, filtros) DO NOTHING
+        """,
+        (user_id, tipo_informe, periodicidad, formato, _filtros_key(filtros))
+    ) > 0
+
+def get_report_subscriptions(user_id=None, periodicidad=None):
+    """Suscripciones (de un usuario y/o una periodicidad) con los filtros ya decodificados."""
+    where_clauses, params = [], []
+    if user_id is not None:
+        where_clauses.append("user_id = %s")
+        params.append(user_id)
+    if periodicidad is not None:
+        where_clauses.append("periodicidad = %s")
+        params.append(periodicidad)
+    where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    rows = execute_query(
+        f"""
+        SELECT id, user_id, tipo_informe, periodicidad, formato, filtros
+        FROM report_subscriptions {where_sql}
+        ORDER BY tipo_informe, periodicidad, formato, filtros, id
+        """,
+        params, fetch_all=True
+    )
+    for row in rows:
+        row['filtros'] = json.loads(row['filtros'] or '{}')
+    return rows
+
+def delete_report_subscription(subscription_id, user_id):
+    """Elimina una suscripción del usuario. Devuelve True si existía."""
+    return execute_query(
+        "DELETE FROM report_subscriptions WHERE id = %s AND user_id = %s",
+        (subscription_id, user_id)
+    ) > 0
+
+# =============================================================================
+# FOTOS (file_id de Telegram)
+# =============================================================================
+
+def remember_photo_file_id(foto_path, file_id, file_unique_id):
+    """Guarda (o actualiza) el file_id de Telegram de una foto guardada en foto_path."""
+    execute_query(
+        """
+        INSERT INTO fotos (path, file_id, file_unique_id) VALUES (%s, %s, %s)
+        ON CONFLICT (path) DO UPDATE SET
+            file_id = EXCLUDED.file_id,
+            file_unique_id = EXCLUDED.file_unique_id,
+            fecha_actualizacion = NOW()
+        """,
+        (str(foto_path), file_id, file_unique_id)
+    )
+
+def register_photo(foto_path, sha256, size_bytes, mime_type, file_id, file_unique_id):
+    """Registra una foto del almacén (photo_store) con sus metadatos y su file_id."""
+    execute_query(
+        """
+        INSERT INTO fotos (path, sha256, size_bytes, mime_type, file_id, file_unique_id)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (path) DO UPDATE SET
+            file_id = EXCLUDED.file_id,
+            file_unique_id = EXCLUDED.file_unique_id,
+            fecha_actualizacion = NOW()
+        """,
+        (str(foto_path), sha256, size_bytes, mime_type, file_id, file_unique_id)
+    )
+
+def get_photo_file_id(foto_path):
+    """Devuelve el file_id de Telegram de la foto, o None si nunca se anotó."""
+    row = execute_query("SELECT file_id FROM fotos WHERE path = %s", (str(foto_path),), fetch_one=True)
+    return row['file_id'] if row else None
+
+def forget_photo(foto_path):
+    """Borra los metadatos (file_id, hash) de una foto eliminada del disco."""
+    execute_query("DELETE FROM fotos WHERE path = %s", (str(foto_path),))
+
+# =============================================================================
+# FOTOS ADJUNTAS (varias por avance/incidencia)
+# =============================================================================
+
+# entidad -> tabla con la columna foto_path (primera foto, por compatibilidad)
+FOTO_ENTIDADES = {
+    'avance': 'avances',
+    'incidencia': 'incidencias',
+    'prevencion': 'prevencion_incidencias',
+}
+
+def _normalize_fotos(fotos, foto_path):
+    """Devuelve (lista de fotos, foto_path) coherentes: foto_path es siempre la primera."""
+    fotos = [path for path in (fotos or ([foto_path] if foto_path else [])) if path]
+    return fotos, foto_path or (fotos[0] if fotos else None)
+
+def _insert_fotos(cur, entidad, entidad_id, fotos):
+    """Inserta las fotos de la entidad en foto_adjuntos, en la transacción del cursor."""
+    if fotos:
+        cur.executemany(
+            "INSERT INTO foto_adjuntos (entidad, entidad_id, foto_path, orden) VALUES (%s, %s, %s, %s)",
+            [(entidad, entidad_id, str(path), orden) for orden, path in enumerate(fotos)]
+        )
+
+# Tablas cuya columna foto_path apunta a una foto en disco (además de foto_adjuntos)
+FOTO_TABLAS = ('avances', 'incidencias', 'averias', 'prevencion_incidencias', 'ordenes_trabajo', 'foto_adjuntos')
+
+def get_referenced_photo_paths(prefix):
+    """Conjunto de rutas de foto referenciadas por alguna fila que empiezan por prefix."""
+    sql = " UNION ".join(f"SELECT foto_path FROM {table} WHERE foto_path LIKE %s" for table in FOTO_TABLAS)
+    rows = execute_query(sql, (f"{prefix}%",) * len(FOTO_TABLAS), fetch_all=True)
+    return {row['foto_path'] for row in rows}
+
+def purge_dangling_photo_attachments():
+    """Borra de foto_adjuntos las fotos de avances/incidencias que ya no existen. Devuelve cuántas."""
+    deleted = 0
+    for entidad, table in FOTO_ENTIDADES.items():
+        deleted += execute_query(
+            f"""
+            DELETE FROM foto_adjuntos WHERE entidad = %s
+              AND NOT EXISTS (SELECT 1 FROM {table} t WHERE t.id = foto_adjuntos.entidad_id)
+            """,
+            (entidad,)
+        )
+    return deleted
+
+def get_entity_photos(entidad, entidad_id):
+    """
+    Rutas de las fotos de un avance ('avance'), incidencia ('incidencia') o
+    incidencia de prevención ('prevencion'), en el orden en que se enviaron.
+    Si no hay adjuntos (filas creadas por código antiguo) usa foto_path.
+    """
+    rows = execute_query(
+        "SELECT foto_path FROM foto_adjuntos WHERE entidad = %s AND entidad_id = %s ORDER BY orden, id",
+        (entidad, entidad_id), fetch_all=True
+    )
+    if rows:
+        return [row['foto_path'] for row in rows]
+    row = execute_query(
+        f"SELECT foto_path FROM {FOTO_ENTIDADES[entidad]} WHERE id = %s", (entidad_id,), fetch_one=True
+    )
+    return [row['foto_path']] if row and row['foto_path'] else []
+
 # =============================================================================
 # FUNCIONES DE ÓRDENES DE TRABAJO
 # =============================================================================
@@ -1395,7 +2189,7 @@ def update_almacen_item_details(item_id, nombre, descripcion):
             conn.commit()
             # Devuelve True si la actualización fue exitosa
             return cur.rowcount > 0
-    except psycopg2.IntegrityError:
+    except IntegrityError:
         # Esto ocurriría si el nuevo nombre ya existe (debido a la restricción UNIQUE)
         conn.rollback()
         return False
@@ -1406,7 +2200,7 @@ def update_almacen_item_details(item_id, nombre, descripcion):
 def delete_almacen_item(item_id):
     """
     Elimina un artículo del almacén por su ID.
-    Lanzará una excepción psycopg2.IntegrityError si el artículo está
+    Lanzará una excepción IntegrityError si el artículo está
     referenciado en otras tablas (pedidos, incidencias).
     """
     conn = get_connection()
@@ -1414,7 +2208,454 @@ def delete_almacen_item(item_id):
         with conn.cursor() as cur:
             cur.execute("DELETE FROM almacen_items WHERE id = %s", (item_id,))
             conn.commit()
+            _invalidate_counts('almacen_items')
             # Devuelve True si se eliminó una fila
             return cur.rowcount > 0
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+# =============================================================================
+# ROLLUP DIARIO DE AVANCES
+# =============================================================================
+
+# avances_diario (migración 4) guarda cuántos avances hay por
+# (fecha, edificio, tipo de trabajo, encargado, estado). Se mantiene en la misma
+# transacción que cada alta (create_avance), así los resúmenes por periodo
+# leen unas pocas filas por día en lugar de recorrer todo el histórico.
+# La clave no admite NULL: los valores ausentes se guardan como '' / 0.
+# Ningún flujo cambia hoy el estado de un avance. El que lo haga debe mover el
+# conteo con _rollup_add en la misma transacción y con un compare-and-set
+# (UPDATE ... WHERE id = %s AND estado = <anterior>, y nada si rowcount == 0):
+# sin bloqueo de fila, dos cambios simultáneos restarían dos veces del estado
+# anterior. Si no, rebuild_avances_rollup() deja el rollup al día.
+_ROLLUP_SIN_FECHA = date(1970, 1, 1)  # avances sin fecha_trabajo
+
+_ROLLUP_UPSERT_SQL = """
+    INSERT INTO avances_diario (fecha, edificio, tipo_trabajo_id, encargado_id, estado, cantidad)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (fecha, edificio, tipo_trabajo_id, encargado_id, estado)
+    DO UPDATE SET cantidad = avances_diario.cantidad + EXCLUDED.cantidad;
+"""
+
+def _rollup_add(cur, fecha, edificio, tipo_trabajo_id, encargado_id, estado, delta=1):
+    """Suma delta al contador de avances_diario de esa clave (usar dentro de la transacción del cambio)."""
+    cur.execute(_ROLLUP_UPSERT_SQL, (
+        fecha or _ROLLUP_SIN_FECHA, edificio or '', tipo_trabajo_id or 0, encargado_id or 0, estado or '', delta
+    ))
+
+def _rebuild_avances_rollup(cur):
+    cur.execute("DELETE FROM avances_diario;")
+    cur.execute("""
+        INSERT INTO avances_diario (fecha, edificio, tipo_trabajo_id, encargado_id, estado, cantidad)
+        SELECT COALESCE(fecha_trabajo, %s), COALESCE(ubicacion_edificio, ''), COALESCE(tipo_trabajo_id, 0),
+               COALESCE(encargado_id, 0), COALESCE(estado, ''), COUNT(*)
+        FROM avances
+        GROUP BY COALESCE(fecha_trabajo, %s), COALESCE(ubicacion_edificio, ''), COALESCE(tipo_trabajo_id, 0),
+                 COALESCE(encargado_id, 0), COALESCE(estado, '');
+    """, (_ROLLUP_SIN_FECHA, _ROLLUP_SIN_FECHA))
+    return cur.rowcount
+
+def rebuild_avances_rollup():
+    """Recalcula avances_diario desde cero a partir de avances. Devuelve las filas generadas."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            filas = _rebuild_avances_rollup(cur)
+            conn.commit()
+            logger.info(f"📊 Rollup de avances reconstruido: {filas} filas")
+            return filas
+    except DatabaseError:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _rollup_where(filters=None, start_date=None, end_date=None, user_id=None, estados=None, tipo_trabajo_id=None):
+    """
+    Equivalente de _avances_where sobre avances_diario (alias 'd'), o None si algún
+    filtro no está en la clave del rollup (niveles de ubicación por debajo del edificio).
+    """
+    where_clauses = []
+    params = []
+    for key, value in (filters or {}).items():
+        if not value:
+            continue
+        if key.lower() != 'edificio':
+            return None
+        where_clauses.append("d.edificio = %s")
+        params.append(value)
+
+    if start_date:
+        where_clauses.append("d.fecha >= %s")
+        params.append(start_date)
+    elif end_date:
+        where_clauses.append("d.fecha > %s")  # un rango de fechas nunca incluye avances sin fecha
+        params.append(_ROLLUP_SIN_FECHA)
+    if end_date:
+        where_clauses.append("d.fecha <= %s")
+        params.append(end_date)
+    if user_id:
+        where_clauses.append("d.encargado_id = %s")
+        params.append(user_id)
+    if estados:
+        where_clauses.append("d.estado = ANY(%s)")
+        params.append(estados)
+    if tipo_trabajo_id:
+        where_clauses.append("d.tipo_trabajo_id = %s")
+        params.append(tipo_trabajo_id)
+
+    where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+    return where_sql, params
+
+# =============================================================================
+# FUNCIONES DE ESTADÍSTICAS
+# =============================================================================
+
+# Resumen completo en una sola sentencia. El CTE r deja los avances filtrados ya
+# contados por (estado, tipo, encargado), desde avances o desde avances_diario;
+# cada subconsulta agrega sobre él (JSON), así que a Python solo llegan los
+# totales y las últimas filas, no todos los avances del periodo.
+_SUMMARY_SOURCE_AVANCES = """
+    SELECT a.estado, a.tipo_trabajo_id, a.encargado_id, COUNT(*) AS cantidad
+    FROM avances a{where}
+    GROUP BY a.estado, a.tipo_trabajo_id, a.encargado_id
+"""
+
+_SUMMARY_SOURCE_ROLLUP = """
+    SELECT NULLIF(d.estado, '') AS estado, d.tipo_trabajo_id, d.encargado_id, SUM(d.cantidad) AS cantidad
+    FROM avances_diario d{where}
+    GROUP BY d.estado, d.tipo_trabajo_id, d.encargado_id
+"""
+
+_AVANCES_SUMMARY_SQL = """
+    WITH r AS ({source})
+    SELECT
+        (SELECT COALESCE(SUM(cantidad), 0) FROM r) AS total,
+        (SELECT COALESCE(json_agg(json_build_object('estado', e.estado, 'cantidad', e.cantidad)), '[]'::json)
+         FROM (SELECT estado, SUM(cantidad) AS cantidad FROM r
+               GROUP BY estado HAVING SUM(cantidad) > 0 ORDER BY cantidad DESC) e) AS por_estado,
+        (SELECT COALESCE(json_agg(json_build_object('nombre', t.nombre, 'emoji', t.emoji, 'cantidad', t.cantidad)), '[]'::json)
+         FROM (SELECT tt.nombre, tt.emoji, SUM(r.cantidad) AS cantidad
+               FROM r LEFT JOIN tipos_trabajo tt ON r.tipo_trabajo_id = tt.id
+               GROUP BY tt.nombre, tt.emoji HAVING SUM(r.cantidad) > 0 ORDER BY cantidad DESC) t) AS por_tipo,
+        (SELECT COALESCE(json_agg(json_build_object('nombre', e.first_name, 'cantidad', e.cantidad)), '[]'::json)
+         FROM (SELECT u.first_name, SUM(r.cantidad) AS cantidad
+               FROM r LEFT JOIN usuarios u ON r.encargado_id = u.user_id
+               GROUP BY u.first_name HAVING SUM(r.cantidad) > 0
+               ORDER BY cantidad DESC, u.first_name{top_limit}) e) AS top_encargados,
+        (SELECT COALESCE(json_agg(json_build_object(
+                    'id', l.id, 'ubicacion', l.ubicacion_completa, 'trabajo', l.trabajo, 'estado', l.estado,
+                    'fecha', l.fecha_trabajo, 'observaciones', l.observaciones,
+                    'encargado_nombre', COALESCE(l.first_name, ''), 'encargado_username', l.username,
+                    'tipo_trabajo', l.tipo_nombre, 'tipo_trabajo_emoji', l.tipo_emoji)), '[]'::json)
+         FROM (SELECT a.id, a.ubicacion_completa, a.trabajo, a.estado, a.fecha_trabajo, a.observaciones,
+                      u.first_name, u.username, tt.nombre AS tipo_nombre, tt.emoji AS tipo_emoji
+               FROM avances a
+               LEFT JOIN usuarios u ON a.encargado_id = u.user_id
+               LEFT JOIN tipos_trabajo tt ON a.tipo_trabajo_id = tt.id{where}
+               ORDER BY a.fecha_trabajo DESC, a.id DESC LIMIT %s) l) AS latest
+"""
+
+def get_avances_summary(filters=None, start_date=None, end_date=None, user_id=None, estados=None,
+                        tipo_trabajo_id=None, top_n=3, latest_k=3, use_rollup=True):
+    """
+    Resumen de los avances que cumplen los filtros (mismos que get_avances_with_filters_extended)
+    en una sola consulta: total, conteo por estado y por tipo de trabajo, los top_n encargados
+    (None = todos) y los latest_k avances más recientes.
+    Los conteos salen de avances_diario siempre que los filtros estén en su clave
+    (fechas, edificio, encargado, estado, tipo); si no, se agregan sobre avances.
+    """
+    where_sql, params = _avances_where(filters, start_date, end_date, user_id, estados, tipo_trabajo_id)
+    rollup = _rollup_where(filters, start_date, end_date, user_id, estados, tipo_trabajo_id) if use_rollup else None
+    if rollup:
+        source = _SUMMARY_SOURCE_ROLLUP.format(where=rollup[0])
+        source_params = rollup[1]
+    else:
+        source = _SUMMARY_SOURCE_AVANCES.format(where=where_sql)
+        source_params = list(params)
+
+    top_limit = ""
+    if top_n is not None:
+        top_limit = " LIMIT %s"
+        source_params.append(top_n)
+    sql = _AVANCES_SUMMARY_SQL.format(source=source, top_limit=top_limit, where=where_sql)
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, tuple(source_params + params + [latest_k]))
+            row = cur.fetchone()
+    finally:
+        conn.close()
+
+    por_estado = {e['estado']: e['cantidad'] for e in _json_list(row[1])}
+    latest = _json_list(row[4])
+    for avance in latest:
+        if isinstance(avance['fecha'], str):
+            avance['fecha'] = datetime.fromisoformat(avance['fecha']).date()
+    return {
+        'total': int(row[0]),
+        'por_estado': por_estado,
+        'finalizados': por_estado.get('Finalizado', 0),
+        'con_incidencia': por_estado.get('Con Incidencia', 0),
+        'por_tipo': _json_list(row[2]),
+        'top_encargados': _json_list(row[3]),
+        'latest': latest,
+    }
+
+def get_estadisticas_avances(fecha_inicio=None, fecha_fin=None):
+    """Obtiene estadísticas de avances."""
+    summary = get_avances_summary(start_date=fecha_inicio, end_date=fecha_fin, top_n=None, latest_k=0)
+    return {
+        'total': summary['total'],
+        'por_tipo': summary['por_tipo'],
+        'por_encargado': [{'first_name': e['nombre'], 'cantidad': e['cantidad']} for e in summary['top_encargados']]
+    }
+
+# =============================================================================
+# FUNCIONES DE ADMINISTRACIÓN
+# =============================================================================
+
+def reset_database_safely(preserve_admin_user_id=195947658):
+    """
+    Limpia todas las tablas pero preserva el usuario admin especificado.
+    Solo usuarios con rol Admin pueden ejecutar esta función.
+    Si algo falla se deshace todo (no queda nada borrado a medias).
+    """
+    conn = None
+    try:
+        # Primero verificar que el usuario a preservar existe y es admin
+        admin_user = execute_query(
+            "SELECT user_id, username, first_name, role FROM usuarios WHERE user_id = %s AND role = 'Admin'",
+            (preserve_admin_user_id,),
+            fetch_one=True
+        )
+        
+        if not admin_user:
+            raise Exception(f"Usuario admin {preserve_admin_user_id} no encontrado o no es Admin")
+        
+        # Orden de limpieza (respetando dependencias)
+        cleanup_queries = [
+            "DELETE FROM avances",
+            "DELETE FROM avances_diario",  # Rollup de avances
+            "DELETE FROM foto_adjuntos",
+            "DELETE FROM incidencias WHERE id IS NOT NULL",  # Si existe la tabla
+            "DELETE FROM pedidos WHERE id IS NOT NULL",      # Si existe la tabla
+            "DELETE FROM averias WHERE id IS NOT NULL",      # Si existe la tabla
+            "DELETE FROM registros_personal WHERE id IS NOT NULL",  # Si existe la tabla
+            "DELETE FROM report_subscriptions WHERE user_id != %s",
+            "DELETE FROM usuarios WHERE user_id != %s",  # Preservar admin
+            "DELETE FROM tipos_trabajo WHERE id IS NOT NULL",
+            "DELETE FROM ubicaciones_config WHERE id IS NOT NULL",
+            "DELETE FROM almacen_items WHERE id IS NOT NULL"
+        ]
+        
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        # Deshabilitar checks de foreign key temporalmente si es PostgreSQL
+        if not USE_SQLITE:
+            cursor.execute("SET session_replication_role = 'replica'")
+        
+        deleted_counts = {}
+        
+        for query in cleanup_queries:
+            try:
+                # Contar antes de eliminar
+                table_name = query.split("FROM ")[1].split(" ")[0]
+                count_query = f"SELECT COUNT(*) FROM {table_name}"
+                if "WHERE" in query:
+                    count_query += " WHERE " + query.split("WHERE", 1)[1]
+                
+                params = (preserve_admin_user_id,) if "%s" in query else None
+                cursor.execute(count_query, params)
+                before_count = cursor.fetchone()[0]
+                
+                # Ejecutar limpieza
+                cursor.execute(query, params)
+                
+                affected = cursor.rowcount
+                deleted_counts[table_name] = {
+                    'before': before_count,
+                    'deleted': affected,
+                    'remaining': before_count - affected
+                }
+                
+            except Exception as e:
+                # Algunas tablas pueden no existir, continuar
+                print(f"⚠️ Error limpiando {table_name}: {e}")
+                continue
+        
+        # Restablecer foreign key checks
+        if not USE_SQLITE:
+            cursor.execute("SET session_replication_role = 'origin'")
+        
+        # Reinsertar datos básicos
+        print("📥 Reinsertando datos básicos...")
+        
+        # Tipos de trabajo por defecto
+        tipos_trabajo_default = [
+            ('Albañilería', '🧱', 1),
+            ('Electricidad', '⚡', 2),
+            ('Fontanería', '🔧', 3),
+            ('Pintura', '🎨', 4),
+            ('Carpintería', '🪚', 5),
+            ('Limpieza', '🧹', 6),
+            ('Inspección', '🔍', 7),
+            ('Otro', '📝', 8)
+        ]
+        
+        cursor.executemany(
+            "INSERT INTO tipos_trabajo (nombre, emoji, orden, creado_por) VALUES (%s, %s, %s, %s)",
+            [(nombre, emoji, orden, preserve_admin_user_id) for nombre, emoji, orden in tipos_trabajo_default]
+        )
+        
+        # Ubicaciones por defecto
+        ubicaciones_default = [
+            ('Edificio', 'Edificio 1'),
+            ('Edificio', 'Edificio 2'),
+            ('Edificio', 'Edificio 3'),
+            ('Planta', 'Planta 0'),
+            ('Planta', 'Planta 1'),
+            ('Planta', 'Planta 2'),
+            ('Planta', 'Planta 3'),
+            ('Zona', 'Zona 1'),
+            ('Zona', 'Zona 2'),
+            ('Zona', 'Zona 3'),
+            ('Zona', 'Zona 4'),
+            ('Trabajo', 'Trabajo 1'),
+            ('Trabajo', 'Trabajo 2'),
+            ('Trabajo', 'Trabajo 3')
+        ]
+        
+        cursor.executemany("INSERT INTO ubicaciones_config (tipo, nombre) VALUES (%s, %s)", ubicaciones_default)
+        
+        conn.commit()
+        cursor.close()
+        invalidate_ubicaciones_cache()
+        invalidate_user_cache()
+        _count_cache.clear()
+        _bump_data_version('avances')
+        _bump_data_version('incidencias')
+        
+        # Resumen
+        total_deleted = sum(info['deleted'] for info in deleted_counts.values())
+        
+        return {
+            'success': True,
+            'preserved_admin': admin_user,
+            'deleted_counts': deleted_counts,
+            'total_deleted': total_deleted,
+            'message': f'Base de datos limpiada. {total_deleted} registros eliminados. Admin {admin_user["first_name"]} preservado.'
+        }
+        
+    except Exception as e:
+        if conn is not None:
+            conn.rollback()
+        return {
+            'success': False,
+            'error': str(e),
+            'message': f'Error limpiando base de datos: {e}'
+        }
+    finally:
+        if conn is not None:
+            conn.close()
+
+def get_database_statistics():
+    """Obtiene estadísticas generales de la base de datos."""
+    try:
+        tables_info = {}
+        
+        # Lista de tablas principales (avances se cuenta desde el rollup, más abajo)
+        main_tables = ['usuarios', 'tipos_trabajo', 'ubicaciones_config', 'almacen_items']
+        
+        for table in main_tables:
+            try:
+                count_result = execute_query(f"SELECT COUNT(*) AS total FROM {table}", fetch_one=True)
+                tables_info[table] = count_result['total']
+            except Exception:
+                tables_info[table] = 0
+        
+        # Información adicional de avances
+        try:
+            avances_stats = get_estadisticas_avances()
+            tables_info['avances_stats'] = avances_stats
+        except Exception:
+            tables_info['avances_stats'] = {'total': 0, 'por_tipo': [], 'por_encargado': []}
+        tables_info['avances'] = tables_info['avances_stats']['total']
+        
+        return {
+            'success': True,
+            'tables': tables_info,
+            'database_type': 'SQLite' if USE_SQLITE else 'PostgreSQL'
+        }
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+def backup_database_to_json():
+    """Crea un backup completo de la base de datos en formato JSON."""
+    try:
+        import json
+        
+        backup_data = {
+            'backup_date': datetime.now().isoformat(),
+            'database_type': 'SQLite' if USE_SQLITE else 'PostgreSQL',
+            'tables': {}
+        }
+        
+        # Tablas a respaldar
+        tables_to_backup = ['usuarios', 'tipos_trabajo', 'ubicaciones_config', 'avances', 'almacen_items']
+        
+        total_records = 0
+        
+        for table in tables_to_backup:
+            try:
+                data = execute_query(f"SELECT * FROM {table}", fetch_all=True)
+                backup_data['tables'][table] = data or []
+                total_records += len(data or [])
+            except Exception as e:
+                backup_data['tables'][table] = []
+                print(f"⚠️ Error respaldando {table}: {e}")
+        
+        # Guardar backup
+        backup_dir = Path(__file__).parent / 'data' / 'backups'
+        backup_dir.mkdir(parents=True, exist_ok=True)
+        
+        backup_filename = f'backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
+        backup_path = backup_dir / backup_filename
+        
+        with open(backup_path, 'w', encoding='utf-8') as f:
+            json.dump(backup_data, f, indent=2, ensure_ascii=False, default=str)
+        
+        return {
+            'success': True,
+            'backup_path': str(backup_path),
+            'total_records': total_records,
+            'tables_backed_up': len(tables_to_backup)
+        }
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+def test_database_connection():
+    """Prueba la conexión a la base de datos."""
+    try:
+        result = execute_query("SELECT COUNT(*) AS total FROM tipos_trabajo", fetch_one=True)
+        count = result['total'] if result else 0
+        print(f"✅ Conexión exitosa! Tipos de trabajo: {count}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Error de conexión: {e}")
+        return False
+
+# Latencia, filas y errores de cada función pública (ver db_metrics)
+db_metrics.instrument_module(globals(), __name__, exclude=(
+    'get_connection', 'close_all_connections', 'get_pool_stats',
+))
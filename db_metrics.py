@@ -0,0 +1,271 @@
+"""
+Métricas en memoria de la capa de datos.
+
+Cada función pública de db_manager (y los nombres antiguos de db_adapter) se
+envuelve con `instrument_module`, que mide su duración, las filas devueltas y
+los errores. Solo cuenta la llamada instrumentada más externa de cada hilo: las
+que hace por dentro (p. ej. get_user_role -> get_user_roles) van en su tiempo.
+Además, cada sentencia ejecutada por el Cursor de db_manager se registra por
+su huella SQL (la consulta normalizada, sin literales).
+
+Las sentencias que superan DB_SLOW_QUERY_MS se escriben en el log `db_slow`
+con la función que las lanzó, su huella y la forma de los parámetros (tipos,
+nunca valores). Todo se acumula desde el arranque; `top_queries()` y
+`top_functions()` devuelven los rankings que muestra el panel de admin.
+"""
+import os
+import re
+import time
+import logging
+import threading
+import functools
+import inspect
+import contextvars
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("db_slow")
+
+DB_METRICS_ENABLED = os.getenv("DB_METRICS_ENABLED", "true").lower() == "true"
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+DB_METRICS_TOP_N = int(os.getenv("DB_METRICS_TOP_N", "5"))
+
+# Límites superiores (ms) de los cubos del histograma; el último recoge el resto
+HISTOGRAM_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+# Función de db_manager que está ejecutando la sentencia actual
+_current_function = contextvars.ContextVar("db_current_function", default=None)
+# Profundidad de llamadas instrumentadas en curso en cada hilo: solo se mide la exterior
+_call_depth = threading.local()
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACES_RE = re.compile(r"\s+")
+
+
+class _Stat:
+    """Contador, errores, filas e histograma de latencias de una clave."""
+
+    __slots__ = ("count", "errors", "rows", "total_ms", "max_ms", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * len(HISTOGRAM_BUCKETS_MS)
+
+    def add(self, elapsed_ms, rows, error):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if error:
+            self.errors += 1
+        if rows:
+            self.rows += rows
+        for i, limit in enumerate(HISTOGRAM_BUCKETS_MS):
+            if elapsed_ms <= limit:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, p):
+        """Percentil aproximado: límite superior del cubo que lo contiene."""
+        if not self.count:
+            return 0.0
+        target = self.count * p
+        seen = 0
+        for limit, n in zip(HISTOGRAM_BUCKETS_MS, self.buckets):
+            seen += n
+            if seen >= target:
+                return min(limit, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self, name):
+        return {
+            "name": name,
+            "count": self.count,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_ms": round(self.total_ms, 2),
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "p95_ms": round(self.percentile(0.95), 2),
+            "histogram": dict(zip(HISTOGRAM_BUCKETS_MS, self.buckets)),
+        }
+
+
+_lock = threading.Lock()
+_functions = {}
+_queries = {}
+_query_functions = {}  # huella -> última función que la lanzó
+_slow_count = 0
+_started_at = time.time()
+
+
+# =============================================================================
+# NORMALIZACIÓN
+# =============================================================================
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """Huella de una sentencia: literales y números sustituidos por '?' y espacios colapsados."""
+    sql = _LITERAL_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    return _SPACES_RE.sub(" ", sql).strip().rstrip(";")
+
+def params_shape(params):
+    """Describe los parámetros por su tipo (p. ej. '(int, str, list[3])'), sin sus valores."""
+    if params is None:
+        return "()"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    parts = []
+    for value in params:
+        if isinstance(value, (list, tuple, set)):
+            parts.append(f"{type(value).__name__}[{len(value)}]")
+        else:
+            parts.append(type(value).__name__)
+    return "(" + ", ".join(parts) + ")"
+
+def _count_rows(result):
+    """Filas devueltas por una función: listas por su longitud, un registro cuenta 1."""
+    if result is None or isinstance(result, (bool, int, float, str)):
+        return 0  # IDs, rowcounts y flags: las filas de DML ya se cuentan por sentencia
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 1
+
+
+# =============================================================================
+# REGISTRO
+# =============================================================================
+
+def record_query(sql, params, elapsed_ms, rows=0, error=False):
+    """Registra la ejecución de una sentencia (lo llama el Cursor de db_manager)."""
+    global _slow_count
+    key = fingerprint(sql)
+    function = _current_function.get()
+    slow = elapsed_ms >= DB_SLOW_QUERY_MS
+    with _lock:
+        stat = _queries.get(key)
+        if stat is None:
+            stat = _queries[key] = _Stat()
+        stat.add(elapsed_ms, rows, error)
+        if function:
+            _query_functions[key] = function
+        if slow:
+            _slow_count += 1
+    if slow:
+        slow_logger.warning(
+            f"🐢 {elapsed_ms:.0f} ms en {function or '?'}: {key} | params {params_shape(params)}"
+        )
+
+def _record_function(name, elapsed_ms, rows, error):
+    with _lock:
+        stat = _functions.get(name)
+        if stat is None:
+            stat = _functions[name] = _Stat()
+        stat.add(elapsed_ms, rows, error)
+
+def instrument(func, name=None):
+    """
+    Envuelve una función de acceso a datos para medir su latencia, filas y errores.
+    Las llamadas anidadas (get_user_role -> get_user_roles -> ...) cuentan solo en
+    la función exterior, que es también a la que se atribuyen sus sentencias.
+    """
+    name = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_call_depth, "value", 0)
+        if depth:
+            _call_depth.value = depth + 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _call_depth.value = depth
+        _call_depth.value = 1
+        token = _current_function.set(name)
+        start = time.perf_counter()
+        error = False
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except Exception:
+            error = True
+            raise
+        finally:
+            _call_depth.value = 0
+            _current_function.reset(token)
+            _record_function(name, (time.perf_counter() - start) * 1000, _count_rows(result), error)
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
+def instrument_module(namespace, module_name, exclude=()):
+    """
+    Instrumenta todas las funciones públicas definidas en un módulo.
+    Se llama al final del módulo con `instrument_module(globals(), __name__)`.
+    """
+    if not DB_METRICS_ENABLED:
+        return
+    for name, obj in list(namespace.items()):
+        if (name.startswith("_") or name in exclude or not callable(obj)
+                or getattr(obj, "__module__", None) != module_name
+                or getattr(obj, "__instrumented__", False) or isinstance(obj, type)
+                or inspect.isgeneratorfunction(obj)):
+            # Los generadores se ejecutan al iterarlos, fuera del envoltorio:
+            # sus sentencias se siguen registrando por huella
+            continue
+        namespace[name] = instrument(obj, name)
+
+
+# =============================================================================
+# CONSULTA DE MÉTRICAS
+# =============================================================================
+
+def _ranking(stats, sort_key, n):
+    with _lock:
+        rows = [stat.as_dict(name) for name, stat in stats.items()]
+    rows.sort(key=lambda r: r[sort_key], reverse=True)
+    return rows[:n]
+
+def top_queries(n=DB_METRICS_TOP_N, by="max_ms"):
+    """Sentencias ordenadas por 'max_ms', 'avg_ms', 'total_ms' o 'count'."""
+    rows = _ranking(_queries, by, n)
+    with _lock:
+        for row in rows:
+            row["function"] = _query_functions.get(row["name"])
+    return rows
+
+def top_functions(n=DB_METRICS_TOP_N, by="total_ms"):
+    """Funciones de la capa de datos ordenadas por 'max_ms', 'avg_ms', 'total_ms' o 'count'."""
+    return _ranking(_functions, by, n)
+
+def get_summary():
+    """Totales desde el arranque."""
+    with _lock:
+        calls = sum(s.count for s in _functions.values())
+        errors = sum(s.errors for s in _functions.values())
+        queries = sum(s.count for s in _queries.values())
+        slow = _slow_count
+    return {
+        "since": _started_at,
+        "calls": calls,
+        "errors": errors,
+        "queries": queries,
+        "slow_queries": slow,
+        "slow_threshold_ms": DB_SLOW_QUERY_MS,
+    }
+
+def reset():
+    """Borra todas las métricas acumuladas."""
+    global _started_at, _slow_count
+    with _lock:
+        _functions.clear()
+        _queries.clear()
+        _query_functions.clear()
+        _slow_count = 0
+        _started_at = time.time()
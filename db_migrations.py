@@ -0,0 +1,286 @@
+"""
+Migraciones versionadas del esquema.
+
+init.sql solo crea las tablas. Los cambios posteriores (índices, columnas
+nuevas...) se añaden aquí como pasos numerados y se aplican al arrancar el
+bot (main.py). La tabla schema_version guarda qué versiones ya se aplicaron,
+así que cada migración se ejecuta una sola vez y en orden.
+
+Cada paso es una sentencia en sintaxis PostgreSQL (db_dialect la traduce para
+SQLite), un diccionario {dialecto: sentencia} cuando la sintaxis no tiene
+equivalente directo, o una función que recibe el cursor (p. ej.
+`_add_column`). Los pasos deben ser idempotentes (IF NOT EXISTS).
+"""
+import logging
+
+import db_manager
+from db_dialect import POSTGRES, SQLITE
+
+logger = logging.getLogger(__name__)
+
+# Clave del advisory lock de PostgreSQL: evita que dos instancias del bot
+# apliquen las mismas migraciones a la vez.
+_MIGRATION_LOCK_ID = 7_240_515
+
+_SCHEMA_VERSION_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        descripcion VARCHAR(255) NOT NULL,
+        fecha_aplicacion TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    )
+"""
+
+def _add_column(table, column, definition):
+    """
+    Paso que añade una columna si no existe. SQLite no admite
+    ADD COLUMN IF NOT EXISTS, así que allí se consulta antes PRAGMA table_info.
+    """
+    def step(cur):
+        if db_manager.DIALECT == POSTGRES:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}")
+            return
+        cur.execute(f"PRAGMA table_info({table})")
+        if column not in {row[1] for row in cur.fetchall()}:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+def _backfill_ubicacion(cur):
+    """Rellena las columnas ubicacion_* de los avances antiguos a partir de ubicacion_completa."""
+    cur.execute("SELECT id, ubicacion_completa FROM avances WHERE ubicacion_edificio IS NULL")
+    rows = []
+    for avance_id, ubicacion in cur.fetchall():
+        try:
+            rows.append(db_manager._split_ubicacion(ubicacion) + (avance_id,))
+        except ValueError:
+            # Con niveles de menos no se sabe cuál falta: se deja sin desglosar
+            logger.warning(f"⚠️ Avance {avance_id}: ubicación '{ubicacion}' sin desglosar")
+    if rows:
+        cur.executemany(
+            "UPDATE avances SET ubicacion_edificio = %s, ubicacion_zona = %s, ubicacion_planta = %s, ubicacion_nucleo = %s WHERE id = %s",
+            rows
+        )
+    logger.info(f"📍 Ubicación desglosada en {len(rows)} avances")
+
+def _backfill_foto_adjuntos(cur):
+    """Copia a foto_adjuntos la foto_path de los avances e incidencias que ya tenían foto."""
+    for entidad, table in db_manager.FOTO_ENTIDADES.items():
+        cur.execute(f"""
+            INSERT INTO foto_adjuntos (entidad, entidad_id, foto_path, orden)
+            SELECT %s, t.id, t.foto_path, 0 FROM {table} t
+            WHERE t.foto_path IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM foto_adjuntos f WHERE f.entidad = %s AND f.entidad_id = t.id
+            )
+        """, (entidad, entidad))
+        logger.info(f"📸 {cur.rowcount} fotos de {table} copiadas a foto_adjuntos")
+
+# =============================================================================
+# MIGRACIONES (versión, descripción, pasos) — añadir siempre al final
+# =============================================================================
+
+MIGRATIONS = [
+    (1, "Índices de las consultas más frecuentes", [
+        # Listados de avances: ORDER BY fecha_trabajo DESC, id DESC y rangos de fechas
+        "CREATE INDEX IF NOT EXISTS idx_avances_fecha_trabajo_id ON avances (fecha_trabajo DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_avances_encargado_fecha ON avances (encargado_id, fecha_trabajo)",
+        "CREATE INDEX IF NOT EXISTS idx_avances_estado_fecha ON avances (estado, fecha_trabajo)",
+        # Filtro por prefijo: ubicacion_completa LIKE 'Edificio 1%'
+        {
+            POSTGRES: "CREATE INDEX IF NOT EXISTS idx_avances_ubicacion_prefix ON avances (ubicacion_completa text_pattern_ops)",
+            # LIKE en SQLite no distingue mayúsculas: solo usa índices NOCASE
+            SQLITE: "CREATE INDEX IF NOT EXISTS idx_avances_ubicacion_prefix ON avances (ubicacion_completa COLLATE NOCASE)",
+        },
+        "CREATE INDEX IF NOT EXISTS idx_incidencias_avance_id ON incidencias (avance_id)",
+        "CREATE INDEX IF NOT EXISTS idx_incidencias_estado_fecha ON incidencias (estado, fecha_reporte)",
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_estado_fecha ON pedidos (estado, fecha_solicitud)",
+        "CREATE INDEX IF NOT EXISTS idx_pedido_items_pedido_id ON pedido_items (pedido_id)",
+        "CREATE INDEX IF NOT EXISTS idx_solicitudes_personal_estado_fecha ON solicitudes_personal (estado, fecha_solicitud)",
+        "CREATE INDEX IF NOT EXISTS idx_solicitudes_personal_solicitante ON solicitudes_personal (solicitante_id)",
+        # ubicaciones_config.tipo ya está cubierto por UNIQUE (tipo, nombre)
+    ]),
+    (2, "Columna group_chat_id en pedidos", [
+        # Antes se añadía con ALTER TABLE en cada create_pedido
+        _add_column("pedidos", "group_chat_id", "BIGINT"),
+    ]),
+    (3, "Filtros de avances por columnas de ubicación", [
+        _backfill_ubicacion,
+        "CREATE INDEX IF NOT EXISTS idx_avances_ubicacion ON avances "
+        "(ubicacion_edificio, ubicacion_zona, ubicacion_planta, ubicacion_nucleo)",
+        # Los filtros ya no usan LIKE sobre ubicacion_completa
+        "DROP INDEX IF EXISTS idx_avances_ubicacion_prefix",
+    ]),
+    (4, "Rollup diario de avances", [
+        """
+        CREATE TABLE IF NOT EXISTS avances_diario (
+            fecha DATE NOT NULL,
+            edificio VARCHAR(255) NOT NULL DEFAULT '',
+            tipo_trabajo_id INTEGER NOT NULL DEFAULT 0,
+            encargado_id BIGINT NOT NULL DEFAULT 0,
+            estado VARCHAR(50) NOT NULL DEFAULT '',
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, edificio, tipo_trabajo_id, encargado_id, estado)
+        )
+        """,
+        # Backfill con el histórico existente
+        db_manager._rebuild_avances_rollup,
+    ]),
+    (5, "Suscripciones a informes programados", [
+        {
+            POSTGRES: """
+                CREATE TABLE IF NOT EXISTS report_subscriptions (
+                    id SERIAL PRIMARY KEY,
+                    user_id BIGINT NOT NULL REFERENCES usuarios(user_id) ON DELETE CASCADE,
+                    tipo_informe VARCHAR(20) NOT NULL,
+                    periodicidad VARCHAR(20) NOT NULL,
+                    formato VARCHAR(10) NOT NULL,
+                    filtros TEXT NOT NULL DEFAULT '{}',
+                    fecha_creacion TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    UNIQUE (user_id, tipo_informe, periodicidad, formato, filtros)
+                )
+            """,
+            SQLITE: """
+                CREATE TABLE IF NOT EXISTS report_subscriptions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL REFERENCES usuarios(user_id) ON DELETE CASCADE,
+                    tipo_informe TEXT NOT NULL,
+                    periodicidad TEXT NOT NULL,
+                    formato TEXT NOT NULL,
+                    filtros TEXT NOT NULL DEFAULT '{}',
+                    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE (user_id, tipo_informe, periodicidad, formato, filtros)
+                )
+            """,
+        },
+        "CREATE INDEX IF NOT EXISTS idx_report_subscriptions_periodicidad ON report_subscriptions (periodicidad)",
+    ]),
+    (6, "file_id de Telegram de las fotos guardadas", [
+        """
+        CREATE TABLE IF NOT EXISTS fotos (
+            path VARCHAR(500) PRIMARY KEY,
+            file_id VARCHAR(255) NOT NULL,
+            file_unique_id VARCHAR(100),
+            fecha_actualizacion TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+        """,
+    ]),
+    (7, "Metadatos del almacén de fotos por hash", [
+        _add_column("fotos", "sha256", "VARCHAR(64)"),
+        _add_column("fotos", "size_bytes", "INTEGER"),
+        _add_column("fotos", "mime_type", "VARCHAR(50)"),
+    ]),
+    (8, "Varias fotos por avance/incidencia", [
+        {
+            POSTGRES: """
+                CREATE TABLE IF NOT EXISTS foto_adjuntos (
+                    id SERIAL PRIMARY KEY,
+                    entidad VARCHAR(30) NOT NULL,
+                    entidad_id INTEGER NOT NULL,
+                    foto_path VARCHAR(500) NOT NULL,
+                    orden INTEGER NOT NULL DEFAULT 0,
+                    fecha_creacion TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                )
+            """,
+            SQLITE: """
+                CREATE TABLE IF NOT EXISTS foto_adjuntos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    entidad TEXT NOT NULL,
+                    entidad_id INTEGER NOT NULL,
+                    foto_path TEXT NOT NULL,
+                    orden INTEGER NOT NULL DEFAULT 0,
+                    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """,
+        },
+        "CREATE INDEX IF NOT EXISTS idx_foto_adjuntos_entidad ON foto_adjuntos (entidad, entidad_id, orden)",
+        # Las fotos únicas existentes pasan a ser la primera foto de su entidad
+        _backfill_foto_adjuntos,
+    ]),
+]
+
+# =============================================================================
+# EJECUCIÓN
+# =============================================================================
+
+def _step_sql(step):
+    """Devuelve la sentencia del paso para el dialecto activo (o None si no aplica)."""
+    if isinstance(step, dict):
+        return step.get(db_manager.DIALECT)
+    return step
+
+def get_schema_version():
+    """Devuelve la última versión aplicada (0 si no hay ninguna)."""
+    conn = db_manager.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(_SCHEMA_VERSION_SQL)
+            cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            version = cur.fetchone()[0]
+        conn.commit()
+        return version
+    finally:
+        conn.close()
+
+def run_migrations():
+    """
+    Aplica en orden las migraciones pendientes, cada una en su propia transacción.
+    Devuelve True si el esquema quedó al día.
+    """
+    conn = db_manager.get_connection()
+    locked = False
+    try:
+        with conn.cursor() as cur:
+            if db_manager.DIALECT == POSTGRES:
+                cur.execute("SELECT pg_advisory_lock(%s)", (_MIGRATION_LOCK_ID,))
+                locked = True
+            cur.execute(_SCHEMA_VERSION_SQL)
+            conn.commit()
+
+            cur.execute("SELECT version FROM schema_version")
+            applied = {row[0] for row in cur.fetchall()}
+
+            for version, descripcion, steps in MIGRATIONS:
+                if version in applied:
+                    continue
+                logger.info(f"🔄 Aplicando migración {version}: {descripcion}")
+                try:
+                    for step in steps:
+                        if callable(step):
+                            step(cur)
+                            continue
+                        sql = _step_sql(step)
+                        if sql:
+                            cur.execute(sql)
+                    cur.execute(
+                        "INSERT INTO schema_version (version, descripcion) VALUES (%s, %s)",
+                        (version, descripcion)
+                    )
+                    conn.commit()
+                except db_manager.DatabaseError as e:
+                    conn.rollback()
+                    logger.error(f"❌ Error en la migración {version}: {e}")
+                    return False
+
+        logger.info(f"✅ Esquema de BD en la versión {MIGRATIONS[-1][0]}")
+        return True
+    except db_manager.DatabaseError as e:
+        conn.rollback()
+        logger.error(f"❌ No se pudieron aplicar las migraciones: {e}")
+        return False
+    finally:
+        if locked:
+            # El lock es de sesión: hay que soltarlo antes de devolver la conexión al pool
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (_MIGRATION_LOCK_ID,))
+                conn.commit()
+            except db_manager.DatabaseError:
+                pass
+        conn.close()
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    run_migrations()
+    # python db_migrations.py rebuild-rollup  ->  recalcula avances_diario
+    if "rebuild-rollup" in sys.argv[1:]:
+        db_manager.rebuild_avances_rollup()
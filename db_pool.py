@@ -0,0 +1,271 @@
+"""
+Pool de conexiones PostgreSQL compartido por db_manager y db_adapter.
+Evita abrir una conexión TCP + autenticación en cada consulta.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Configuración del pool (mismas variables que usaba db_adapter)
+POOL_MIN_SIZE = int(os.getenv("POOL_MIN_SIZE", "1"))
+POOL_SIZE = int(os.getenv("POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("POOL_RECYCLE", "1800"))  # segundos de inactividad antes de reciclar
+POOL_PING_AFTER = float(os.getenv("POOL_PING_AFTER", "5"))  # inactividad mínima para hacer SELECT 1
+
+
+class PoolTimeoutError(Exception):
+    """No se obtuvo una conexión libre dentro del tiempo de espera."""
+
+
+class PooledConnection:
+    """
+    Envoltorio de una conexión del pool. Delega todo en la conexión real,
+    pero close() la devuelve al pool en lugar de cerrarla.
+    """
+
+    _pool = None
+    _raw = None
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.putconn(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._raw is not None:
+            if exc_type is None:
+                self._raw.commit()
+            else:
+                self._raw.rollback()
+        return False
+
+    def __del__(self):
+        # Red de seguridad si alguien olvida el close()
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Pool thread-safe con tamaño mínimo/máximo, desbordamiento, health check y reciclado."""
+
+    def __init__(self, connect, min_size=POOL_MIN_SIZE, max_size=POOL_SIZE,
+                 max_overflow=MAX_OVERFLOW, timeout=POOL_TIMEOUT, recycle=POOL_RECYCLE):
+        self._connect = connect
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max(1, max_size)
+        self.max_overflow = max(0, max_overflow)
+        self.timeout = timeout
+        self.recycle = recycle
+
+        self._idle = deque()  # (conexión, instante en que quedó libre)
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'discarded': 0,
+        }
+
+    # --- Gestión interna ---
+
+    def _total(self):
+        return len(self._idle) + self._in_use
+
+    def _new_connection(self):
+        raw = self._connect()
+        with self._cond:
+            self._stats['created'] += 1
+        return raw
+
+    def _close_raw(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, raw, idle_for):
+        """Comprueba que la conexión sigue viva antes de entregarla."""
+        if getattr(raw, 'closed', 0):
+            return False
+        if idle_for < POOL_PING_AFTER:
+            return True
+        try:
+            with raw.cursor() as cur:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            raw.rollback()
+            return True
+        except Exception:
+            return False
+
+    # --- API pública ---
+
+    def getconn(self):
+        """Obtiene una conexión del pool, esperando como máximo `timeout` segundos."""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, released_at = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._total() < self.max_size + self.max_overflow:
+                    raw, released_at = None, None
+                    self._in_use += 1
+                    break
+                if not waited:
+                    self._stats['waits'] += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"Sin conexiones libres tras {self.timeout}s "
+                        f"(en uso: {self._in_use}, máximo: {self.max_size + self.max_overflow})"
+                    )
+                self._cond.wait(remaining)
+            self._stats['checkouts'] += 1
+
+        try:
+            if raw is not None:
+                idle_for = time.monotonic() - released_at
+                if self.recycle and idle_for > self.recycle:
+                    self._close_raw(raw)
+                    with self._cond:
+                        self._stats['recycled'] += 1
+                    raw = None
+                elif not self._is_healthy(raw, idle_for):
+                    self._close_raw(raw)
+                    with self._cond:
+                        self._stats['discarded'] += 1
+                    raw = None
+            if raw is None:
+                raw = self._new_connection()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, raw)
+
+    def putconn(self, raw):
+        """Devuelve una conexión al pool, deshaciendo cualquier transacción abierta."""
+        healthy = not getattr(raw, 'closed', 0)
+        if healthy:
+            try:
+                raw.rollback()
+            except Exception:
+                healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy and len(self._idle) < self.max_size:
+                self._idle.append((raw, time.monotonic()))
+                raw = None
+            elif not healthy:
+                self._stats['discarded'] += 1
+            self._cond.notify()
+
+        if raw is not None:
+            self._close_raw(raw)
+
+    def prefill(self):
+        """Abre las conexiones mínimas configuradas."""
+        while True:
+            with self._cond:
+                if self._total() >= self.min_size:
+                    return
+                self._in_use += 1
+            try:
+                raw = self._new_connection()
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                raise
+            self.putconn(raw)
+
+    def closeall(self):
+        """Cierra todas las conexiones libres del pool."""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for raw, _ in idle:
+            self._close_raw(raw)
+
+    def stats(self):
+        """Devuelve un diccionario con las métricas del pool."""
+        with self._cond:
+            data = dict(self._stats)
+            data.update({
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+                'max_overflow': self.max_overflow,
+            })
+            return data
+
+
+# =============================================================================
+# REGISTRO DE POOLS (uno por destino de conexión)
+# =============================================================================
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, connect):
+    """
+    Devuelve el pool asociado a `key` (normalmente la tupla dbname/user/host/port),
+    creándolo la primera vez con la función `connect`. db_manager y db_adapter
+    comparten el mismo pool cuando apuntan a la misma base de datos.
+    """
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is not None:
+            return pool
+        pool = ConnectionPool(connect)
+        _pools[key] = pool
+    logger.info(f"🔄 Pool de conexiones creado para {key[0]}@{key[2]} "
+                f"(tamaño {pool.max_size}, desbordamiento {pool.max_overflow})")
+    try:
+        pool.prefill()
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo precargar el pool: {e}")
+    return pool
+
+
+def get_pool_stats():
+    """Métricas de todos los pools activos, indexadas por base de datos."""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {f"{key[1]}@{key[2]}:{key[3]}/{key[0]}": pool.stats() for key, pool in pools.items()}
+
+
+def close_all_pools():
+    """Cierra las conexiones libres de todos los pools."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.closeall()
@@ -0,0 +1,173 @@
+"""
+Variantes reducidas de las fotos, generadas fuera del event loop.
+
+Los originales se guardan a resolución completa (photo_store). Para cada foto
+este módulo genera, en un pool de procesos con Pillow:
+
+    <foto>.display.jpg   recomprimida, lado mayor IMAGE_DISPLAY_MAX_SIDE
+    <foto>.thumb.jpg     miniatura, lado mayor IMAGE_THUMB_MAX_SIDE
+
+Las variantes se guardan sin EXIF (se aplica antes la orientación) junto al
+original. Las vistas y los avisos al grupo suben la variante display cuando
+no pueden reenviar la foto por file_id.
+
+    image_pipeline.schedule(foto_path)           # al guardar, sin esperar
+    path = await image_pipeline.ensure_variants(foto_path)   # al ver, si falta
+
+Como pdf_worker, usa un process_pool.BoundedProcessPool: IMAGE_WORKERS fotos
+a la vez y como mucho IMAGE_MAX_PENDING esperando turno. Si la espera está
+llena, schedule() descarta el trabajo (se hará al ver la foto) y
+process_photo() lanza ImageQueueFull. IMAGE_TIMEOUT cuenta desde que la foto
+obtiene su turno, así que una ráfaga de álbumes no agota el tiempo de las
+fotos que aún esperan.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from pathlib import Path
+
+from process_pool import BoundedProcessPool
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_MAX_PENDING = int(os.getenv("IMAGE_MAX_PENDING", "16"))
+IMAGE_TIMEOUT = float(os.getenv("IMAGE_TIMEOUT", "60"))
+IMAGE_DISPLAY_MAX_SIDE = int(os.getenv("IMAGE_DISPLAY_MAX_SIDE", "1600"))
+IMAGE_DISPLAY_QUALITY = int(os.getenv("IMAGE_DISPLAY_QUALITY", "80"))
+IMAGE_THUMB_MAX_SIDE = int(os.getenv("IMAGE_THUMB_MAX_SIDE", "320"))
+IMAGE_THUMB_QUALITY = int(os.getenv("IMAGE_THUMB_QUALITY", "70"))
+
+# variante -> (lado mayor, calidad JPEG)
+VARIANTS = {
+    "display": (IMAGE_DISPLAY_MAX_SIDE, IMAGE_DISPLAY_QUALITY),
+    "thumb": (IMAGE_THUMB_MAX_SIDE, IMAGE_THUMB_QUALITY),
+}
+
+
+class ImageQueueFull(Exception):
+    """Hay IMAGE_MAX_PENDING fotos esperando turno."""
+
+
+class ImageProcessTimeout(Exception):
+    """El procesado superó IMAGE_TIMEOUT segundos."""
+
+
+_pool = BoundedProcessPool(
+    "procesado de imágenes", IMAGE_WORKERS, IMAGE_MAX_PENDING, IMAGE_TIMEOUT,
+    queue_full=ImageQueueFull, timed_out=ImageProcessTimeout,
+)
+_lock = threading.Lock()
+_background = set()
+_stats = {
+    "original_bytes": 0,
+    "display_bytes": 0,
+    "process_ms_total": 0.0,
+    "process_ms_max": 0.0,
+}
+
+
+def variant_path(foto_path, variant):
+    """Ruta de una variante: fotos/ab/cd/<sha>.jpg -> fotos/ab/cd/<sha>.<variant>.jpg"""
+    path = Path(foto_path)
+    return path.with_name(f"{path.stem}.{variant}.jpg")
+
+def get_variant(foto_path, variant="display"):
+    """Ruta de la variante si ya está generada, o None."""
+    if not foto_path:
+        return None
+    path = variant_path(foto_path, variant)
+    return path.as_posix() if path.exists() else None
+
+
+# =============================================================================
+# TRABAJO (se ejecuta en el proceso del pool)
+# =============================================================================
+
+def _process_photo(foto_path, variants):
+    """Genera las variantes de la foto. Devuelve (bytes del original, {variante: bytes}, ms)."""
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    sizes = {}
+    with Image.open(foto_path) as image:
+        # La orientación va en el EXIF: se aplica antes de descartarlo
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        for name, (max_side, quality) in variants.items():
+            variant = image.copy()
+            variant.thumbnail((max_side, max_side), Image.LANCZOS)
+            target = variant_path(foto_path, name)
+            tmp_path = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+            # Sin exif=...: Pillow no copia los metadatos al JPEG nuevo
+            variant.save(tmp_path, "JPEG", quality=quality, optimize=True, progressive=True)
+            os.replace(tmp_path, target)
+            sizes[name] = os.path.getsize(target)
+    return os.path.getsize(foto_path), sizes, (time.perf_counter() - start) * 1000
+
+
+# =============================================================================
+# API
+# =============================================================================
+
+async def process_photo(foto_path, timeout=None):
+    """
+    Genera las variantes display y thumb de la foto en el pool de procesos.
+    Devuelve {variante: bytes}. Lanza ImageQueueFull o ImageProcessTimeout.
+    """
+    original_bytes, sizes, process_ms = await _pool.run(
+        _process_photo, str(foto_path), VARIANTS, timeout=timeout, label=str(foto_path)
+    )
+    with _lock:
+        _stats["original_bytes"] += original_bytes
+        _stats["display_bytes"] += sizes["display"]
+        _stats["process_ms_total"] += process_ms
+        _stats["process_ms_max"] = max(_stats["process_ms_max"], process_ms)
+    logger.info(
+        f"🖼️ {foto_path}: {original_bytes // 1024} KB -> {sizes['display'] // 1024} KB "
+        f"(miniatura {sizes['thumb'] // 1024} KB) en {process_ms:.0f} ms"
+    )
+    return sizes
+
+async def ensure_variants(foto_path, variant="display"):
+    """Devuelve la ruta de la variante, generándola si falta. None si no se pudo (se usará el original)."""
+    existing = get_variant(foto_path, variant)
+    if existing or not foto_path or not os.path.exists(foto_path):
+        return existing
+    try:
+        await process_photo(foto_path)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron generar las variantes de {foto_path}: {e}")
+        return None
+    return get_variant(foto_path, variant)
+
+def schedule(foto_path):
+    """Lanza en segundo plano el procesado de una foto recién guardada (sin esperar al resultado)."""
+    async def run():
+        try:
+            await process_photo(foto_path)
+        except ImageQueueFull:
+            logger.info(f"⏭️ Cola de imágenes llena: {foto_path} se procesará al verla")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron generar las variantes de {foto_path}: {e}")
+
+    task = asyncio.get_running_loop().create_task(run())
+    _background.add(task)  # referencia fuerte hasta que termine
+    task.add_done_callback(_background.discard)
+
+def get_image_stats():
+    """Fotos procesadas, bytes ahorrados por la variante display y tiempos, desde el arranque."""
+    stats = _pool.stats()
+    with _lock:
+        stats.update(_stats)
+    processed = stats["processed"] = stats.pop("completed")
+    stats["saved_bytes"] = stats["original_bytes"] - stats["display_bytes"]
+    stats["process_ms_avg"] = stats["process_ms_total"] / processed if processed else 0.0
+    return stats
+
+def shutdown():
+    """Detiene el pool de procesado esperando a los trabajos en curso."""
+    _pool.shutdown()
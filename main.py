@@ -9,13 +9,26 @@ from avances.avances_management import get_avances_management_handler
 from avances.avances_registro import get_avances_registro_handler
 from avances.avances_visualization import get_avances_visualization_handler
 from almacen.bot_herramientas_incidencias import get_tool_incidencia_handler
-from bot_informes import get_informes_conversation_handler
+from bot_informes import (
+    get_informes_conversation_handler,
+    get_report_jobs_handlers,
+    get_report_subscription_handlers,
+    send_scheduled_reports
+)
 from bot_comentarios import get_comentario_conversation_handler
 from rrhh.bot_rrhh import get_rrhh_conversation_handlers
 from almacen.bot_pedidos import get_pedidos_approval_handler, get_pedidos_preparation_handler, get_solicitar_material_handler
 from almacen.bot_almacen import get_almacen_conversation_handler, view_full_inventory, listar_material_en_obra
 from almacen.bot_averias import get_averias_conversation_handler  # <-- IMPORTACIÓN CORREGIDA Y AÑADIDA
-import db_adapter as db
+import db_adapter
+import db_async
+import db_migrations
+import pdf_worker
+import photo_store
+import photo_maintenance
+import image_pipeline
+import report_jobs
+from db_async import AsyncDB
 from bot_navigation import start, exit_bot
 from prevencion.bot_prevencion import (
     get_prevencion_handlers,
@@ -30,6 +43,12 @@ from bot_registro_personal import get_registro_personal_handler
 from admin_management import admin_management_handler
 from reporter import GROUP_CHAT_ID
 
+# Acceso a BD sin bloquear el event loop (ver db_async)
+db = AsyncDB(db_adapter)
+
+# Hora (Europe/Madrid) a la que se generan los informes programados, fuera de hora punta
+SCHEDULED_REPORTS_TIME = os.getenv("SCHEDULED_REPORTS_TIME", "06:00")
+
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "7808980898:AAETMIUhwaarOWpx7KHFyN1cG3kJ7agivgs")
 
 # =========================================================================
@@ -40,11 +59,8 @@ async def ver_foto_incidencia(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     try:
         incidencia_id = int(query.data.split('_')[3])
-        foto_path = db.get_foto_path_by_incidencia_id(incidencia_id)
-        if foto_path and os.path.exists(foto_path):
-            with open(foto_path, 'rb') as photo_file:
-                await context.bot.send_photo(chat_id=query.from_user.id, photo=InputFile(photo_file))
-        else:
+        fotos = await db.get_entity_photos('incidencia', incidencia_id)
+        if not await photo_store.send_photos(context.bot, query.from_user.id, fotos):
             await query.message.reply_text("No se encontró la foto para esta incidencia.")
     except (IndexError, ValueError):
         await query.message.reply_text("Error: ID de incidencia no válido.")
@@ -52,16 +68,13 @@ async def ver_foto_incidencia(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.message.reply_text(f"No se pudo enviar la foto: {e}")
 
 async def ver_foto_prevencion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Manejador para mostrar la foto de una incidencia de prevención."""
+    """Manejador para mostrar las fotos de una incidencia de prevención (en un álbum si son varias)."""
     query = update.callback_query
     await query.answer()
     try:
         incidencia_id = int(query.data.split('_')[2])
-        details = db.get_prevencion_incidencia_details(incidencia_id)
-        if details and details['foto_path'] and os.path.exists(details['foto_path']):
-            with open(details['foto_path'], 'rb') as photo_file:
-                await context.bot.send_photo(chat_id=query.from_user.id, photo=InputFile(photo_file))
-        else:
+        fotos = await db.get_entity_photos('prevencion', incidencia_id)
+        if not await photo_store.send_photos(context.bot, query.from_user.id, fotos):
             await query.message.reply_text("No se encontró la foto para esta incidencia.")
     except (IndexError, ValueError) as e:
         await query.message.reply_text(f"Error al procesar la solicitud: {e}")
@@ -74,12 +87,11 @@ async def handle_new_chat_members(update: Update, context: ContextTypes.DEFAULT_
     """
     Se activa cuando un nuevo miembro se une a un grupo. Comprueba si está registrado.
     """
-    new_members = update.chat_member.new_chat_members
+    new_members = [member for member in update.chat_member.new_chat_members if not member.is_bot]  # Ignora a otros bots
+    # Una sola consulta (o ninguna, si están en caché) para todos los nuevos miembros
+    roles = await db.get_user_roles([member.id for member in new_members])
     for member in new_members:
-        if member.is_bot:
-            continue  # Ignora a otros bots
-
-        user_role = db.get_user_role(member.id)
+        user_role = roles.get(member.id)
         if not user_role:
             # Si el usuario no tiene rol, notifica a los administradores
             await notify_admin_of_new_user(context, member)
@@ -89,7 +101,7 @@ async def daily_reminder_callback(context: ContextTypes.DEFAULT_TYPE):
     Función que se ejecuta en cada recordatorio.
     Comprueba si el registro ya se hizo y envía un aviso si no.
     """
-    if not db.check_personal_registro_today():
+    if not await db.check_personal_registro_today():
         print(f"INFO: Ejecutando recordatorio. El registro de hoy no está hecho.")
         keyboard = [[InlineKeyboardButton("📝 Registrar Personal de Hoy", callback_data="registro_personal_start")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -103,13 +115,21 @@ async def daily_reminder_callback(context: ContextTypes.DEFAULT_TYPE):
     else:
         print(f"INFO: Ejecutando recordatorio. El registro de hoy ya fue completado. No se envía aviso.")
 
+async def on_shutdown(application: Application) -> None:
+    """Libera los executors (BD, informes, PDF e imágenes) y las conexiones persistentes al detener el bot."""
+    db_async.shutdown()
+    report_jobs.shutdown()
+    pdf_worker.shutdown()
+    image_pipeline.shutdown()
+    db_adapter.close_all_connections()
+
 def main() -> None:
     """Inicia el bot y configura todos los manejadores."""
-    os.makedirs('avances_fotos', exist_ok=True)
-    os.makedirs('averias_fotos', exist_ok=True)
-    os.makedirs('incidencias_fotos', exist_ok=True)
+    # Aplicar migraciones pendientes del esquema (índices, columnas nuevas...)
+    if not db_migrations.run_migrations():
+        print("⚠️ ADVERTENCIA: No se pudieron aplicar todas las migraciones de la base de datos.")
 
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = Application.builder().token(BOT_TOKEN).post_shutdown(on_shutdown).build()
 
     # --- REGISTRO DE HANDLERS DE CONVERSACIÓN ---
     
@@ -124,6 +144,11 @@ def main() -> None:
     
     application.add_handler(get_tool_incidencia_handler())
     application.add_handler(get_informes_conversation_handler())
+    # Informes en segundo plano: listar y cancelar desde cualquier punto
+    for handler in get_report_jobs_handlers():
+        application.add_handler(handler)
+    for handler in get_report_subscription_handlers():
+        application.add_handler(handler)
     application.add_handler(get_comentario_conversation_handler())
     application.add_handler(get_almacen_conversation_handler())
     application.add_handler(get_solicitar_material_handler())
@@ -192,6 +217,22 @@ def main() -> None:
             name=f"daily_reminder_{i}"
         )
 
+    # Informes programados: los lunes los semanales y el día 1 los mensuales
+    hour, minute = (int(part) for part in SCHEDULED_REPORTS_TIME.split(":"))
+    job_queue.run_daily(
+        callback=send_scheduled_reports,
+        time=time(hour, minute, tzinfo=spain_tz),
+        name="scheduled_reports"
+    )
+
+    # Limpieza de fotos huérfanas y archivo de las antiguas, por tramos del almacén
+    job_queue.run_repeating(
+        callback=photo_maintenance.run_maintenance,
+        interval=photo_maintenance.PHOTO_GC_INTERVAL,
+        first=60,
+        name="photo_maintenance"
+    )
+
     print("Bot iniciado. Presiona Ctrl+C para detenerlo.")
     application.run_polling()
 
@@ -10,6 +10,7 @@ from telegram.ext import (
     filters,
 )
 import db_manager as db
+import photo_store
 from bot_navigation import end_and_return_to_menu
 from reporter import send_report, escape, format_user
 
@@ -72,11 +73,7 @@ async def ask_orden_foto(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return await save_orden(update, context)
 
 async def get_orden_foto(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    photo_file = await update.message.photo[-1].get_file()
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    os.makedirs('ordenes_fotos', exist_ok=True)
-    file_path = os.path.join('ordenes_fotos', f"orden_{update.effective_user.id}_{timestamp}.jpg")
-    await photo_file.download_to_drive(file_path)
+    file_path = await photo_store.save_telegram_photo(update.message.photo[-1])
     context.user_data['new_orden']['foto_path'] = file_path
     await update.message.reply_text("Foto guardada. Creando orden...")
     return await save_orden(update, context)
@@ -156,7 +153,7 @@ async def view_orden_details(update: Update, context: ContextTypes.DEFAULT_TYPE)
         [InlineKeyboardButton("<< Volver a la lista", callback_data="back_to_orden_list")]
     ]
     
-    if details['foto_path'] and os.path.exists(details['foto_path']):
+    if photo_store.is_available(details['foto_path']):
         keyboard[0].append(InlineKeyboardButton("Ver Foto", callback_data=f"ver_foto_orden_{details['id']}"))
 
     await query.edit_message_text(texto, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='MarkdownV2')
@@ -189,10 +186,8 @@ async def ver_foto_orden(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     try:
         orden_id = int(query.data.split('_')[3])
         details = db.get_orden_details(orden_id)
-        if details and details['foto_path'] and os.path.exists(details['foto_path']):
-            with open(details['foto_path'], 'rb') as photo_file:
-                await context.bot.send_photo(chat_id=query.from_user.id, photo=InputFile(photo_file))
-        else:
+        sent = details and await photo_store.send_photo(context.bot, query.from_user.id, details['foto_path'])
+        if not sent:
             await query.message.reply_text("No se encontró la foto para esta orden.")
     except (IndexError, ValueError) as e:
         await query.message.reply_text(f"Error al procesar la solicitud: {e}")
@@ -0,0 +1,103 @@
+"""
+Renderizado de PDFs fuera del event loop.
+
+PDFReport (fpdf) es trabajo de CPU puro: una tabla grande tarda segundos y,
+ejecutada dentro de un handler, congela el bot para todos los usuarios. Este
+módulo la ejecuta en un pool de procesos dedicado:
+
+    import pdf_worker
+
+    pdf_content = await pdf_worker.render_table_report(table_data, headers, column_widths, "Informe")
+    # o, para dejarlo en disco:
+    path = await pdf_worker.render_table_report(..., output_path="/app/data/reports/informe.pdf")
+
+El pool es un process_pool.BoundedProcessPool: PDF_WORKERS renders a la vez,
+como mucho PDF_MAX_PENDING esperando turno (si no, PDFQueueFull) y un límite
+de PDF_RENDER_TIMEOUT segundos desde que el render obtiene su turno (si no,
+PDFRenderTimeout y el pool se recicla). Los renders interrumpidos por el
+reciclado se reenvían una vez y cuentan como "requeued"; ver process_pool.
+"""
+import os
+import time
+import logging
+import threading
+
+from process_pool import BoundedProcessPool
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_MAX_PENDING = int(os.getenv("PDF_MAX_PENDING", "8"))
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "120"))
+
+
+class PDFQueueFull(Exception):
+    """Hay PDF_MAX_PENDING trabajos esperando turno; el llamador debe pedir que se reintente."""
+
+
+class PDFRenderTimeout(Exception):
+    """El renderizado superó PDF_RENDER_TIMEOUT segundos."""
+
+
+_pool = BoundedProcessPool(
+    "renderizado PDF", PDF_WORKERS, PDF_MAX_PENDING, PDF_RENDER_TIMEOUT,
+    queue_full=PDFQueueFull, timed_out=PDFRenderTimeout,
+)
+_lock = threading.Lock()
+_stats = {
+    "render_ms_total": 0.0,
+    "render_ms_max": 0.0,
+}
+
+
+# =============================================================================
+# TRABAJO (se ejecuta en el proceso del pool)
+# =============================================================================
+
+def _render_table_report(table_data, headers, column_widths, report_title, output_path):
+    """Genera el PDF y devuelve (bytes o ruta, ms de renderizado)."""
+    from pdf_reporter import PDFReport
+
+    start = time.perf_counter()
+    content = PDFReport().create_table_report(table_data, headers, column_widths, report_title=report_title)
+    if output_path:
+        with open(output_path, 'wb') as f:
+            f.write(content)
+        content = output_path
+    return content, (time.perf_counter() - start) * 1000
+
+
+# =============================================================================
+# API
+# =============================================================================
+
+async def render_table_report(table_data, headers, column_widths, report_title='Informe',
+                              output_path=None, timeout=None):
+    """
+    Renderiza PDFReport.create_table_report en el pool de procesos.
+    Devuelve los bytes del PDF, o output_path si se indica (el proceso escribe el fichero).
+    Lanza PDFQueueFull si la cola está llena y PDFRenderTimeout si tarda demasiado.
+    """
+    content, render_ms = await _pool.run(
+        _render_table_report,
+        [list(row) for row in table_data], list(headers), list(column_widths), report_title, output_path,
+        timeout=timeout, label=f"PDF '{report_title}'"
+    )
+    with _lock:
+        _stats["render_ms_total"] += render_ms
+        _stats["render_ms_max"] = max(_stats["render_ms_max"], render_ms)
+    logger.info(f"🖨️ PDF '{report_title}' ({len(table_data)} filas) en {render_ms:.0f} ms")
+    return content
+
+def get_pdf_stats():
+    """Métricas desde el arranque: trabajos, errores, tiempos de render/espera y profundidad de cola."""
+    stats = _pool.stats()
+    with _lock:
+        stats.update(_stats)
+    jobs = stats["jobs"] = stats.pop("completed")
+    stats["render_ms_avg"] = stats["render_ms_total"] / jobs if jobs else 0.0
+    return stats
+
+def shutdown():
+    """Detiene el pool de renderizado esperando a los trabajos en curso."""
+    _pool.shutdown()
@@ -0,0 +1,241 @@
+"""
+Mantenimiento periódico del almacén de fotos (job del JobQueue).
+
+Las filas que referencian fotos se pueden borrar (reset_database_safely,
+delete_almacen_item, ON DELETE SET NULL en incidencias...) y una conversación
+cancelada deja fotos guardadas que nadie usa, pero los ficheros se quedaban
+en disco para siempre. En cada pasada este módulo:
+
+  - borra las fotos huérfanas (ninguna fila las referencia) junto con sus
+    variantes y su fila en la tabla fotos. Solo si tienen más de
+    PHOTO_GC_GRACE_HOURS horas: así no se borra la foto de una conversación
+    que aún no ha guardado su avance o incidencia;
+  - pasa al nivel de archivo (gzip en PHOTO_ARCHIVE_DIR) las fotos con más de
+    PHOTO_ARCHIVE_DAYS días y borra sus variantes. Se siguen viendo por
+    file_id y, si hay que subirlas, photo_store las restaura al vuelo;
+  - borra temporales abandonados y variantes sin original.
+
+Los bytes liberados se cuentan por separado: fotos huérfanas, compresión del
+archivo y variantes/temporales borrados. Un JPEG apenas se reduce con gzip,
+así que casi todo lo que libera el archivo viene de las variantes (que se
+regeneran al restaurar la foto); el archivo sirve sobre todo para sacar las
+fotos antiguas del almacén a un disco más barato.
+
+Para no recorrer todo el árbol de una vez, cada pasada procesa
+PHOTO_GC_SHARDS_PER_TICK carpetas de primer nivel (00..ff del almacén y
+después las carpetas antiguas de fotos). La posición se guarda en
+PHOTOS_DIR/.maintenance_cursor y sobrevive a los reinicios.
+
+    job_queue.run_repeating(photo_maintenance.run_maintenance, interval=PHOTO_GC_INTERVAL)
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from pathlib import Path
+
+import db_manager
+import image_pipeline
+import photo_store
+
+logger = logging.getLogger(__name__)
+
+PHOTO_GC_INTERVAL = int(os.getenv("PHOTO_GC_INTERVAL", "600"))
+PHOTO_GC_SHARDS_PER_TICK = int(os.getenv("PHOTO_GC_SHARDS_PER_TICK", "8"))
+PHOTO_GC_GRACE_HOURS = float(os.getenv("PHOTO_GC_GRACE_HOURS", "24"))
+# 0 desactiva el archivo
+PHOTO_ARCHIVE_DAYS = float(os.getenv("PHOTO_ARCHIVE_DAYS", "180"))
+
+# Carpetas donde se guardaban las fotos antes del almacén por hash
+LEGACY_PHOTO_DIRS = (
+    "data/fotos_avances", "avances_fotos", "averias_fotos", "incidencias_fotos", "ordenes_fotos", "prevencion_fotos",
+)
+
+_UNITS = [f"{i:02x}" for i in range(256)] + list(LEGACY_PHOTO_DIRS)
+_CURSOR_FILE = photo_store.PHOTOS_DIR / ".maintenance_cursor"
+
+_lock = threading.Lock()
+_stats = {
+    "ticks": 0, "cycles": 0, "errors": 0, "scanned": 0,
+    "orphans": 0, "archived": 0,
+    "orphan_bytes": 0, "archive_bytes": 0, "variant_bytes": 0, "reclaimed_bytes": 0,
+    "tick_ms_max": 0.0,
+}
+
+
+# =============================================================================
+# RECORRIDO DE UNA CARPETA
+# =============================================================================
+
+def _unit_dirs(unit):
+    """(carpeta del almacén, carpeta del archivo) de una unidad de trabajo."""
+    if unit in LEGACY_PHOTO_DIRS:
+        return Path(unit), photo_store.PHOTO_ARCHIVE_DIR / "legacy" / unit
+    return photo_store.PHOTOS_DIR / unit, photo_store.PHOTO_ARCHIVE_DIR / unit
+
+def _files(directory):
+    return [path for path in directory.rglob("*") if path.is_file()] if directory.is_dir() else []
+
+def _variant_base(name):
+    """'<foto>.display.jpg' -> '<foto>'; None si no es una variante."""
+    for variant in image_pipeline.VARIANTS:
+        suffix = f".{variant}.jpg"
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return None
+
+def _remove(path):
+    """Borra el fichero y devuelve los bytes liberados."""
+    try:
+        size = path.stat().st_size
+        path.unlink()
+        return size
+    except FileNotFoundError:
+        return 0
+
+def _scan_unit(unit, now, result):
+    hot_dir, cold_dir = _unit_dirs(unit)
+    hot_files, cold_files = _files(hot_dir), _files(cold_dir)
+    if not hot_files and not cold_files:
+        return
+    referenced = db_manager.get_referenced_photo_paths(f"{hot_dir.as_posix()}/")
+    grace = PHOTO_GC_GRACE_HOURS * 3600
+    archive_age = PHOTO_ARCHIVE_DAYS * 86400
+
+    # Temporales de escrituras interrumpidas
+    for path in hot_files + cold_files:
+        if path.name.startswith(".") and path.exists() and now - path.stat().st_mtime > grace:
+            result["variant_bytes"] += _remove(path)
+
+    # Originales y variantes agrupados por foto (carpeta/nombre sin extensión)
+    originals, variants = {}, {}
+    for path in hot_files:
+        if path.name.startswith("."):
+            continue
+        base = _variant_base(path.name)
+        if base is not None:
+            variants.setdefault(path.parent / base, []).append(path)
+        else:
+            originals[path.parent / path.stem] = path
+    result["scanned"] += len(hot_files) + len(cold_files)
+
+    for key, path in originals.items():
+        foto_path = path.as_posix()
+        age = now - path.stat().st_mtime
+        if foto_path not in referenced:
+            if age <= grace:
+                variants.pop(key, None)
+                continue
+            result["orphan_bytes"] += _remove(path) + _remove(photo_store.archive_path_for(foto_path))
+            result["variant_bytes"] += sum(_remove(variant) for variant in variants.pop(key, []))
+            db_manager.forget_photo(foto_path)
+            result["orphans"] += 1
+            logger.info(f"🗑️ Foto huérfana borrada: {foto_path}")
+        elif archive_age and age > archive_age:
+            size = path.stat().st_size
+            result["archive_bytes"] += size - photo_store.archive_photo(foto_path)
+            result["variant_bytes"] += sum(_remove(variant) for variant in variants.pop(key, []))
+            result["archived"] += 1
+        else:
+            variants.pop(key, None)
+
+    # Variantes cuyo original ya no está en el almacén (archivado o borrado): se regeneran al restaurar
+    for paths in variants.values():
+        result["variant_bytes"] += sum(_remove(variant) for variant in paths)
+
+    for path in cold_files:
+        # Las de fotos huérfanas ya se borraron junto con el original
+        if path.name.startswith(".") or path.suffix != ".gz" or not path.exists():
+            continue
+        relative = path.relative_to(cold_dir)
+        foto_path = (hot_dir / relative).with_name(path.name[:-len(".gz")]).as_posix()
+        if os.path.exists(foto_path):
+            # Ya restaurada (o vuelta a guardar): la copia archivada sobra
+            result["archive_bytes"] += _remove(path)
+        elif foto_path not in referenced and now - path.stat().st_mtime > grace:
+            result["orphan_bytes"] += _remove(path)
+            db_manager.forget_photo(foto_path)
+            result["orphans"] += 1
+            logger.info(f"🗑️ Foto huérfana borrada del archivo: {foto_path}")
+
+
+# =============================================================================
+# PASADA (callback del JobQueue)
+# =============================================================================
+
+def _load_cursor():
+    try:
+        return int(_CURSOR_FILE.read_text().strip()) % len(_UNITS)
+    except (OSError, ValueError):
+        return 0
+
+def _save_cursor(cursor):
+    try:
+        _CURSOR_FILE.parent.mkdir(parents=True, exist_ok=True)
+        _CURSOR_FILE.write_text(str(cursor))
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudo guardar la posición del mantenimiento de fotos: {e}")
+
+def run_tick():
+    """Procesa las siguientes PHOTO_GC_SHARDS_PER_TICK carpetas. Devuelve lo hecho en esta pasada."""
+    start = time.perf_counter()
+    now = time.time()
+    cursor = _load_cursor()
+    result = {
+        "scanned": 0, "orphans": 0, "archived": 0,
+        "orphan_bytes": 0, "archive_bytes": 0, "variant_bytes": 0,
+    }
+
+    if cursor == 0:
+        # Inicio de vuelta: las fotos de avances/incidencias borrados dejan de contar como usadas
+        purged = db_manager.purge_dangling_photo_attachments()
+        if purged:
+            logger.info(f"🧹 {purged} fotos adjuntas de registros borrados")
+
+    units = _UNITS[cursor:cursor + PHOTO_GC_SHARDS_PER_TICK]
+    for unit in units:
+        try:
+            _scan_unit(unit, now, result)
+        except Exception as e:
+            # Una carpeta con problemas no debe bloquear el avance del cursor
+            with _lock:
+                _stats["errors"] += 1
+            logger.error(f"❌ Error en el mantenimiento de fotos ({unit}): {e}")
+    result["reclaimed_bytes"] = result["orphan_bytes"] + result["archive_bytes"] + result["variant_bytes"]
+    next_cursor = cursor + len(units)
+    cycle_done = next_cursor >= len(_UNITS)
+    _save_cursor(0 if cycle_done else next_cursor)
+
+    tick_ms = (time.perf_counter() - start) * 1000
+    with _lock:
+        _stats["ticks"] += 1
+        _stats["cycles"] += int(cycle_done)
+        for key, value in result.items():
+            _stats[key] += value
+        _stats["tick_ms_max"] = max(_stats["tick_ms_max"], tick_ms)
+    if result["orphans"] or result["archived"] or result["reclaimed_bytes"]:
+        mb = lambda key: result[key] / 1024 / 1024
+        logger.info(
+            f"🧹 Fotos {units[0]}..{units[-1]}: {result['orphans']} huérfanas ({mb('orphan_bytes'):.1f} MB), "
+            f"{result['archived']} archivadas ({mb('archive_bytes'):.1f} MB por compresión), "
+            f"{mb('variant_bytes'):.1f} MB de variantes/temporales en {tick_ms:.0f} ms"
+        )
+    return result
+
+async def run_maintenance(context):
+    """Callback del JobQueue: una pasada en un hilo, sin bloquear el event loop."""
+    try:
+        await asyncio.to_thread(run_tick)
+    except Exception as e:
+        with _lock:
+            _stats["errors"] += 1
+        logger.error(f"❌ Error en el mantenimiento de fotos: {e}")
+
+def get_maintenance_stats():
+    """Fotos huérfanas borradas, archivadas y bytes liberados, desde el arranque."""
+    with _lock:
+        stats = dict(_stats)
+    stats["cursor"] = _load_cursor()
+    stats["units"] = len(_UNITS)
+    return stats
@@ -0,0 +1,317 @@
+"""
+Almacén único de fotos del bot y reenvío por file_id.
+
+Todas las fotos (avances, incidencias, averías, prevención, órdenes) se
+guardan en PHOTOS_DIR con el hash SHA-256 de su contenido como nombre,
+repartidas en subcarpetas por los primeros caracteres del hash:
+
+    /app/data/photos/3f/a2/3fa2...e9.jpg
+
+Dos subidas simultáneas no pueden pisarse y una foto repetida se guarda una
+sola vez. La tabla fotos registra por ruta el hash, tamaño, tipo MIME y el
+file_id de Telegram: al ver una foto se envía primero por file_id y solo si
+no hay o Telegram ya no lo acepta se sube desde disco (guardando el nuevo).
+Lo que se sube es la variante reducida de image_pipeline, no el original.
+
+Las fotos antiguas pasan a un nivel de archivo comprimido (PHOTO_ARCHIVE_DIR,
+ver photo_maintenance); si hay que subir una foto archivada se restaura al
+almacén en ese momento.
+
+    foto_path = await photo_store.save_telegram_photo(update.message.photo[-1])
+    ...
+    await photo_store.send_photo(context.bot, chat_id, foto_path, caption=texto)
+    await photo_store.send_photos(context.bot, chat_id, fotos, caption=texto)  # álbum
+"""
+import os
+import gzip
+import shutil
+import asyncio
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+import telegram.error
+from telegram import InputFile, InputMediaPhoto
+
+import db_manager
+import image_pipeline
+from db_async import run_db
+
+logger = logging.getLogger(__name__)
+
+PHOTOS_DIR = Path(os.getenv("PHOTOS_DIR", "/app/data/photos"))
+PHOTO_ARCHIVE_DIR = Path(os.getenv("PHOTO_ARCHIVE_DIR", "/app/data/photos_archive"))
+
+# Máximo de fotos por send_media_group (límite de Telegram)
+MEDIA_GROUP_SIZE = 10
+
+_MIME_TYPES = [
+    (b"\xff\xd8\xff", "image/jpeg", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png", ".png"),
+    (b"RIFF", "image/webp", ".webp"),
+]
+
+_lock = threading.Lock()
+_stats = {
+    "stored": 0, "stored_bytes": 0, "deduplicated": 0,
+    "file_id_sends": 0, "uploads": 0, "upload_bytes": 0, "stale_file_ids": 0,
+    "media_groups": 0, "restored": 0,
+}
+
+
+def _count(key, amount=1):
+    with _lock:
+        _stats[key] += amount
+
+def _tmp_path(path):
+    """Fichero temporal junto a path para escribir y luego renombrar (os.replace)."""
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+# =============================================================================
+# ALMACENAMIENTO
+# =============================================================================
+
+def _sniff_mime(data):
+    """Tipo MIME y extensión según la cabecera del fichero (Telegram siempre envía JPEG)."""
+    for magic, mime_type, extension in _MIME_TYPES:
+        if data.startswith(magic):
+            return mime_type, extension
+    return "application/octet-stream", ".bin"
+
+def photo_path_for(sha256, extension=".jpg"):
+    """Ruta de una foto dentro del almacén: PHOTOS_DIR/ab/cd/<sha256><ext>."""
+    return PHOTOS_DIR / sha256[:2] / sha256[2:4] / f"{sha256}{extension}"
+
+def store_bytes(data):
+    """
+    Guarda el contenido en el almacén si no estaba ya. Escritura atómica
+    (fichero temporal + rename). Devuelve (ruta, sha256, tamaño, mime, nueva).
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    mime_type, extension = _sniff_mime(data)
+    path = photo_path_for(sha256, extension)
+    if path.exists():
+        _count("deduplicated")
+        try:
+            # Foto reutilizada: cuenta como reciente para el mantenimiento (periodo de gracia y archivo)
+            os.utime(path)
+        except OSError:
+            pass
+        return path.as_posix(), sha256, len(data), mime_type, False
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = _tmp_path(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    _count("stored")
+    _count("stored_bytes", len(data))
+    return path.as_posix(), sha256, len(data), mime_type, True
+
+async def save_telegram_photo(photo):
+    """Descarga la foto (PhotoSize), la guarda en el almacén y registra sus metadatos. Devuelve su ruta."""
+    telegram_file = await photo.get_file()
+    data = bytes(await telegram_file.download_as_bytearray())
+    foto_path, sha256, size_bytes, mime_type, created = await asyncio.to_thread(store_bytes, data)
+    await run_db(
+        db_manager.register_photo, foto_path, sha256, size_bytes, mime_type, photo.file_id, photo.file_unique_id
+    )
+    if created:
+        image_pipeline.schedule(foto_path)
+    return foto_path
+
+# =============================================================================
+# NIVEL DE ARCHIVO (fotos antiguas comprimidas)
+# =============================================================================
+
+def archive_path_for(foto_path):
+    """
+    Ruta de la foto en el nivel de archivo: PHOTO_ARCHIVE_DIR/ab/cd/<sha><ext>.gz
+    (las fotos de las carpetas antiguas van a PHOTO_ARCHIVE_DIR/legacy/...).
+    """
+    path = Path(foto_path)
+    try:
+        relative = path.relative_to(PHOTOS_DIR)
+    except ValueError:
+        relative = Path("legacy") / path.relative_to(path.anchor)
+    return (PHOTO_ARCHIVE_DIR / relative).with_name(f"{path.name}.gz")
+
+def is_available(foto_path):
+    """True si la foto está en el almacén o en el nivel de archivo."""
+    return bool(foto_path) and (os.path.exists(foto_path) or archive_path_for(foto_path).exists())
+
+def archive_photo(foto_path):
+    """Comprime la foto al nivel de archivo y la borra del almacén. Devuelve el tamaño comprimido."""
+    source = Path(foto_path)
+    target = archive_path_for(foto_path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = _tmp_path(target)
+    try:
+        with open(source, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=9) as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, target)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    source.unlink(missing_ok=True)
+    return target.stat().st_size
+
+def restore_photo(foto_path):
+    """
+    Devuelve al almacén una foto archivada (descomprimida, escritura atómica).
+    Devuelve True si la foto queda en disco.
+    """
+    archived = archive_path_for(foto_path)
+    if not archived.exists():
+        return os.path.exists(foto_path)
+    target = Path(foto_path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = _tmp_path(target)
+    try:
+        with gzip.open(archived, 'rb') as src, open(tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, target)
+    except OSError as e:
+        tmp_path.unlink(missing_ok=True)
+        # Otra petición pudo restaurarla a la vez
+        if os.path.exists(foto_path):
+            return True
+        logger.warning(f"⚠️ No se pudo restaurar {foto_path} del archivo: {e}")
+        return False
+    archived.unlink(missing_ok=True)
+    _count("restored")
+    logger.info(f"📦 {foto_path} restaurada del archivo")
+    return True
+
+# =============================================================================
+# ENVÍO
+# =============================================================================
+
+async def _upload_path(foto_path):
+    """
+    Fichero a subir para la foto: su variante display o el original (restaurado
+    del archivo si hace falta). None si la foto no está en disco.
+    """
+    if not os.path.exists(foto_path) and not await asyncio.to_thread(restore_photo, foto_path):
+        return None
+    return await image_pipeline.ensure_variants(foto_path) or foto_path
+
+async def send_photo(bot, chat_id, foto_path, **kwargs):
+    """
+    Envía la foto por file_id o, si no se puede, subiendo desde disco su
+    variante display (o el original si no se pudo generar) y guardando el
+    file_id nuevo. Los kwargs van a bot.send_photo (caption...).
+    Devuelve el Message, o None si la foto no tiene file_id ni está en disco.
+    """
+    if not foto_path:
+        return None
+    file_id = await run_db(db_manager.get_photo_file_id, foto_path)
+    if file_id:
+        try:
+            message = await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+            _count("file_id_sends")
+            return message
+        except telegram.error.BadRequest as e:
+            # Solo los errores del file_id justifican subir el fichero (no los del caption)
+            if "file" not in str(e).lower():
+                raise
+            logger.info(f"♻️ file_id de {foto_path} rechazado por Telegram ({e}); se sube desde disco")
+            _count("stale_file_ids")
+
+    upload_path = await _upload_path(foto_path)
+    if upload_path is None:
+        return None
+    with open(upload_path, 'rb') as photo_file:
+        message = await bot.send_photo(chat_id=chat_id, photo=InputFile(photo_file), **kwargs)
+    _count("uploads")
+    _count("upload_bytes", os.path.getsize(upload_path))
+
+    largest = message.photo[-1]
+    await run_db(db_manager.remember_photo_file_id, foto_path, largest.file_id, largest.file_unique_id)
+    return message
+
+async def _send_media_group(bot, chat_id, paths, upload, **kwargs):
+    """
+    Envía un álbum. Con upload=False usa los file_id conocidos (sube solo las
+    fotos sin file_id); con upload=True sube todas desde disco.
+    Devuelve (mensajes, rutas enviadas, {ruta subida: bytes}).
+    """
+    photos, sent_paths, uploaded, files = [], [], {}, []
+    try:
+        for foto_path in paths:
+            file_id = None if upload else await run_db(db_manager.get_photo_file_id, foto_path)
+            if file_id:
+                photo = file_id
+            else:
+                upload_path = await _upload_path(foto_path)
+                if upload_path is None:
+                    continue
+                photo_file = open(upload_path, 'rb')
+                files.append(photo_file)
+                photo = InputFile(photo_file)
+                uploaded[foto_path] = os.path.getsize(upload_path)
+            photos.append(photo)
+            sent_paths.append(foto_path)
+        if not photos:
+            return [], [], {}
+        if len(photos) == 1:
+            # Telegram exige al menos 2 fotos por álbum
+            messages = [await bot.send_photo(chat_id=chat_id, photo=photos[0], **kwargs)]
+        else:
+            # El pie del álbum va en la primera foto
+            media = [InputMediaPhoto(photo, **(kwargs if i == 0 else {})) for i, photo in enumerate(photos)]
+            messages = await bot.send_media_group(chat_id=chat_id, media=media)
+    finally:
+        for photo_file in files:
+            photo_file.close()
+    return messages, sent_paths, uploaded
+
+async def send_photos(bot, chat_id, paths, **kwargs):
+    """
+    Envía varias fotos en álbumes de hasta MEDIA_GROUP_SIZE (una sola llamada
+    send_media_group por álbum), por file_id cuando se conoce. Si Telegram
+    rechaza algún file_id se reenvía el álbum subiendo desde disco. Los kwargs
+    (caption, parse_mode) se aplican a la primera foto. Una sola foto se envía
+    con send_photo. Devuelve la lista de mensajes enviados (vacía si ninguna).
+    """
+    paths = [path for path in (paths or []) if path]
+    if len(paths) <= 1:
+        message = paths and await send_photo(bot, chat_id, paths[0], **kwargs)
+        return [message] if message else []
+
+    sent = []
+    for start in range(0, len(paths), MEDIA_GROUP_SIZE):
+        chunk = paths[start:start + MEDIA_GROUP_SIZE]
+        chunk_kwargs = kwargs if start == 0 else {}
+        try:
+            messages, sent_paths, uploaded = await _send_media_group(bot, chat_id, chunk, False, **chunk_kwargs)
+        except telegram.error.BadRequest as e:
+            if "file" not in str(e).lower():
+                raise
+            logger.info(f"♻️ Algún file_id del álbum rechazado por Telegram ({e}); se sube desde disco")
+            _count("stale_file_ids")
+            messages, sent_paths, uploaded = await _send_media_group(bot, chat_id, chunk, True, **chunk_kwargs)
+        if not messages:
+            continue
+        if len(messages) > 1:
+            _count("media_groups")
+        _count("file_id_sends", len(sent_paths) - len(uploaded))
+        _count("uploads", len(uploaded))
+        _count("upload_bytes", sum(uploaded.values()))
+        # Telegram devuelve un mensaje por foto, en el mismo orden
+        for foto_path, message in zip(sent_paths, messages):
+            if foto_path in uploaded and message.photo:
+                largest = message.photo[-1]
+                await run_db(db_manager.remember_photo_file_id, foto_path, largest.file_id, largest.file_unique_id)
+        sent.extend(messages)
+    return sent
+
+def get_photo_stats():
+    """Fotos guardadas/deduplicadas y envíos por file_id frente a subidas desde disco, desde el arranque."""
+    with _lock:
+        return dict(_stats)
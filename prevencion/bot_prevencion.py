@@ -10,6 +10,7 @@ from telegram.ext import (
     filters,
 )
 import db_manager as db
+import photo_store
 from bot_navigation import end_and_return_to_menu
 from reporter import send_report, escape, format_user
 
@@ -154,24 +155,45 @@ async def get_descripcion(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return GET_FOTO
 
 async def get_foto(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Maneja tanto la recepción de una foto como la omisión de la misma."""
+    """
+    Maneja la recepción de una foto, de un álbum o la omisión de la foto.
+    Una foto suelta se guarda al momento; las de un álbum llegan como mensajes
+    sueltos con el mismo media_group_id, así que se acumulan y se responde solo
+    al primero con un botón para guardar la incidencia.
+    """
     query = update.callback_query
+    data = context.user_data['new_prev_inc']
     
     if query and query.data == 'skip_photo':
         await query.answer()
-        context.user_data['new_prev_inc']['foto_path'] = None
+        data['foto_path'] = None
+        data.pop('fotos', None)
         await query.edit_message_text("✅ Foto omitida. Guardando incidencia...")
         return await save_incidencia(update, context)
 
-    elif update.message and update.message.photo:
-        photo_file = await update.message.photo[-1].get_file()
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        os.makedirs('prevencion_fotos', exist_ok=True)
-        file_path = os.path.join('prevencion_fotos', f"prevencion_{update.effective_user.id}_{timestamp}.jpg")
-        await photo_file.download_to_drive(file_path)
-        context.user_data['new_prev_inc']['foto_path'] = file_path
-        await update.message.reply_text("✅ Foto recibida. Guardando incidencia...")
+    elif query and query.data == 'prev_save_fotos':
+        await query.answer()
+        await query.edit_message_text(f"✅ {len(data.get('fotos', []))} fotos recibidas. Guardando incidencia...")
         return await save_incidencia(update, context)
+
+    elif update.message and update.message.photo:
+        file_path = await photo_store.save_telegram_photo(update.message.photo[-1])
+        data.setdefault('fotos', []).append(file_path)
+        data['foto_path'] = data['fotos'][0]
+        media_group_id = update.message.media_group_id
+        if media_group_id is None:
+            await update.message.reply_text("✅ Foto recibida. Guardando incidencia...")
+            return await save_incidencia(update, context)
+        if media_group_id != data.get('album_id'):
+            data['album_id'] = media_group_id
+            await update.message.reply_text(
+                "📸 Recibiendo fotos. Pulsa 'Guardar incidencia' cuando se hayan enviado todas.",
+                reply_markup=InlineKeyboardMarkup([
+                    [InlineKeyboardButton("✅ Guardar incidencia", callback_data="prev_save_fotos")],
+                    [InlineKeyboardButton("❌ Cancelar", callback_data="cancel_conversation")]
+                ])
+            )
+        return GET_FOTO
         
     await update.message.reply_text("Por favor, envía una foto o pulsa el botón 'Omitir Foto'.")
     return GET_FOTO
@@ -185,7 +207,8 @@ async def save_incidencia(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         reporta_id=user.id,
         ubicacion=data['ubicacion'],
         descripcion=data['descripcion'],
-        foto_path=data.get('foto_path')
+        foto_path=data.get('foto_path'),
+        fotos=data.get('fotos')
     )
 
     message_source = update.callback_query.message if update.callback_query else update.message
@@ -202,8 +225,8 @@ async def save_incidencia(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         f"*Ubicación:* {escape(data['ubicacion'])}\n"
         f"*Descripción:* _{escape(data['descripcion'])}_"
     )
-    # Se envía la foto al grupo si existe
-    await send_report(context, report_text, photo_path=data.get('foto_path'))
+    # Se envían las fotos al grupo (en un solo álbum) si existen
+    await send_report(context, report_text, photo_paths=data.get('fotos'))
     
     context.user_data.clear()
     return ConversationHandler.END
@@ -437,7 +460,7 @@ def get_prevencion_handlers():
             GET_DESCRIPCION: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_descripcion)],
             GET_FOTO: [
                 MessageHandler(filters.PHOTO, get_foto),
-                CallbackQueryHandler(get_foto, pattern='^skip_photo$')
+                CallbackQueryHandler(get_foto, pattern='^(skip_photo|prev_save_fotos)$')
             ],
         },
         fallbacks=[CallbackQueryHandler(cancel, pattern='^cancel_conversation$')],
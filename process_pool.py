@@ -0,0 +1,165 @@
+"""
+Pool de procesos acotado, compartido por pdf_worker e image_pipeline.
+
+Ejecuta trabajo de CPU fuera del event loop con tres garantías:
+
+  - al pool solo se envían `workers` trabajos a la vez (uno por proceso); el
+    resto espera su turno en el event loop. La espera está acotada
+    (`max_pending` trabajos esperando): por encima se lanza `queue_full`;
+  - el límite de `timeout` segundos empieza a contar cuando el trabajo obtiene
+    su turno, no al encolarlo. Al superarlo se lanza `timed_out` y el pool se
+    recicla para no dejar un proceso ocupado indefinidamente;
+  - reciclar el pool mata todos sus procesos: ProcessPoolExecutor no permite
+    matar solo el del trabajo colgado (si muere un proceso, el pool entero
+    queda roto). Los demás trabajos en vuelo fallan entonces con
+    BrokenProcessPool; como no han hecho nada mal, se reenvían una vez al pool
+    nuevo y se cuentan como "requeued", no como errores. Un pool que se rompe
+    por otra causa (un proceso muerto por falta de memoria, p. ej.) cuenta como
+    error y también se recicla, para que los trabajos siguientes no fallen con él.
+
+    pool = BoundedProcessPool("renderizado PDF", workers=2, max_pending=8, timeout=120,
+                              queue_full=PDFQueueFull, timed_out=PDFRenderTimeout)
+    result = await pool.run(func, *args, label="'Informe'")
+"""
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedProcessPool:
+    """ProcessPoolExecutor con turnos, cola acotada, timeout por trabajo y reciclado."""
+
+    def __init__(self, name, workers, max_pending, timeout, queue_full, timed_out):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.queue_full = queue_full
+        self.timed_out = timed_out
+
+        self._executor = None
+        self._generation = 0  # aumenta cada vez que se recicla el pool
+        self._lock = threading.Lock()
+        self._pending = 0  # trabajos esperando turno
+        # Un turno por proceso: el timeout solo corre mientras el trabajo está en el pool
+        self._slots = asyncio.Semaphore(self.workers)
+        self._stats = {
+            "completed": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "rejected": 0,
+            "requeued": 0,
+            "wait_ms_total": 0.0,
+            "max_queue_depth": 0,
+        }
+
+    # --- Gestión interna ---
+
+    def _get_executor(self):
+        """Devuelve (pool, generación), creando el pool si hace falta."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                logger.info(f"⚙️ Pool de {self.name} iniciado con {self.workers} procesos")
+            return self._executor, self._generation
+
+    def _recycle(self, generation, reason):
+        """
+        Descarta el pool de esa generación matando sus procesos (un trabajo colgado no se
+        puede cancelar). Si ya se recicló, no hace nada: no se mata el pool nuevo.
+        Sin cancel_futures: los trabajos pendientes fallan con BrokenProcessPool y se reenvían.
+        """
+        with self._lock:
+            if generation != self._generation or self._executor is None:
+                return
+            executor, self._executor = self._executor, None
+            self._generation += 1
+        processes = list(getattr(executor, "_processes", {}).values())
+        executor.shutdown(wait=False)
+        for process in processes:
+            process.terminate()
+        logger.warning(f"♻️ Pool de {self.name} reciclado tras {reason}")
+
+    def _recycled_since(self, generation):
+        with self._lock:
+            return generation != self._generation
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    # --- API pública ---
+
+    async def run(self, func, *args, timeout=None, label=""):
+        """
+        Ejecuta func(*args) en un proceso del pool y devuelve su resultado.
+        Lanza queue_full si hay max_pending trabajos esperando turno y timed_out si,
+        una vez en el pool, tarda más de `timeout` segundos.
+        """
+        timeout = timeout or self.timeout
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise self.queue_full(f"{self._pending} trabajos en cola")
+            self._pending += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._pending)
+
+        submitted = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            with self._lock:
+                self._pending -= 1
+        wait_ms = (time.perf_counter() - submitted) * 1000
+
+        loop = asyncio.get_running_loop()
+        try:
+            for attempt in (1, 2):
+                executor, generation = self._get_executor()
+                future = loop.run_in_executor(executor, func, *args)
+                try:
+                    result = await asyncio.wait_for(future, timeout)
+                    break
+                except asyncio.TimeoutError:
+                    self._count("timeouts")
+                    self._recycle(generation, "un timeout")
+                    raise self.timed_out(f"{label} superó {timeout:.0f} s")
+                except BrokenProcessPool:
+                    if attempt == 1 and self._recycled_since(generation):
+                        # El pool se recicló por el timeout de otro trabajo: este no ha fallado
+                        self._count("requeued")
+                        logger.info(f"🔁 {label} reenviado al pool de {self.name} nuevo")
+                        continue
+                    self._count("errors")
+                    self._recycle(generation, "un proceso caído")
+                    raise
+                except Exception:
+                    self._count("errors")
+                    raise
+        finally:
+            self._slots.release()
+        with self._lock:
+            self._stats["completed"] += 1
+            self._stats["wait_ms_total"] += wait_ms
+        return result
+
+    def stats(self):
+        """Trabajos completados, errores, timeouts, rechazos, reenvíos y espera de turno."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = self._pending
+        completed = stats["completed"]
+        stats["wait_ms_avg"] = stats["wait_ms_total"] / completed if completed else 0.0
+        return stats
+
+    def shutdown(self):
+        """Detiene el pool esperando a los trabajos en curso."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,167 @@
+"""
+Caché en disco de los informes generados (CSV/PDF de avances).
+
+Los gerentes piden una y otra vez el mismo informe con los mismos filtros.
+Cada informe se guarda en REPORTS_DIR/cache con una clave que combina el tipo
+de informe, los filtros, el rango de fechas, el formato y la versión de los
+datos (db_manager.get_data_version), que cambia con cada escritura en avances
+o incidencias. Así un acierto nunca devuelve datos antiguos.
+
+Junto a cada fichero se guarda un .json con su nombre y, tras el primer envío,
+el file_id de Telegram: los aciertos se reenvían por file_id sin volver a
+subir el fichero. Cuando la carpeta supera REPORT_CACHE_MAX_BYTES se borran
+los informes usados hace más tiempo (LRU por fecha de modificación).
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_ENABLED = os.getenv("REPORT_CACHE_ENABLED", "true").lower() == "true"
+REPORT_CACHE_DIR = Path(os.getenv("REPORTS_DIR", "/app/data/reports")) / "cache"
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+_lock = threading.Lock()
+_ready = False
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _cache_dir():
+    """Crea la carpeta de la caché la primera vez; None si no se puede usar."""
+    global _ready
+    if not REPORT_CACHE_ENABLED:
+        return None
+    if not _ready:
+        try:
+            REPORT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"⚠️ Caché de informes desactivada: no se puede crear {REPORT_CACHE_DIR} ({e})")
+            return None
+        _ready = True
+    return REPORT_CACHE_DIR
+
+def report_key(report_type, filters, start_date, end_date, fmt, data_version):
+    """Clave estable de un informe (el orden de los filtros no importa)."""
+    raw = json.dumps(
+        [report_type, sorted((filters or {}).items()), start_date, end_date, fmt, data_version],
+        default=str, ensure_ascii=False
+    )
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+def _paths(key):
+    base = REPORT_CACHE_DIR / key
+    return base.with_suffix(".bin"), base.with_suffix(".json")
+
+
+# =============================================================================
+# LECTURA / ESCRITURA
+# =============================================================================
+
+def get(key):
+    """
+    Devuelve {'path', 'filename', 'file_id'} del informe cacheado o None.
+    Un acierto lo marca como usado recientemente.
+    """
+    if _cache_dir() is None:
+        return None
+    data_path, meta_path = _paths(key)
+    with _lock:
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            os.utime(data_path)
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            _stats["misses"] += 1
+            return None
+        _stats["hits"] += 1
+    return {"path": data_path, "filename": meta["filename"], "file_id": meta.get("file_id")}
+
+def put(key, content, filename):
+    """
+    Guarda un informe (bytes o fichero abierto en binario) y aplica el límite de tamaño.
+    Devuelve la ruta del fichero cacheado, o None si la caché no está disponible.
+    """
+    if _cache_dir() is None:
+        return None
+    data_path, meta_path = _paths(key)
+    # Temporal propio de cada escritor: dos trabajos pueden generar a la vez el mismo informe
+    tmp_path = data_path.with_name(f".{data_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            if isinstance(content, (bytes, bytearray)):
+                f.write(content)
+            else:
+                shutil.copyfileobj(content, f)
+        with _lock:
+            os.replace(tmp_path, data_path)
+            meta_path.write_text(json.dumps({"filename": filename}), encoding='utf-8')
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudo guardar el informe en caché: {e}")
+        tmp_path.unlink(missing_ok=True)
+        return None
+    _evict()
+    return data_path
+
+def remember_file_id(key, file_id):
+    """Anota el file_id de Telegram del informe para reenviarlo sin subirlo otra vez."""
+    if _cache_dir() is None or not file_id:
+        return
+    _, meta_path = _paths(key)
+    with _lock:
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            meta["file_id"] = file_id
+            meta_path.write_text(json.dumps(meta), encoding='utf-8')
+        except (OSError, ValueError):
+            pass
+
+def forget_file_id(key):
+    """Olvida un file_id que Telegram ya no acepta (se volverá a subir el fichero)."""
+    if _cache_dir() is None:
+        return
+    _, meta_path = _paths(key)
+    with _lock:
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            meta.pop("file_id", None)
+            meta_path.write_text(json.dumps(meta), encoding='utf-8')
+        except (OSError, ValueError):
+            pass
+
+
+# =============================================================================
+# EVICCIÓN LRU
+# =============================================================================
+
+def _evict():
+    """Borra los informes menos usados hasta quedar por debajo de REPORT_CACHE_MAX_BYTES."""
+    with _lock:
+        entries = []
+        total = 0
+        for data_path in REPORT_CACHE_DIR.glob("*.bin"):
+            try:
+                st = data_path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, data_path))
+            total += st.st_size
+        if total <= REPORT_CACHE_MAX_BYTES:
+            return
+        entries.sort()
+        for _, size, data_path in entries:
+            if total <= REPORT_CACHE_MAX_BYTES:
+                break
+            data_path.unlink(missing_ok=True)
+            data_path.with_suffix(".json").unlink(missing_ok=True)
+            total -= size
+            _stats["evictions"] += 1
+
+def get_cache_stats():
+    """Aciertos, fallos y evicciones desde el arranque."""
+    with _lock:
+        return dict(_stats)
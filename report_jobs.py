@@ -0,0 +1,241 @@
+"""
+Trabajos de informes en segundo plano.
+
+Generar un informe grande (consulta + CSV/PDF + subida a Telegram) puede tardar
+bastante; hacerlo dentro del handler deja al usuario esperando sin poder usar
+el bot. Con este módulo el handler encola el trabajo y vuelve al menú:
+
+    import report_jobs
+
+    async def work(job, context):
+        ...                                   # genera y envía el informe
+        job.update("1200 avances procesados")  # progreso (también desde hilos)
+        return "✅ Informe enviado."          # texto final del mensaje de estado
+
+    job = await report_jobs.submit(context, user_id, chat_id, "Avances (CSV)", work)
+
+El trabajo se lanza con el JobQueue de la aplicación. Un mensaje de estado
+(con botón de cancelar) se edita como mucho cada REPORT_PROGRESS_INTERVAL
+segundos. Como máximo se ejecutan REPORT_JOBS_WORKERS trabajos a la vez (el
+resto espera en cola) y cada usuario puede tener REPORT_JOBS_PER_USER
+trabajos pendientes; por encima se lanza TooManyJobs.
+
+El trabajo síncrono largo de un informe (leer la consulta en streaming y
+escribir el fichero) va por run_blocking(), que usa sus propios
+REPORT_JOBS_WORKERS hilos y no el executor de BD de db_async: un informe tiene
+ocupado su hilo durante toda la exportación y, en el executor compartido,
+dejaría sin hilos a los handlers interactivos. Cada uno de esos hilos tiene
+además una conexión del pool mientras exporta (ver POOL_SIZE en .env).
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import itertools
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import telegram.error
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+REPORT_JOBS_WORKERS = int(os.getenv("REPORT_JOBS_WORKERS", "3"))
+REPORT_JOBS_PER_USER = int(os.getenv("REPORT_JOBS_PER_USER", "2"))
+REPORT_PROGRESS_INTERVAL = float(os.getenv("REPORT_PROGRESS_INTERVAL", "3"))
+
+
+class TooManyJobs(Exception):
+    """El usuario ya tiene REPORT_JOBS_PER_USER informes pendientes."""
+
+
+class ReportCancelled(Exception):
+    """El usuario canceló el informe (se lanza desde ReportJob.update)."""
+
+
+class ReportJob:
+    """Estado de un informe encolado. update() y cancelled son seguros desde cualquier hilo."""
+
+    def __init__(self, job_id, user_id, chat_id, title):
+        self.id = job_id
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.title = title
+        self.status = "En cola"
+        self.progress = ""
+        self.created = time.time()
+        self.message_id = None
+        self.task = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def update(self, progress):
+        """Anota el progreso; si el informe se ha cancelado lanza ReportCancelled."""
+        if self._cancel_event.is_set():
+            raise ReportCancelled()
+        self.progress = progress
+
+    def cancel(self):
+        self._cancel_event.set()
+        self.status = "Cancelando"
+        if self.task is not None:
+            self.task.cancel()
+
+    def status_text(self):
+        text = f"⏳ Informe #{self.id} · {self.title}\nEstado: {self.status}"
+        if self.progress:
+            text += f" ({self.progress})"
+        return text
+
+
+_ids = itertools.count(1)
+_jobs = {}
+_lock = threading.Lock()
+_slots = None
+_executor = None
+_stats = {"completed": 0, "cancelled": 0, "failed": 0, "rejected": 0}
+
+
+# =============================================================================
+# API
+# =============================================================================
+
+async def submit(context, user_id, chat_id, title, work):
+    """
+    Encola work(job, context) y devuelve el ReportJob. Envía el mensaje de estado
+    y lanza TooManyJobs si el usuario ya tiene demasiados informes pendientes.
+    """
+    with _lock:
+        if sum(1 for job in _jobs.values() if job.user_id == user_id) >= REPORT_JOBS_PER_USER:
+            _stats["rejected"] += 1
+            raise TooManyJobs(f"{REPORT_JOBS_PER_USER} informes pendientes")
+        job = ReportJob(next(_ids), user_id, chat_id, title)
+        _jobs[job.id] = job
+
+    try:
+        message = await context.bot.send_message(
+            chat_id=chat_id, text=job.status_text(), reply_markup=_cancel_keyboard(job)
+        )
+        job.message_id = message.message_id
+    except telegram.error.TelegramError as e:
+        logger.warning(f"⚠️ No se pudo enviar el estado del informe #{job.id}: {e}")
+
+    context.job_queue.run_once(
+        _run, when=0, data=(job, work), name=f"informe_{job.id}", chat_id=chat_id, user_id=user_id
+    )
+    return job
+
+def list_jobs(user_id):
+    """Informes pendientes (en cola o en curso) del usuario, del más antiguo al más reciente."""
+    with _lock:
+        return sorted((job for job in _jobs.values() if job.user_id == user_id), key=lambda job: job.id)
+
+def cancel(job_id, user_id):
+    """Cancela un informe del usuario. Devuelve False si no existe o ya terminó."""
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is None or job.user_id != user_id:
+        return False
+    job.cancel()
+    return True
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Ejecuta una función síncrona larga de un informe (exportación en streaming)
+    en los hilos de informes, fuera del executor de BD de los handlers.
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=REPORT_JOBS_WORKERS, thread_name_prefix="report")
+    # Se propaga el contexto (contextvars) como hace db_async.run_db
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_executor, call)
+
+def get_job_stats():
+    """Informes en curso/en cola y totales desde el arranque."""
+    with _lock:
+        stats = dict(_stats)
+        stats["running"] = sum(1 for job in _jobs.values() if job.status != "En cola")
+        stats["queued"] = len(_jobs) - stats["running"]
+    return stats
+
+
+# =============================================================================
+# EJECUCIÓN (callback del JobQueue)
+# =============================================================================
+
+def _cancel_keyboard(job):
+    return InlineKeyboardMarkup([[InlineKeyboardButton("✖️ Cancelar", callback_data=f"report_job_cancel_{job.id}")]])
+
+async def _edit_status(context, job, text, keyboard=None):
+    if job.message_id is None:
+        return
+    try:
+        await context.bot.edit_message_text(
+            chat_id=job.chat_id, message_id=job.message_id, text=text, reply_markup=keyboard
+        )
+    except telegram.error.TelegramError as e:
+        if "Message is not modified" not in str(e):
+            logger.debug(f"No se pudo actualizar el estado del informe #{job.id}: {e}")
+
+async def _report_progress(context, job):
+    """Edita el mensaje de estado cuando cambia, como mucho cada REPORT_PROGRESS_INTERVAL s."""
+    shown = job.status_text()
+    while True:
+        await asyncio.sleep(REPORT_PROGRESS_INTERVAL)
+        text = job.status_text()
+        if text != shown:
+            await _edit_status(context, job, text, _cancel_keyboard(job))
+            shown = text
+
+async def _execute(context, job, work):
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(REPORT_JOBS_WORKERS)
+    async with _slots:
+        if job.cancelled:
+            raise ReportCancelled()
+        job.status = "En curso"
+        ticker = asyncio.create_task(_report_progress(context, job))
+        try:
+            return await work(job, context)
+        finally:
+            ticker.cancel()
+
+async def _run(context):
+    job, work = context.job.data
+    start = time.perf_counter()
+    job.task = asyncio.create_task(_execute(context, job, work))
+    try:
+        final_text = await job.task
+        outcome = "completed"
+        final_text = final_text or f"✅ Informe #{job.id} · {job.title} enviado."
+    except (asyncio.CancelledError, ReportCancelled):
+        outcome = "cancelled"
+        final_text = f"❌ Informe #{job.id} · {job.title} cancelado."
+    except Exception as e:
+        outcome = "failed"
+        final_text = f"❌ Ocurrió un error al generar el informe #{job.id} · {job.title}."
+        logger.error(f"❌ Error en el informe #{job.id} ({job.title}): {e}")
+    finally:
+        with _lock:
+            _jobs.pop(job.id, None)
+
+    with _lock:
+        _stats[outcome] += 1
+    logger.info(f"📄 Informe #{job.id} ({job.title}): {outcome} en {time.perf_counter() - start:.1f} s")
+    await _edit_status(context, job, final_text)
+
+def shutdown():
+    """Detiene los hilos de informes esperando a las exportaciones en curso."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
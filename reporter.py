@@ -4,31 +4,29 @@ import os
 from telegram import User, InputFile
 from telegram.ext import ContextTypes
 from telegram.helpers import escape_markdown
+import photo_store
 
 # -----------------------------------------------------------------------------
 # ID del grupo de Telegram donde se enviarán todos los reportes.
 # -----------------------------------------------------------------------------
 #GROUP_CHAT_ID = "-123456789"  # <--- Reemplaza si es necesario
 GROUP_CHAT_ID = os.getenv("GROUP_CHAT_ID")
-async def send_report(context: ContextTypes.DEFAULT_TYPE, text: str, photo_path: str = None):
+async def send_report(context: ContextTypes.DEFAULT_TYPE, text: str, photo_path: str = None, photo_paths: list = None):
     """
-    Envía un mensaje de reporte al chat de grupo, con una foto opcional.
+    Envía un mensaje de reporte al chat de grupo, con una foto opcional
+    (photo_path) o varias en un solo álbum (photo_paths).
     """
     if not GROUP_CHAT_ID or "AQUÍ_VA_LA_ID" in str(GROUP_CHAT_ID):
         print(f"ADVERTENCIA: GROUP_CHAT_ID no está configurado en reporter.py. Reporte no enviado:\n{text}")
         return
 
     try:
-        if photo_path and os.path.exists(photo_path):
-            # Si se proporciona una ruta de foto válida, se envía la foto con el texto como pie.
-            with open(photo_path, 'rb') as photo_file:
-                await context.bot.send_photo(
-                    chat_id=GROUP_CHAT_ID,
-                    photo=InputFile(photo_file),
-                    caption=text,
-                    parse_mode='MarkdownV2'
-                )
-        else:
+        # Si se proporcionan fotos, se envían (por file_id si es posible) con el texto como pie.
+        paths = photo_paths or ([photo_path] if photo_path else [])
+        sent = paths and await photo_store.send_photos(
+            context.bot, GROUP_CHAT_ID, paths, caption=text, parse_mode='MarkdownV2'
+        )
+        if not sent:
             # Si no hay foto, se envía solo el mensaje de texto.
             await context.bot.send_message(
                 chat_id=GROUP_CHAT_ID,
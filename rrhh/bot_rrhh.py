@@ -356,10 +356,9 @@ async def save_decision(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     user = update.effective_user
     user_role = db.get_user_role(user.id)
 
-    db.update_solicitud_status(solicitud_id, user.id, decision, notes, user_role)
+    details = db.update_solicitud_status(solicitud_id, user.id, decision, notes, user_role)
     await update.message.reply_text(f"✅ Decisión '{escape(decision)}' registrada para la solicitud \\#{solicitud_id}\\.", parse_mode='MarkdownV2', reply_markup=get_nav_keyboard())
     
-    details = db.get_solicitud_details(solicitud_id)
     if not details:
         context.user_data.clear()
         return ConversationHandler.END
@@ -492,11 +491,10 @@ async def update_search_status(update: Update, context: ContextTypes.DEFAULT_TYP
     solicitud_id = context.user_data['rrhh_solicitud_id']
     user = update.effective_user
     
-    db.update_solicitud_status(solicitud_id, user.id, nuevo_estado, f"Estado actualizado por RRHH a '{nuevo_estado}'", "RRHH")
+    details = db.update_solicitud_status(solicitud_id, user.id, nuevo_estado, f"Estado actualizado por RRHH a '{nuevo_estado}'", "RRHH")
     
     await query.edit_message_text(f"✅ Estado de la solicitud #{solicitud_id} actualizado a '{nuevo_estado}'.")
     
-    details = db.get_solicitud_details(solicitud_id)
     if details:
         # Notificar al solicitante original
         await context.bot.send_message(
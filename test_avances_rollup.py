@@ -0,0 +1,202 @@
+"""
+Script de prueba del rollup diario de avances (avances_diario).
+Comprueba que los resúmenes que salen del rollup cuentan lo mismo que un
+COUNT(*) sobre avances. Usa una base de datos SQLite temporal: no toca data/.
+"""
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+from datetime import date
+
+# Añadir el directorio del proyecto al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+TMP_DIR = Path(tempfile.mkdtemp(prefix="test_rollup_"))
+
+# Configuración antes de importar los módulos (la leen al importarse)
+os.environ['USE_SQLITE'] = 'true'
+
+import db_manager
+import db_migrations
+
+ADMIN_ID = 195947658
+TECNICO_ID = 111111111
+
+# (encargado, edificio, fecha_trabajo, estado); None = avance sin fecha
+AVANCES = [
+    (ADMIN_ID, "Edificio 1", date(2024, 3, 1), "Finalizado"),
+    (ADMIN_ID, "Edificio 1", date(2024, 3, 1), "Finalizado"),
+    (ADMIN_ID, "Edificio 1", date(2024, 3, 15), "Con Incidencia"),
+    (TECNICO_ID, "Edificio 1", date(2024, 4, 2), "Finalizado"),
+    (TECNICO_ID, "Edificio 2", date(2024, 3, 20), "Finalizado"),
+    (TECNICO_ID, "Edificio 2", date(2024, 5, 5), "Con Incidencia"),
+    (ADMIN_ID, "Edificio 2", None, "Finalizado"),
+    (TECNICO_ID, "Edificio 1", None, "Con Incidencia"),
+]
+
+# (descripción, argumentos de get_avances_summary, WHERE equivalente sobre avances, parámetros)
+CASOS = [
+    ("Sin filtros", {}, "", ()),
+    ("Edificio", {'filters': {'edificio': "Edificio 1"}}, "ubicacion_edificio = %s", ("Edificio 1",)),
+    ("Rango de fechas", {'start_date': date(2024, 3, 1), 'end_date': date(2024, 3, 31)},
+     "fecha_trabajo BETWEEN %s AND %s", (date(2024, 3, 1), date(2024, 3, 31))),
+    ("Solo fecha final", {'end_date': date(2024, 3, 31)}, "fecha_trabajo <= %s", (date(2024, 3, 31),)),
+    ("Estado", {'estados': ["Con Incidencia"]}, "estado = %s", ("Con Incidencia",)),
+    ("Edificio + fechas + estado",
+     {'filters': {'edificio': "Edificio 2"}, 'start_date': date(2024, 1, 1), 'end_date': date(2024, 12, 31),
+      'estados': ["Finalizado"]},
+     "ubicacion_edificio = %s AND fecha_trabajo BETWEEN %s AND %s AND estado = %s",
+     ("Edificio 2", date(2024, 1, 1), date(2024, 12, 31), "Finalizado")),
+    ("Encargado", {'user_id': TECNICO_ID}, "encargado_id = %s", (TECNICO_ID,)),
+]
+
+def create_test_database():
+    """Crea la base de datos temporal con init.sql (adaptado a SQLite) y las migraciones."""
+    db_path = TMP_DIR / 'test.db'
+    sql = (Path(__file__).parent / 'init.sql').read_text(encoding='utf-8')
+    sql = sql.replace('SERIAL PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT')
+    sql = sql.replace('BIGINT', 'INTEGER')
+    sql = sql.replace('TIMESTAMP WITH TIME ZONE', 'TIMESTAMP')
+    sql = sql.replace('DEFAULT NOW()', 'DEFAULT CURRENT_TIMESTAMP')
+    conn = sqlite3.connect(str(db_path))
+    for statement in (stmt.strip() for stmt in sql.split(';')):
+        if statement:
+            try:
+                conn.execute(statement)
+            except sqlite3.Error:
+                # DROP ... CASCADE y los datos iniciales no son SQLite válido; solo hacen falta las tablas
+                pass
+    conn.commit()
+    conn.close()
+    db_manager.SQLITE_PATH = str(db_path)
+    db_migrations.run_migrations()
+
+def count_avances(where, params):
+    """Total y conteo por estado con un COUNT(*) directo sobre avances."""
+    where_sql = f" WHERE {where}" if where else ""
+    total = db_manager.execute_query(f"SELECT COUNT(*) AS n FROM avances{where_sql}", params, fetch_one=True)['n']
+    rows = db_manager.execute_query(
+        f"SELECT estado, COUNT(*) AS n FROM avances{where_sql} GROUP BY estado", params, fetch_all=True
+    )
+    return total, {row['estado']: row['n'] for row in rows}
+
+def check_cases():
+    """Compara el resumen desde el rollup con el COUNT(*) en todos los casos. Devuelve los fallos."""
+    errores = []
+    for nombre, kwargs, where, params in CASOS:
+        summary = db_manager.get_avances_summary(latest_k=0, **kwargs)
+        total, por_estado = count_avances(where, params)
+        if summary['total'] != total or summary['por_estado'] != por_estado:
+            errores.append(f"{nombre}: rollup {summary['total']} {summary['por_estado']} != avances {total} {por_estado}")
+    return errores
+
+def test_create_avance_updates_rollup():
+    """Cada create_avance suma su avance al rollup en la misma transacción."""
+    print("\n📊 Probando el rollup tras create_avance...")
+
+    try:
+        for encargado, edificio, fecha, estado in AVANCES:
+            db_manager.create_avance(
+                encargado, f"{edificio} / Zona 1 / Planta 1 / Núcleo 1", "Trabajo de prueba", None, estado, fecha
+            )
+        errores = check_cases()
+        assert not errores, "; ".join(errores)
+        print(f"✅ {len(CASOS)} resúmenes coinciden con COUNT(*) sobre avances")
+        return True
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return False
+
+def test_rebuild_rollup():
+    """rebuild_avances_rollup reconstruye exactamente el mismo rollup."""
+    print("\n🔄 Probando la reconstrucción del rollup...")
+
+    try:
+        db_manager.execute_query("DELETE FROM avances_diario")
+        vacio = db_manager.get_avances_summary(latest_k=0)
+        assert vacio['total'] == 0, "el resumen no sale del rollup"
+
+        filas = db_manager.rebuild_avances_rollup()
+        assert filas > 0, "la reconstrucción no generó filas"
+        errores = check_cases()
+        assert not errores, "; ".join(errores)
+        print(f"✅ Rollup reconstruido ({filas} filas) y coincidente")
+        return True
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return False
+
+def test_avances_sin_fecha():
+    """Los avances sin fecha_trabajo cuentan en el total, pero nunca en un rango de fechas."""
+    print("\n📅 Probando los avances sin fecha...")
+
+    try:
+        sin_fecha = sum(1 for *_, fecha, _ in AVANCES if fecha is None)
+        total = db_manager.get_avances_summary(latest_k=0)['total']
+        assert total == len(AVANCES), f"total {total}, se esperaban {len(AVANCES)}"
+
+        hasta = db_manager.get_avances_summary(end_date=date(2099, 1, 1), latest_k=0)['total']
+        assert hasta == len(AVANCES) - sin_fecha, f"con fecha final se contaron {hasta} avances"
+
+        directo = db_manager.get_avances_summary(end_date=date(2099, 1, 1), latest_k=0, use_rollup=False)['total']
+        assert hasta == directo, f"rollup {hasta} != avances {directo} con fecha final"
+        print(f"✅ {sin_fecha} avances sin fecha: fuera de los rangos, dentro del total")
+        return True
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return False
+
+def run_all_tests():
+    """Ejecuta todas las pruebas"""
+    print("🚀 INICIANDO PRUEBAS DEL ROLLUP DE AVANCES")
+    print("=" * 50)
+    print(f"📁 Directorio temporal: {TMP_DIR}")
+
+    create_test_database()
+    for user_id, nombre, role in ((ADMIN_ID, 'Admin', 'Admin'), (TECNICO_ID, 'Técnico', 'Tecnico')):
+        db_manager.execute_query(
+            "INSERT INTO usuarios (user_id, first_name, role) VALUES (%s, %s, %s)", (user_id, nombre, role)
+        )
+
+    tests = [
+        ("Rollup tras create_avance", test_create_avance_updates_rollup),
+        ("Reconstrucción del rollup", test_rebuild_rollup),
+        ("Avances sin fecha", test_avances_sin_fecha)
+    ]
+
+    passed = 0
+    failed = 0
+
+    for test_name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"❌ Error inesperado en {test_name}: {e}")
+            failed += 1
+
+    print("\n" + "=" * 50)
+    print("📊 RESULTADOS DE LAS PRUEBAS")
+    print(f"✅ Pasaron: {passed}")
+    print(f"❌ Fallaron: {failed}")
+    print(f"📋 Total: {len(tests)}")
+
+    if failed == 0:
+        print("\n🎉 ¡TODAS LAS PRUEBAS PASARON EXITOSAMENTE!")
+        return True
+    else:
+        print(f"\n⚠️  Algunas pruebas fallaron. Revisar los errores arriba.")
+        return False
+
+if __name__ == "__main__":
+    try:
+        success = run_all_tests()
+    finally:
+        db_manager.close_all_connections()
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+    sys.exit(0 if success else 1)
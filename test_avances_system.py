@@ -31,10 +31,7 @@ def test_tipos_trabajo():
         print(f"✅ Tipos de trabajo obtenidos: {len(tipos)}")
         
         for tipo in tipos[:3]:  # Mostrar solo los primeros 3
-            if db_adapter.USE_SQLITE:
-                print(f"   - {tipo['emoji']} {tipo['nombre']}")
-            else:
-                print(f"   - {tipo[1]} {tipo[2]}")  # emoji, nombre
+            print(f"   - {tipo['emoji']} {tipo['nombre']}")
         
         return True
     except Exception as e:
@@ -46,26 +43,14 @@ def test_ubicaciones():
     print("\n📍 Probando ubicaciones...")
     
     try:
-        # Obtener jerarquía completa
+        # Obtener jerarquía completa (agrupada por tipo)
         jerarquia = db_adapter.get_jerarquia_ubicaciones()
-        print(f"✅ Ubicaciones obtenidas: {len(jerarquia)}")
+        total = sum(len(opciones) for opciones in jerarquia.values())
+        print(f"✅ Ubicaciones obtenidas: {total}")
         
-        # Agrupar por tipo
-        tipos = {}
-        for ub in jerarquia:
-            if db_adapter.USE_SQLITE:
-                tipo = ub['tipo']
-                nombre = ub['nombre']
-            else:
-                tipo = ub[0]
-                nombre = ub[1]
-            
-            if tipo not in tipos:
-                tipos[tipo] = []
-            tipos[tipo].append(nombre)
-        
-        for tipo, nombres in tipos.items():
-            print(f"   {tipo}: {len(nombres)} opciones")
+        for tipo, opciones in jerarquia.items():
+            assert all('id' in op and 'nombre' in op for op in opciones)
+            print(f"   {tipo}: {len(opciones)} opciones")
         
         return True
     except Exception as e:
@@ -108,16 +93,10 @@ def test_avances_query():
         print(f"✅ Avances obtenidos: {len(avances)}")
         
         for avance in avances:
-            if db_adapter.USE_SQLITE:
-                fecha = avance['fecha_trabajo'] or avance['fecha_registro'][:10]
-                trabajo = avance['trabajo']
-                tipo = avance['tipo_trabajo_nombre'] or 'Sin tipo'
-                emoji = avance['emoji'] or '📝'
-            else:
-                fecha = str(avance[13] or avance[11])[:10]  # fecha_trabajo o fecha_registro
-                trabajo = avance[6]
-                tipo = avance[-2] or 'Sin tipo'
-                emoji = avance[-1] or '📝'
+            fecha = avance['fecha']
+            trabajo = avance['trabajo']
+            tipo = avance['tipo_trabajo'] or 'Sin tipo'
+            emoji = avance['tipo_trabajo_emoji'] or '📝'
             
             print(f"   {emoji} {fecha}: {trabajo} ({tipo})")
         
@@ -0,0 +1,181 @@
+"""
+Script de prueba del compilador de dialectos (db_dialect).
+Comprueba cada reescritura PostgreSQL -> SQLite y ejecuta las sentencias
+traducidas contra una base de datos SQLite en memoria.
+"""
+import sys
+import json
+import sqlite3
+from pathlib import Path
+
+# Añadir el directorio del proyecto al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import db_dialect
+from db_dialect import POSTGRES, SQLITE, compile_statement
+
+# (regla, sentencia PostgreSQL, sentencia SQLite esperada)
+REWRITES = [
+    ("= ANY(%s)", "SELECT id FROM t WHERE estado = ANY(%s)",
+     "SELECT id FROM t WHERE estado IN (SELECT value FROM json_each(?))"),
+    ("IN %s", "SELECT id FROM t WHERE id NOT IN %s",
+     "SELECT id FROM t WHERE id NOT IN (SELECT value FROM json_each(?))"),
+    ("NOW()", "UPDATE t SET fecha = NOW() WHERE id = %s",
+     "UPDATE t SET fecha = CURRENT_TIMESTAMP WHERE id = ?"),
+    ("CURRENT_DATE", "SELECT id FROM t WHERE fecha = CURRENT_DATE",
+     "SELECT id FROM t WHERE fecha = date('now', 'localtime')"),
+    ("STRING_AGG", "SELECT STRING_AGG(nombre, ', ') FROM t",
+     "SELECT GROUP_CONCAT(nombre, ', ') FROM t"),
+    ("json_agg", "SELECT json_agg(nombre) FROM t",
+     "SELECT json_group_array(nombre) FROM t"),
+    ("json_build_object", "SELECT json_build_object('id', id) FROM t",
+     "SELECT json_object('id', id) FROM t"),
+    ("ILIKE", "SELECT id FROM t WHERE nombre ILIKE %s",
+     "SELECT id FROM t WHERE nombre LIKE ?"),
+    ("::tipo", "SELECT COALESCE(json_agg(nombre), '[]'::json), id::text FROM t",
+     "SELECT COALESCE(json_group_array(nombre), '[]'), id FROM t"),
+    ("%s", "INSERT INTO t (id, nombre) VALUES (%s, %s)",
+     "INSERT INTO t (id, nombre) VALUES (?, ?)"),
+    ("%%", "SELECT id %% 2 FROM t WHERE id = %s",
+     "SELECT id % 2 FROM t WHERE id = ?"),
+]
+
+def test_rewrite_rules():
+    """Cada regla de reescritura produce la sentencia SQLite esperada."""
+    print("\n🔁 Probando las reglas de reescritura...")
+
+    try:
+        for rule, source, expected in REWRITES:
+            sql = compile_statement(source, SQLITE).sql
+            assert sql == expected, f"{rule}: {sql!r} != {expected!r}"
+        print(f"✅ {len(REWRITES)} reglas traducidas correctamente")
+        return True
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return False
+
+def test_literals_untouched():
+    """Lo que va entre comillas simples no se traduce nunca."""
+    print("\n🔒 Probando que los literales no se tocan...")
+
+    try:
+        source = "SELECT 'NOW() = ANY(%s) ILIKE x::int' AS texto, NOW() FROM t WHERE id = %s"
+        sql = compile_statement(source, SQLITE).sql
+        assert sql == "SELECT 'NOW() = ANY(%s) ILIKE x::int' AS texto, CURRENT_TIMESTAMP FROM t WHERE id = ?", sql
+        print("✅ Literales intactos")
+        return True
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return False
+
+def test_param_adapters():
+    """Las listas de ANY / IN pasan a array JSON; el resto de parámetros no cambia."""
+    print("\n🧩 Probando la adaptación de parámetros...")
+
+    try:
+        compiled = compile_statement("SELECT id FROM t WHERE id = %s AND estado = ANY(%s)", SQLITE)
+        params = compiled.adapt((7, ['Finalizado', 'Con Incidencia']))
+        assert params == (7, json.dumps(['Finalizado', 'Con Incidencia'])), params
+
+        plain = compile_statement("SELECT id FROM t WHERE id = %s", SQLITE)
+        assert plain.adapters == (), "una sentencia sin listas no necesita adaptadores"
+        assert plain.adapt((7,)) == (7,)
+
+        postgres = compile_statement("SELECT id FROM t WHERE estado = ANY(%s)", POSTGRES)
+        assert postgres.sql == "SELECT id FROM t WHERE estado = ANY(%s)", "PostgreSQL no debe traducirse"
+        assert postgres.adapt((['a'],)) == (['a'],), "en PostgreSQL la lista va tal cual"
+
+        assert compile_statement("SELECT 1", SQLITE) is compile_statement("SELECT 1", SQLITE), "sin caché"
+        print("✅ Parámetros adaptados y sentencias cacheadas")
+        return True
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return False
+
+def run_sqlite(conn, source, params=()):
+    compiled = compile_statement(source, SQLITE)
+    return conn.execute(compiled.sql, compiled.adapt(params) or ()).fetchall()
+
+def test_sqlite_execution():
+    """Las sentencias traducidas se ejecutan en SQLite y devuelven lo mismo que en PostgreSQL."""
+    print("\n🗄️ Probando la ejecución en SQLite...")
+
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, nombre TEXT, estado TEXT, fecha TIMESTAMP)")
+        run_sqlite(conn, "INSERT INTO t (id, nombre, estado, fecha) VALUES (%s, %s, %s, NOW())", (1, 'Ana', 'Finalizado'))
+        run_sqlite(conn, "INSERT INTO t (id, nombre, estado, fecha) VALUES (%s, %s, %s, NOW())", (2, 'Luis', 'Con Incidencia'))
+        run_sqlite(conn, "INSERT INTO t (id, nombre, estado, fecha) VALUES (%s, %s, %s, NOW())", (3, 'Alba', 'Pendiente'))
+
+        rows = run_sqlite(conn, "SELECT id FROM t WHERE estado = ANY(%s) ORDER BY id", (['Finalizado', 'Pendiente'],))
+        assert rows == [(1,), (3,)], f"= ANY: {rows}"
+
+        rows = run_sqlite(conn, "SELECT id FROM t WHERE id NOT IN %s ORDER BY id", ((1, 2),))
+        assert rows == [(3,)], f"NOT IN: {rows}"
+
+        rows = run_sqlite(conn, "SELECT STRING_AGG(nombre, ', ') FROM (SELECT nombre FROM t ORDER BY id) s")
+        assert rows == [('Ana, Luis, Alba',)], f"STRING_AGG: {rows}"
+
+        rows = run_sqlite(conn, "SELECT id FROM t WHERE nombre ILIKE %s ORDER BY id", ('a%',))
+        assert rows == [(1,), (3,)], f"ILIKE: {rows}"
+
+        rows = run_sqlite(conn, "SELECT id FROM t WHERE id %% 2 = %s ORDER BY id", (1,))
+        assert rows == [(1,), (3,)], f"%%: {rows}"
+
+        (data,), = run_sqlite(conn, """
+            SELECT COALESCE(json_agg(json_build_object('id', s.id, 'nombre', s.nombre)), '[]'::json)
+            FROM (SELECT id, nombre FROM t WHERE id::int > %s ORDER BY id) s
+        """, (1,))
+        assert json.loads(data) == [{'id': 2, 'nombre': 'Luis'}, {'id': 3, 'nombre': 'Alba'}], f"json_agg: {data}"
+
+        rows = run_sqlite(conn, "SELECT COUNT(*) FROM t WHERE date(fecha, 'localtime') = CURRENT_DATE")
+        assert rows == [(3,)], f"NOW() / CURRENT_DATE: {rows}"
+        print("✅ Sentencias traducidas ejecutadas correctamente")
+        return True
+    except (AssertionError, sqlite3.Error) as e:
+        print(f"❌ {e}")
+        return False
+    finally:
+        conn.close()
+
+def run_all_tests():
+    """Ejecuta todas las pruebas"""
+    print("🚀 INICIANDO PRUEBAS DEL COMPILADOR DE DIALECTOS")
+    print("=" * 50)
+
+    tests = [
+        ("Reglas de reescritura", test_rewrite_rules),
+        ("Literales", test_literals_untouched),
+        ("Parámetros", test_param_adapters),
+        ("Ejecución en SQLite", test_sqlite_execution)
+    ]
+
+    passed = 0
+    failed = 0
+
+    for test_name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"❌ Error inesperado en {test_name}: {e}")
+            failed += 1
+
+    print("\n" + "=" * 50)
+    print("📊 RESULTADOS DE LAS PRUEBAS")
+    print(f"✅ Pasaron: {passed}")
+    print(f"❌ Fallaron: {failed}")
+    print(f"📋 Total: {len(tests)}")
+    print(f"🗃️ Caché de sentencias: {db_dialect.statement_cache_info()}")
+
+    if failed == 0:
+        print("\n🎉 ¡TODAS LAS PRUEBAS PASARON EXITOSAMENTE!")
+        return True
+    else:
+        print(f"\n⚠️  Algunas pruebas fallaron. Revisar los errores arriba.")
+        return False
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
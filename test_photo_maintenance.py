@@ -0,0 +1,191 @@
+"""
+Script de prueba del mantenimiento de fotos (photo_maintenance).
+Usa un almacén de fotos, un archivo y una base de datos SQLite temporales:
+no toca data/ ni la base de datos real.
+"""
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+
+# Añadir el directorio del proyecto al path
+sys.path.insert(0, str(Path(__file__).parent))
+
+TMP_DIR = Path(tempfile.mkdtemp(prefix="test_fotos_"))
+
+# Configuración antes de importar los módulos (la leen al importarse)
+os.environ['USE_SQLITE'] = 'true'
+os.environ['PHOTOS_DIR'] = str(TMP_DIR / 'photos')
+os.environ['PHOTO_ARCHIVE_DIR'] = str(TMP_DIR / 'archive')
+os.environ['PHOTO_GC_GRACE_HOURS'] = '24'
+os.environ['PHOTO_ARCHIVE_DAYS'] = '30'
+os.environ['PHOTO_GC_SHARDS_PER_TICK'] = '1000'  # Una sola pasada recorre todo el almacén
+
+import db_manager
+import db_migrations
+import image_pipeline
+import photo_store
+import photo_maintenance
+
+DAY = 86400
+ADMIN_ID = 195947658
+
+def create_test_database():
+    """Crea la base de datos temporal con init.sql (adaptado a SQLite) y las migraciones."""
+    db_path = TMP_DIR / 'test.db'
+    sql = (Path(__file__).parent / 'init.sql').read_text(encoding='utf-8')
+    sql = sql.replace('SERIAL PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT')
+    sql = sql.replace('BIGINT', 'INTEGER')
+    sql = sql.replace('TIMESTAMP WITH TIME ZONE', 'TIMESTAMP')
+    sql = sql.replace('DEFAULT NOW()', 'DEFAULT CURRENT_TIMESTAMP')
+    conn = sqlite3.connect(str(db_path))
+    for statement in (stmt.strip() for stmt in sql.split(';')):
+        if statement:
+            try:
+                conn.execute(statement)
+            except sqlite3.Error:
+                # DROP ... CASCADE y los datos iniciales no son SQLite válido; solo hacen falta las tablas
+                pass
+    conn.commit()
+    conn.close()
+    db_manager.SQLITE_PATH = str(db_path)
+    db_migrations.run_migrations()
+
+def store_photo(content, age_days):
+    """Guarda una foto en el almacén temporal con la antigüedad indicada. Devuelve su ruta."""
+    foto_path, *_ = photo_store.store_bytes(b"\xff\xd8\xff" + content)
+    mtime = time.time() - age_days * DAY
+    os.utime(foto_path, (mtime, mtime))
+    return foto_path
+
+def add_variant(foto_path):
+    """Simula la variante display que genera image_pipeline."""
+    variant = image_pipeline.variant_path(foto_path, 'display')
+    variant.write_bytes(b"variante")
+    return variant
+
+def reference(foto_path):
+    """Hace que una fila de la base de datos use la foto."""
+    return db_manager.create_orden(ADMIN_ID, "Orden de prueba", foto_path)
+
+def test_referenced_photos_survive():
+    """Las fotos usadas nunca se borran: las recientes se quedan y las antiguas pasan al archivo."""
+    print("\n📸 Probando que las fotos referenciadas se conservan...")
+
+    try:
+        recent = store_photo(b"reciente" * 500, age_days=2)
+        old = store_photo(b"antigua" * 500, age_days=90)
+        reference(recent)
+        reference(old)
+        old_variant = add_variant(old)
+
+        result = photo_maintenance.run_tick()
+
+        assert os.path.exists(recent), "la foto reciente referenciada desapareció"
+        assert not os.path.exists(old), "la foto antigua debía pasar al archivo"
+        assert photo_store.archive_path_for(old).exists(), "la foto antigua no está en el archivo"
+        assert photo_store.is_available(old), "la foto archivada debe seguir disponible"
+        assert not old_variant.exists(), "la variante de la foto archivada debía borrarse"
+        assert result['orphans'] == 0, f"se borraron {result['orphans']} fotos referenciadas"
+        print(f"✅ Referenciadas conservadas ({result['archived']} archivadas)")
+        return True
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return False
+
+def test_grace_period():
+    """Una foto sin referencias solo se borra pasado el periodo de gracia."""
+    print("\n⏳ Probando el periodo de gracia de las fotos huérfanas...")
+
+    try:
+        fresh = store_photo(b"en curso" * 500, age_days=0)
+        orphan = store_photo(b"huerfana" * 500, age_days=2)
+        orphan_variant = add_variant(orphan)
+
+        result = photo_maintenance.run_tick()
+
+        assert os.path.exists(fresh), "la foto dentro del periodo de gracia se borró"
+        assert not os.path.exists(orphan), "la foto huérfana antigua no se borró"
+        assert not orphan_variant.exists(), "la variante de la foto huérfana no se borró"
+        assert result['orphans'] == 1, f"se esperaba 1 huérfana y se borraron {result['orphans']}"
+        assert result['orphan_bytes'] > 0, "no se contaron los bytes de la foto huérfana"
+        print(f"✅ Periodo de gracia respetado ({result['orphan_bytes']} bytes liberados)")
+        return True
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return False
+
+def test_archive_restore_roundtrip():
+    """archive_photo + restore_photo devuelven exactamente el mismo fichero."""
+    print("\n📦 Probando archivo y restauración de una foto...")
+
+    try:
+        content = b"\xff\xd8\xff" + os.urandom(4096)
+        foto_path, *_ = photo_store.store_bytes(content)
+
+        photo_store.archive_photo(foto_path)
+        assert not os.path.exists(foto_path), "el original sigue en el almacén tras archivarlo"
+        assert photo_store.archive_path_for(foto_path).exists(), "no se creó la copia archivada"
+
+        assert photo_store.restore_photo(foto_path), "restore_photo no restauró la foto"
+        assert Path(foto_path).read_bytes() == content, "la foto restaurada no es idéntica al original"
+        assert not photo_store.archive_path_for(foto_path).exists(), "la copia archivada no se borró al restaurar"
+        print("✅ Archivo y restauración idénticos")
+        return True
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return False
+
+def run_all_tests():
+    """Ejecuta todas las pruebas"""
+    print("🚀 INICIANDO PRUEBAS DEL MANTENIMIENTO DE FOTOS")
+    print("=" * 50)
+    print(f"📁 Directorio temporal: {TMP_DIR}")
+
+    create_test_database()
+    db_manager.execute_query(
+        "INSERT INTO usuarios (user_id, first_name, role) VALUES (%s, %s, %s)", (ADMIN_ID, 'Admin', 'Admin')
+    )
+
+    tests = [
+        ("Fotos referenciadas", test_referenced_photos_survive),
+        ("Periodo de gracia", test_grace_period),
+        ("Archivo y restauración", test_archive_restore_roundtrip)
+    ]
+
+    passed = 0
+    failed = 0
+
+    for test_name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"❌ Error inesperado en {test_name}: {e}")
+            failed += 1
+
+    print("\n" + "=" * 50)
+    print("📊 RESULTADOS DE LAS PRUEBAS")
+    print(f"✅ Pasaron: {passed}")
+    print(f"❌ Fallaron: {failed}")
+    print(f"📋 Total: {len(tests)}")
+
+    if failed == 0:
+        print("\n🎉 ¡TODAS LAS PRUEBAS PASARON EXITOSAMENTE!")
+        return True
+    else:
+        print(f"\n⚠️  Algunas pruebas fallaron. Revisar los errores arriba.")
+        return False
+
+if __name__ == "__main__":
+    try:
+        success = run_all_tests()
+    finally:
+        db_manager.close_all_connections()
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+    sys.exit(0 if success else 1)